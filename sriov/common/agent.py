@@ -0,0 +1,126 @@
+import codecs
+import json
+import os
+import select
+import threading
+import time
+
+
+AGENT_SCRIPT = os.path.join(os.path.dirname(__file__), "sriov_agent.py")
+AGENT_REMOTE_PATH = "/tmp/sriov_agent.py"
+# the platform python is the only python3 of a minimal RHEL 8 install
+AGENT_CMD = (
+    "exec $(command -v python3 || echo /usr/libexec/platform-python) -u "
+    + AGENT_REMOTE_PATH
+)
+
+
+class AgentError(Exception):
+    """The agent is not available, the caller should use shell commands"""
+
+
+class RemoteAgent:
+    def __init__(self, ssh_obj, timeout: float = 10) -> None:
+        """Upload sriov_agent.py to the host of ssh_obj and start it on a
+           dedicated channel of the session
+
+        Args:
+            self:            self
+            ssh_obj:         the ShellHandler of the host
+            timeout (float): timeout to start the agent (default 10)
+
+        Raises:
+            AgentError: the agent could not be started
+        """
+        self.name = ssh_obj.name
+        self.lock = threading.Lock()
+        self.request_id = 0
+        self.buffer = ""
+        self.decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self.channel = None
+        try:
+            ssh_obj.put_file(AGENT_SCRIPT, AGENT_REMOTE_PATH)
+            self.channel = ssh_obj._open_exec_channel(AGENT_CMD, timeout)
+            self.call("ping", timeout=timeout)
+        except Exception as err:
+            self.close()
+            raise AgentError(f"failed to start the agent: {err}") from err
+
+    def close(self) -> None:
+        """Stop the agent
+
+        Args:
+            self: self
+        """
+        if self.channel is not None:
+            self.channel.close()
+            self.channel = None
+
+    def _readline(self, deadline: float) -> str:
+        """Read the next response line of the agent
+
+        Args:
+            self:             self
+            deadline (float): time.monotonic() value to give up at
+
+        Returns:
+            str: the response line
+
+        Raises:
+            AgentError: timeout, or the agent exited
+        """
+        while "\n" not in self.buffer:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise AgentError("timeout")
+            if self.channel.recv_ready():
+                data = self.channel.recv(65536)
+                if not data:
+                    raise AgentError("the agent exited")
+                self.buffer += self.decoder.decode(data)
+            elif self.channel.exit_status_ready():
+                stderr = b""
+                while self.channel.recv_stderr_ready():
+                    stderr += self.channel.recv_stderr(65536)
+                raise AgentError(
+                    "the agent exited: " + stderr.decode(errors="replace").strip()
+                )
+            else:
+                select.select([self.channel], [], [], min(remaining, 0.1))
+        line, self.buffer = self.buffer.split("\n", 1)
+        return line
+
+    def call(self, method: str, timeout: float = 5, **params):
+        """Send a request to the agent and wait for its response
+
+        Args:
+            self:            self
+            method (str):    name of the agent method, see sriov_agent.py
+            timeout (float): timeout for the response (default 5)
+            params:          arguments of the method
+
+        Returns:
+            the result of the method
+
+        Raises:
+            AgentError: the agent is not available; it is closed, and the
+                        following calls fail right away
+            Exception:  the request failed on the host
+        """
+        with self.lock:
+            if self.channel is None:
+                raise AgentError("the agent is closed")
+            self.request_id += 1
+            request = {"id": self.request_id, "method": method, "params": params}
+            try:
+                self.channel.sendall((json.dumps(request) + "\n").encode())
+                deadline = time.monotonic() + timeout
+                response = json.loads(self._readline(deadline))
+            except Exception as err:
+                self.close()
+                if isinstance(err, AgentError):
+                    raise
+                raise AgentError(str(err)) from err
+        if "error" in response:
+            raise Exception(response["error"])
+        return response["result"]
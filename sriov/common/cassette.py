@@ -0,0 +1,404 @@
+import collections
+import gzip
+import json
+import os
+import re
+import threading
+import time
+from typing import Tuple
+from sriov.common.exec import CommandStream, ShellHandler, timed
+
+
+# commands run outside of a test, e.g. by pytest_configure
+SESSION = "session"
+
+
+class CassetteError(Exception):
+    """The cassette has no recorded response for a command"""
+
+
+def cassette_path(directory: str, test: str) -> str:
+    """Get the path of the cassette of a test
+
+    Args:
+        directory (str): directory of the cassettes
+        test (str):      pytest node id, or SESSION
+
+    Returns:
+        str: path of the cassette file
+    """
+    return os.path.join(directory, re.sub(r"[^\w.-]+", "_", test) + ".json.gz")
+
+
+class CassetteRecorder:
+    def __init__(self, directory: str) -> None:
+        """Init the recorder writing a cassette per test to directory
+
+        Args:
+            self:            self
+            directory (str): directory of the cassettes
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.test = SESSION
+        # test -> recorded calls
+        self.entries = {SESSION: []}
+        self.lock = threading.Lock()
+
+    def start_test(self, test: str) -> None:
+        """Record the following calls in the cassette of test
+
+        Args:
+            self:       self
+            test (str): pytest node id
+        """
+        with self.lock:
+            self.test = test
+            self.entries[test] = []
+
+    def finish_test(self) -> None:
+        """Write the cassette of the current test
+
+        Args:
+            self: self
+        """
+        with self.lock:
+            test, self.test = self.test, SESSION
+            entries = self.entries.pop(test)
+        self._write(test, entries)
+
+    def close(self) -> None:
+        """Write the cassette of the calls run outside of the tests
+
+        Args:
+            self: self
+        """
+        with self.lock:
+            entries = self.entries.pop(SESSION, [])
+        self._write(SESSION, entries)
+
+    def _write(self, test: str, entries: list) -> None:
+        """Write a cassette
+
+        Args:
+            self:          self
+            test (str):    pytest node id, or SESSION
+            entries (list): recorded calls
+        """
+        with gzip.open(cassette_path(self.directory, test), "wt") as f:
+            json.dump({"test": test, "entries": entries}, f, separators=(",", ":"))
+
+    def record(
+        self, handler: ShellHandler, kind: str, cmd, result, duration: float
+    ) -> None:
+        """Record a call of a ShellHandler
+
+        Args:
+            self:             self
+            handler:          the ShellHandler
+            kind (str):       name of the ShellHandler method
+            cmd:              the command, or the list of commands of a batch
+            result:           the value returned by the call
+            duration (float): seconds the call took
+        """
+        entry = {
+            "name": handler.name,
+            "kind": kind,
+            "cmd": cmd,
+            "result": result,
+            "duration": round(duration, 6),
+        }
+        with self.lock:
+            self.entries[self.test].append(entry)
+
+    def record_stream(
+        self, handler: ShellHandler, cmd: str, stream: CommandStream
+    ) -> None:
+        """Record the lines of a stream returned by execute_stream as it is read
+
+        Args:
+            self:                   self
+            handler:                the ShellHandler
+            cmd (str):              the command
+            stream (CommandStream): the stream
+        """
+        lines = stream.lines
+        start = time.monotonic()
+
+        def recorded_lines():
+            output = []
+            try:
+                for line in lines:
+                    output.append([round(time.monotonic() - start, 6), line])
+                    yield line
+            finally:
+                lines.close()
+                result = {
+                    "lines": output,
+                    "exit_status": stream.exit_status,
+                    "err": stream.err,
+                }
+                self.record(
+                    handler, "execute_stream", cmd, result, time.monotonic() - start
+                )
+
+        stream.lines = recorded_lines()
+
+
+class CassettePlayer:
+    def __init__(self, directory: str, speed: float = 0) -> None:
+        """Init the player serving the responses of the cassettes of directory
+
+        A test is answered from its own cassette first. The session fixtures
+        run their commands in the first test that uses them, so the calls
+        missing from the cassette of the test are answered from all the
+        cassettes of directory.
+
+        Args:
+            self:            self
+            directory (str): directory of the cassettes
+            speed (float):   0 to answer right away, otherwise the recorded
+                             durations are divided by speed, e.g. 1 to replay
+                             at the recorded timing (default 0)
+        """
+        self.directory = directory
+        self.speed = speed
+        self.lock = threading.Lock()
+        self.responses = {}
+        self.fallback = self._load(
+            os.path.join(directory, name)
+            for name in sorted(os.listdir(directory))
+            if name.endswith(".json.gz")
+        )
+
+    @staticmethod
+    def _load(paths) -> dict:
+        """Load the responses of cassettes
+
+        Args:
+            paths (iterable): paths of the cassettes
+
+        Returns:
+            dict: deque of the responses by (name, kind, cmd) of the calls
+        """
+        responses = collections.defaultdict(collections.deque)
+        for path in paths:
+            if not os.path.exists(path):
+                continue
+            with gzip.open(path, "rt") as f:
+                for entry in json.load(f)["entries"]:
+                    key = (entry["name"], entry["kind"], json.dumps(entry["cmd"]))
+                    responses[key].append(entry)
+        return responses
+
+    def start_test(self, test: str) -> None:
+        """Serve the responses of the cassette of test first
+
+        Args:
+            self:       self
+            test (str): pytest node id
+        """
+        responses = self._load([cassette_path(self.directory, test)])
+        with self.lock:
+            self.responses = responses
+
+    def finish_test(self) -> None:
+        """Serve the responses of all the cassettes
+
+        Args:
+            self: self
+        """
+        with self.lock:
+            self.responses = {}
+
+    def play(self, handler: ShellHandler, kind: str, cmd):
+        """Get the next recorded response of a call
+
+        Args:
+            self:       self
+            handler:    the ShellHandler
+            kind (str): name of the ShellHandler method
+            cmd:        the command, or the list of commands of a batch
+
+        Returns:
+            the recorded result, after the recorded duration divided by speed
+
+        Raises:
+            CassetteError: no response left for the call
+        """
+        key = (handler.name, kind, json.dumps(cmd))
+        with self.lock:
+            entries = self.responses.get(key) or self.fallback.get(key)
+            if not entries:
+                raise CassetteError(f"{handler.name}: no recorded {kind} of {cmd!r}")
+            entry = entries.popleft()
+        if self.speed and kind != "execute_stream":
+            time.sleep(entry["duration"] / self.speed)
+        return entry["result"]
+
+
+class ReplayShellHandler(ShellHandler):
+    """ShellHandler answering the commands from the cassettes of a
+       CassettePlayer, without any connection
+    """
+
+    player = None
+
+    def _connect(self) -> None:
+        """Nothing to connect to
+
+        Args:
+            self: self
+        """
+        self.channel = None
+
+    def _disconnect(self) -> None:
+        """Nothing to disconnect from
+
+        Args:
+            self: self
+        """
+
+    def is_connected(self) -> bool:
+        """The replay is always connected
+
+        Args:
+            self: self
+
+        Returns:
+            bool: True
+        """
+        return True
+
+    def is_healthy(self, timeout: int = 2) -> bool:
+        """The replay is always ready for the next command
+
+        Args:
+            self:          self
+            timeout (int): unused
+
+        Returns:
+            bool: True
+        """
+        return True
+
+    def reconnect(self) -> None:
+        """Nothing to reconnect to
+
+        Args:
+            self: self
+        """
+
+    def execute_shell(self, cmd: str, timeout: float = 5) -> Tuple[int, list, list]:
+        """No shell to run the shell plumbing, e.g. the shell state of a
+           subshell, on
+
+        Args:
+            self:            self
+            cmd (str):       the command, unused
+            timeout (float): unused
+
+        Returns:
+            exit_status (int): 0
+            stdout (list):     empty
+            stderr (list):     empty
+        """
+        return 0, [], []
+
+    def close(self) -> None:
+        """Nothing to close
+
+        Args:
+            self: self
+        """
+
+    def start_agent(self) -> bool:
+        """The replay has no agent, record the cassettes without --agent
+
+        Args:
+            self: self
+
+        Returns:
+            bool: False
+        """
+        return False
+
+    @timed("execute")
+    def execute(self, cmd: str, timeout: float = 5) -> Tuple[int, list, list]:
+        """Replay execute, see ShellHandler.execute"""
+        return tuple(self.player.play(self, "execute", cmd))
+
+    @timed("execute")
+    def execute_channel(self, cmd: str, timeout: float = 5) -> Tuple[int, list, list]:
+        """Replay execute_channel, see ShellHandler.execute_channel"""
+        return tuple(self.player.play(self, "execute_channel", cmd))
+
+    @timed("batch")
+    def execute_batch(
+        self,
+        cmds: list,
+        timeout: float = 5,
+        stop_on_error: bool = False,
+        delay: float = 0,
+        on_result=None,
+    ) -> list:
+        """Replay execute_batch, see ShellHandler.execute_batch"""
+        recorded = self.player.play(self, "execute_batch", cmds)
+        results = [tuple(result) for result in recorded]
+        if on_result is not None:
+            for index, result in enumerate(results):
+                on_result(index, result)
+        return results
+
+    @timed("executeWithSearch")
+    def executeWithSearch(
+        self, cmd: str, assertOnStr: str, timeout: float = 5
+    ) -> Tuple[int, list, list]:
+        """Replay executeWithSearch, see ShellHandler.executeWithSearch"""
+        return tuple(self.player.play(self, "executeWithSearch", cmd))
+
+    @timed("testpmd")
+    def start_testpmd(self, cmd: str) -> Tuple[int, list, list]:
+        """Replay start_testpmd, see ShellHandler.start_testpmd"""
+        return tuple(self.player.play(self, "start_testpmd", cmd))
+
+    @timed("testpmd")
+    def testpmd_active(self) -> bool:
+        """Replay testpmd_active, see ShellHandler.testpmd_active"""
+        return self.player.play(self, "testpmd_active", "")
+
+    @timed("testpmd")
+    def stop_testpmd(self) -> int:
+        """Replay stop_testpmd, see ShellHandler.stop_testpmd"""
+        return self.player.play(self, "stop_testpmd", "")
+
+    @timed("testpmd")
+    def testpmd_cmd(self, cmd: str) -> int:
+        """Replay testpmd_cmd, see ShellHandler.testpmd_cmd"""
+        return self.player.play(self, "testpmd_cmd", cmd)
+
+    @timed("testpmd")
+    def testpmd_execute(self, cmd: str, timeout: float = 5) -> Tuple[int, list]:
+        """Replay testpmd_execute, see ShellHandler.testpmd_execute"""
+        return tuple(self.player.play(self, "testpmd_execute", cmd))
+
+    def execute_stream(
+        self, cmd: str, timeout: float = 5, tail_lines: int = 100
+    ) -> CommandStream:
+        """Replay execute_stream, see ShellHandler.execute_stream"""
+        stream = CommandStream(cmd.strip("\n"), timeout, tail_lines)
+        result = self.player.play(self, "execute_stream", cmd)
+        speed = self.player.speed
+
+        def lines():
+            start = time.monotonic()
+            for offset, line in result["lines"]:
+                if speed:
+                    time.sleep(max(start + offset / speed - time.monotonic(), 0))
+                stream.tail.append(line)
+                yield line
+            stream.exit_status = result["exit_status"]
+            stream.err = result["err"]
+
+        stream.lines = lines()
+        return stream
@@ -1,3 +1,4 @@
+import uuid
 from sriov.common.config import Config
 
 
@@ -39,15 +40,21 @@ class ConfigTestData:
         vf_pci = settings.config["dut"]["interface"]["vf1"]["pci"]
         dpdk_img = settings.config["dpdk_img"]
         cpus = settings.config["dut"]["pmd_cpus"]
+        # name of the container of container_cmd, e.g. for TelemetryClient,
+        # unique so that a container of a previous test still being removed
+        # does not hold it
+        self.container_name = f"sriov_testpmd_{uuid.uuid4().hex[:8]}"
         self.container_cmd = (
-            f"{settings.config['container_manager']} run -it --rm --privileged "
+            f"{settings.config['container_manager']} run -it "
+            f"--name {self.container_name} --rm --privileged "
             f"{settings.config['container_volumes']} "
             f"--cpuset-cpus {cpus} {dpdk_img} dpdk-testpmd -l {cpus} "
             f"-n 4 -a {vf_pci} "
             "-- --nb-cores=2 -i"
         )
         self.container_cmd_echo = (
-            f"{settings.config['container_manager']} run -it --rm --privileged "
+            f"{settings.config['container_manager']} run -it "
+            f"--name {self.container_name} --rm --privileged "
             f"{settings.config['container_volumes']} "
             f"--cpuset-cpus {cpus} {dpdk_img} dpdk-testpmd -l {cpus} "
             f"-n 4 -a {vf_pci} "
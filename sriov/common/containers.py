@@ -0,0 +1,254 @@
+import json
+import re
+import shlex
+import threading
+import time
+from sriov.common.exec import ShellHandler
+from typing import Tuple
+
+
+# prefix of the names of the helper containers, one per image and host
+HELPER_PREFIX = "sriov_helper_"
+
+
+def helper_name(image: str) -> str:
+    """Get the name of the helper container of an image
+
+    Args:
+        image (str): container image, e.g. "docker.io/patrickkutch/dpdk:v21.11"
+
+    Returns:
+        str: container name, e.g. "sriov_helper_docker.io_patrickkutch_dpdk_v21.11"
+    """
+    return HELPER_PREFIX + re.sub(r"[^\w.-]+", "_", image)
+
+
+class ContainerHelper:
+    def __init__(self, image: str) -> None:
+        """Init the state of the helper container of an image
+
+        Args:
+            self:        self
+            image (str): container image
+        """
+        self.image = image
+        self.name = helper_name(image)
+        # the entrypoint of the image, run before the arguments of an exec
+        self.entrypoint = []
+        # None until started, False if it could not start
+        self.running = None
+        # seconds to start the helper, the cost of a "run --rm" it replaces
+        self.start_time = 0.0
+        self.execs = 0
+
+
+class ContainerManager:
+    def __init__(self, ssh_obj: ShellHandler, manager: str, volumes: str) -> None:
+        """Init the container manager of a host
+
+        The commands of an image run by "exec" in a long-lived helper
+        container of the image, started on the first use, instead of a new
+        "run --rm" each time.
+
+        Args:
+            self:                   self
+            ssh_obj (ShellHandler): ssh connection obj of the host
+            manager (str):          podman or docker
+            volumes (str):          volume options of the helper containers,
+                                    e.g. "-v /sys:/sys -v /dev:/dev"
+        """
+        self.ssh_obj = ssh_obj
+        self.manager = manager
+        self.volumes = volumes
+        self.helpers = {}
+        self.lock = threading.Lock()
+
+    def preflight(self, images: list, timeout: int = 600) -> dict:
+        """Check that the images are on the host, and pull the missing ones
+           at the same time
+
+        Args:
+            self:          self
+            images (list): container images
+            timeout (int): seconds to pull the images (default 600)
+
+        Returns:
+            dict: "present", "pulled" or "missing" by image
+        """
+        checks = [
+            f"( {self.manager} image inspect {image} >/dev/null 2>&1 "
+            f"&& echo present {image} || {{ {self.manager} pull -q {image} "
+            f">/dev/null 2>&1 && echo pulled {image} || echo missing {image}; }} ) &"
+            for image in images
+        ]
+        self.ssh_obj.log_str(f"preflight of {' '.join(images)}")
+        # in a subshell, the background jobs print no job control messages
+        cmd = "( " + " ".join(checks) + " wait )"
+        code, out, err = self.ssh_obj.execute(cmd, timeout)
+        status = {image: "missing" for image in images}
+        for line in out:
+            parts = line.split()
+            if len(parts) == 2 and parts[1] in status:
+                status[parts[1]] = parts[0]
+        return status
+
+    def _start_helper(self, helper: ContainerHelper) -> None:
+        """Start the helper container of an image, replacing a stale one
+
+        Args:
+            self:   self
+            helper: the ContainerHelper
+        """
+        cmd = (
+            f"{self.manager} image inspect -f '{{{{json .Config.Entrypoint}}}}' "
+            f"{helper.image} && {{ {self.manager} kill {helper.name} >/dev/null 2>&1; "
+            f"{self.manager} rm -f {helper.name} >/dev/null 2>&1; "
+            f"{self.manager} run -d --rm --privileged "
+            f"{self.volumes} --name {helper.name} --entrypoint tail "
+            f"{helper.image} -f /dev/null; }}"
+        )
+        self.ssh_obj.log_str(cmd)
+        start = time.monotonic()
+        code, out, err = self.ssh_obj.execute(cmd, 120)
+        helper.start_time = time.monotonic() - start
+        helper.running = code == 0 and len(out) == 2
+        if helper.running:
+            helper.entrypoint = json.loads(out[0]) or []
+        else:
+            print(f"{self.ssh_obj.name}: no helper container for {helper.image}")
+
+    def command(self, image: str, args: str, options: str = None) -> str:
+        """Get the command running the image with arguments, like
+           "<manager> run --rm <options> <image> <args>"
+
+        The command runs in the helper container of the image, started on
+        the first call. It falls back to "run --rm" if the helper cannot
+        start.
+
+        Args:
+            self:          self
+            image (str):   container image
+            args (str):    arguments of the entrypoint of the image, or the
+                           command if the image has no entrypoint
+            options (str): options of the "run --rm" fallback, None for
+                           "--privileged" and the volumes of the helpers,
+                           like the helpers themselves (default None)
+
+        Returns:
+            str: the command
+        """
+        with self.lock:
+            helper = self.helpers.get(image)
+            if helper is None:
+                helper = self.helpers[image] = ContainerHelper(image)
+                self._start_helper(helper)
+            if not helper.running:
+                if options is None:
+                    options = f"--privileged {self.volumes}".strip()
+                return f"{self.manager} run --rm {options} {image} {args}"
+            helper.execs += 1
+        return " ".join(
+            [self.manager, "exec", helper.name]
+            + [shlex.quote(arg) for arg in helper.entrypoint]
+            + [args]
+        )
+
+    def run(self, image: str, args: str, timeout: int = 5) -> Tuple[int, list, list]:
+        """Run the image with arguments in its helper container
+
+        Args:
+            self:          self
+            image (str):   container image
+            args (str):    arguments of the entrypoint of the image
+            timeout (int): seconds of timeout for execute (default 5)
+
+        Returns:
+            exit_status (int): the exit status of the command
+            stdout (list):     list of stdout lines
+            stderr (list):     list of stderr lines
+        """
+        cmd = self.command(image, args)
+        self.ssh_obj.log_str(cmd)
+        return self.ssh_obj.execute(cmd, timeout)
+
+    def saved_time(self) -> float:
+        """Estimate the container start time saved by the helper containers:
+           the start time of a helper for each exec but the first
+
+        Args:
+            self: self
+
+        Returns:
+            float: seconds saved
+        """
+        return sum(
+            helper.start_time * (helper.execs - 1)
+            for helper in self.helpers.values()
+            if helper.running and helper.execs > 1
+        )
+
+    def close(self) -> None:
+        """Remove the helper containers
+
+        Args:
+            self: self
+        """
+        names = [helper.name for helper in self.helpers.values() if helper.running]
+        if names:
+            # SIGKILL, the helpers ignore SIGTERM, and --rm removes them
+            cmd = f"{self.manager} kill {' '.join(names)} >/dev/null 2>&1"
+            try:
+                self.ssh_obj.execute(cmd, 30)
+            except Exception:
+                # the session is gone, the next session replaces the helpers
+                pass
+        self.helpers = {}
+
+
+class ContainerPool:
+    def __init__(self) -> None:
+        """Init the container managers shared by the whole test session
+
+        Args:
+            self: self
+        """
+        self.managers = {}
+        self.lock = threading.Lock()
+
+    def get(self, ssh_obj: ShellHandler, settings: object) -> ContainerManager:
+        """Get the container manager of a host, creating it on the first call
+
+        Args:
+            self:                   self
+            ssh_obj (ShellHandler): ssh connection obj of the host
+            settings:               settings obj, for container_manager and
+                                    container_volumes
+
+        Returns:
+            ContainerManager: the manager of the host
+        """
+        with self.lock:
+            manager = self.managers.get(ssh_obj.name)
+            if manager is None:
+                manager = self.managers[ssh_obj.name] = ContainerManager(
+                    ssh_obj,
+                    settings.config["container_manager"],
+                    settings.config.get("container_volumes") or "",
+                )
+            # a reconnected session is a new handler of the same host
+            manager.ssh_obj = ssh_obj
+            return manager
+
+    def close_all(self) -> None:
+        """Remove the helper containers of every host
+
+        Args:
+            self: self
+        """
+        for manager in self.managers.values():
+            manager.close()
+        self.managers = {}
+
+
+# the container managers of the session
+CONTAINERS = ContainerPool()
@@ -1,14 +1,121 @@
+import codecs
+import collections
+from concurrent.futures import Future
+import fcntl
+import functools
+import os
 import paramiko
+import pty
 import re
+import select
+import shutil
 import signal
+import socket
+import struct
+import subprocess
+import termios
+import threading
 import time
 from typing import Tuple
+from sriov.common.agent import AgentError, RemoteAgent
+from sriov.common.timing import TIMING
+
+
+ANSI_ESCAPE = re.compile(r"(\x9B|\x1B\[)[0-?]*[ -/]*[@-~]")
+
+# printed before the first command of a batch: the interactive shell echoes
+# the whole script before running it, and the echo ends with a quote, so the
+# output of the batch starts after this line
+BATCH_START = "start of batch"
+# printed after each command of a batch, followed by its index and exit status
+BATCH_END = "end of batch command"
+BATCH_END_RE = re.compile(BATCH_END + r" (\d+) (-?\d+)$")
+BATCH_DONE = BATCH_END + " done"
+
+
+def synchronized(method):
+    """Serialize the calls using the interactive shell of a ShellHandler, so that
+       the handler can be shared by threads without mixing up their output
+
+    Args:
+        method: ShellHandler method to wrap
+
+    Returns:
+        the wrapped method
+    """
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.lock:
+            return method(self, *args, **kwargs)
+
+    return wrapper
+
+
+def timed(kind: str):
+    """Record the timing of the calls of a ShellHandler method in TIMING
+
+    Args:
+        kind (str): name of the call in the records
+
+    Returns:
+        the decorator
+    """
+
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            cmd = args[0] if args else kwargs.get("cmd", kwargs.get("cmds", ""))
+            record = TIMING.start(
+                self, kind, cmd if isinstance(cmd, str) else "\n".join(cmd)
+            )
+            if record is None:
+                return method(self, *args, **kwargs)
+            result = None
+            returned = False
+            try:
+                result = method(self, *args, **kwargs)
+                returned = True
+                return result
+            finally:
+                if isinstance(result, tuple):
+                    exit_status, lines = result[0], sum(map(len, result[1:]))
+                elif isinstance(result, list):
+                    # the first failure of a batch
+                    exit_status = next((r[0] for r in result if r[0]), 0)
+                    lines = sum(len(r[1]) + len(r[2]) for r in result)
+                else:
+                    exit_status, lines = result, 0
+                TIMING.finish(record, exit_status, lines)
+                if ShellHandler.cassette is not None and returned:
+                    ShellHandler.cassette.record(
+                        self, method.__name__, cmd, result, record.duration
+                    )
+
+        return wrapper
+
+    return decorator
 
 
 class ShellHandler:
     debug_cmd_execute = False
+    # run execute() on a dedicated exec channel per command instead of the
+    # interactive shell; the interactive shell is still used for testpmd
+    use_exec_channel = False
+    # start a RemoteAgent for the helpers of utils.py on each new session
+    use_agent = False
+    # seconds between SSH keepalives; a peer that misses 3 of them is dead
+    keepalive_interval = 15
+    # attempts to connect again when the connection was lost
+    reconnect_attempts = 3
+    # seconds to wait after the first failed attempt, doubled after each one
+    reconnect_backoff = 0.5
+    # CassetteRecorder recording the calls, see cassette.py
+    cassette = None
 
-    def __init__(self, host: str, user: str, psw: str, name: str) -> None:
+    def __init__(
+        self, host: str, user: str, psw: str, name: str, parent: "ShellHandler" = None
+    ) -> None:
         """Initialize the shell handler object
 
         Args:
@@ -17,27 +124,271 @@ class ShellHandler:
             user (str): the SSH username
             psw (str):  the SSH password
             name (str): the name of the ShellHandler object
+            parent:     ShellHandler whose SSH connection is shared, see
+                        open_subshell() (default None, a new connection)
         """
         self.name = name
+        self.host = host
+        self.user = user
+        self.psw = psw
+        self.parent = parent
+        # sub-handlers opened by open_subshell(), closed with this handler
+        self.subshells = []
+        # shell options (e.g. "set -o pipefail") that must apply to every command
+        self.shell_state = []
+        # partial line read from the channel, completed by the next recv
+        self.buffer = ""
+        self.decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self.lock = threading.RLock()
+        # RemoteAgent answering the structured requests of the utils.py helpers,
+        # None when the helpers use shell commands
+        self.agent = None
+        # (cmd, timeout, future) of the commands queued by submit() until flush()
+        self.pending = []
+        # number of lost connections restored by reconnect(), and the seconds
+        # spent reconnecting
+        self.reconnect_count = 0
+        self.reconnect_time = 0.0
+        # testpmd state seen in the output of the shell: True at the testpmd
+        # prompt, False when testpmd is not running, None when unknown
+        self.testpmd_prompt = False
+        # the last command of the interactive shell timed out or lost the
+        # channel: the shell may be stuck until it answers a probe again
+        self.shell_failed = False
+        self._connect()
+
+    def _connect(self) -> None:
+        """Connect to the host and open the interactive shell channel
+
+        A sub-handler opens its channel on the transport of its parent,
+        reconnecting the parent first if its connection was lost.
+
+        Args:
+            self: self
+        """
+        if self.parent is not None:
+            self.parent._ensure_connected()
+            self.ssh = self.parent.ssh
+            self.channel = self.ssh.invoke_shell(width=300)
+            return
         self.ssh = paramiko.SSHClient()
         self.ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
         try:
-            if psw is None:
-                self.ssh.connect(host, username=user, port=22, timeout=10)
+            if self.psw is None:
+                self.ssh.connect(self.host, username=self.user, port=22, timeout=10)
             else:
-                self.ssh.connect(host, username=user, password=psw, port=22, timeout=10)
+                self.ssh.connect(
+                    self.host,
+                    username=self.user,
+                    password=self.psw,
+                    port=22,
+                    timeout=10,
+                )
 
         except paramiko.AuthenticationException:
-            print("ERROR: invalid credentials provided for {}".format(host))
+            print("ERROR: invalid credentials provided for {}".format(self.host))
             raise
 
-        channel = self.ssh.invoke_shell(width=300)
-        self.stdin = channel.makefile("wb")
-        self.stdout = channel.makefile("r")
+        self.channel = self.ssh.invoke_shell(width=300)
+        self._set_keepalive(self.ssh.get_transport())
+
+    def _set_keepalive(self, transport: paramiko.Transport) -> None:
+        """Send keepalives on an idle connection, and let the kernel report the
+           connection as dead when they are not acknowledged anymore
+
+        Args:
+            self:      self
+            transport: the SSH transport of the session
+        """
+        interval = self.keepalive_interval
+        transport.set_keepalive(interval)
+        sock = transport.sock
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        if hasattr(socket, "TCP_KEEPIDLE"):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, interval)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, interval)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT, 3)
+        if hasattr(socket, "TCP_USER_TIMEOUT"):
+            # unacknowledged data, e.g. a keepalive, also times out the connection
+            sock.setsockopt(
+                socket.IPPROTO_TCP, socket.TCP_USER_TIMEOUT, interval * 3 * 1000
+            )
+
+    def _disconnect(self) -> None:
+        """Close the connection to the host, or only the shell channel of a
+           sub-handler
+
+        Args:
+            self: self
+        """
+        if self.parent is not None:
+            self.channel.close()
+            return
+        self.ssh.close()
+
+    def _open_exec_channel(self, cmd: str, timeout: float):
+        """Start cmd on a new exec channel of the SSH transport
+
+        Args:
+            self:            self
+            cmd (str):       the command to execute
+            timeout (float): timeout to open the channel
+
+        Returns:
+            paramiko.Channel: the channel running cmd
+        """
+        channel = self.ssh.get_transport().open_session(timeout=timeout)
+        try:
+            channel.exec_command("".join(s + "; " for s in self.shell_state) + cmd)
+        except Exception:
+            channel.close()
+            raise
+        return channel
+
+    def put_file(self, local_path: str, remote_path: str) -> None:
+        """Copy a file to the host over SFTP
+
+        Args:
+            self:              self
+            local_path (str):  path of the file to copy
+            remote_path (str): destination path on the host
+        """
+        sftp = self.ssh.open_sftp()
+        try:
+            sftp.put(local_path, remote_path)
+        finally:
+            sftp.close()
+
+    def start_agent(self) -> bool:
+        """Start the RemoteAgent used by the helpers of utils.py
+
+        Args:
+            self: self
+
+        Returns:
+            bool: True if the agent is running, False if the helpers will
+                  use shell commands
+        """
+        try:
+            self.agent = RemoteAgent(self)
+        except AgentError as err:
+            self.log_str(f"{err}, using shell commands")
+            self.agent = None
+        return self.agent is not None
+
+    @synchronized
+    def open_subshell(self, name: str = None) -> "ShellHandler":
+        """Open another interactive shell on the connection of this handler
+
+        The sub-handler runs its commands at the same time as this handler
+        and the other sub-handlers, e.g. a capture while the host is
+        configured, without a new SSH handshake. It starts with the shell
+        options of this handler, and is closed with it.
+
+        Args:
+            self:       self
+            name (str): name of the sub-handler (default "<name>-<number>")
+
+        Returns:
+            ShellHandler: the sub-handler, of the same class as this handler
+        """
+        self._ensure_connected()
+        if name is None:
+            name = f"{self.name}-{len(self.subshells) + 1}"
+        subshell = type(self)(self.host, self.user, self.psw, name, parent=self)
+        for cmd in self.shell_state:
+            subshell.execute_shell(cmd)
+            subshell.shell_state.append(cmd)
+        self.subshells.append(subshell)
+        return subshell
+
+    def is_connected(self) -> bool:
+        """Check that the connection and the interactive shell channel are open
+
+        Args:
+            self: self
+
+        Returns:
+            bool: True if connected
+        """
+        transport = self.ssh.get_transport()
+        return (
+            transport is not None and transport.is_active() and not self.channel.closed
+        )
+
+    @synchronized
+    def reconnect(self) -> None:
+        """Replace a lost connection: connect again, restore the shell options
+           recorded in shell_state and restart the agent. A running testpmd
+           is lost with the connection.
+
+        The failed attempts are retried after reconnect_backoff seconds,
+        doubled after each attempt. With the defaults, a host that cannot be
+        reached costs at most 3 connect timeouts of 10 seconds plus 0.5 + 1
+        seconds of waits before the exception.
+
+        Args:
+            self: self
+
+        Raises:
+            Exception: the host could not be reached in reconnect_attempts
+        """
+        start = time.monotonic()
+        self.log_str(f"connection to {self.host} lost, reconnecting")
+        had_agent = self.agent is not None
+        if had_agent:
+            self.agent.close()
+            self.agent = None
+        try:
+            for attempt in range(1, self.reconnect_attempts + 1):
+                try:
+                    self._disconnect()
+                except Exception:
+                    pass
+                try:
+                    self._connect()
+                    break
+                except Exception as err:
+                    self.log_str(f"reconnect attempt {attempt} failed: {err}")
+                    if attempt == self.reconnect_attempts:
+                        raise
+                    time.sleep(self.reconnect_backoff * 2 ** (attempt - 1))
+            self.buffer = ""
+            self.decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+            self.testpmd_prompt = False
+            self.shell_failed = False
+            for cmd in self.shell_state:
+                self.execute_shell(cmd)
+            if had_agent:
+                self.start_agent()
+            self.reconnect_count += 1
+        finally:
+            self.reconnect_time += time.monotonic() - start
+        self.log_str(f"reconnected in {time.monotonic() - start:.1f}s")
+
+    def _ensure_connected(self) -> None:
+        """Reconnect first if the connection was lost
+
+        Args:
+            self: self
+        """
+        if not self.is_connected():
+            with self.lock:
+                # another thread may have reconnected in the meantime
+                if not self.is_connected():
+                    self.reconnect()
 
     def __del__(self) -> None:
         """Delete the shell handler ssh object
 
+        Args:
+            self: self
+        """
+        self.close()
+
+    def close(self) -> None:
+        """Stop TestPMD if it is still running and close the SSH session
+
         Args:
             self: self
         """
@@ -46,21 +397,182 @@ class ShellHandler:
                 self.stop_testpmd()
         except Exception:
             pass
-        self.ssh.close()
+        if getattr(self, "agent", None) is not None:
+            self.agent.close()
+        for subshell in getattr(self, "subshells", []):
+            subshell.close()
+        self.subshells = []
+        parent = getattr(self, "parent", None)
+        if parent is not None and self in parent.subshells:
+            parent.subshells.remove(self)
+        try:
+            self._disconnect()
+        except AttributeError:
+            # the connection was never established
+            pass
+
+    def is_healthy(self, timeout: int = 2) -> bool:
+        """Check that the SSH session can be reused for the next command
+
+        Args:
+            self:          self
+            timeout (int): seconds to wait for the shell to respond (default 2)
+
+        Returns:
+            True: the transport is up and the shell prompt answers commands
+            False: the session is dead or stuck (e.g. a leftover testpmd prompt)
+        """
+        if not self.is_connected():
+            return False
+        code, _, _ = self.execute_shell("true", timeout)
+        return code == 0
+
+    def is_ready(self, timeout: int = 2) -> bool:
+        """Cheaply check that the SSH session can be handed out: the transport
+           and the shell channel are open, and the shell is only probed with
+           is_healthy() when its last command timed out or lost the channel
+
+        Args:
+            self:          self
+            timeout (int): seconds to wait for the shell to respond to the
+                           probe (default 2)
+
+        Returns:
+            bool: True if the session can be reused
+        """
+        if not self.is_connected():
+            return False
+        return not self.shell_failed or self.is_healthy(timeout)
 
     @staticmethod
     def timeout_handler(signum, frame) -> None:
         """Handle the timeout by raising an exception
 
         Args:
-            signum (signum obj): signal number
-            frame (frame obj):   current stack frame
+            signum (signum obj): signal number, unused
+            frame (frame obj):   current stack frame, unused
 
         Raises:
             Exception: timeout
         """
         raise Exception("timeout")
 
+    @staticmethod
+    def clean_line(line: str) -> str:
+        """Get rid of 'coloring and formatting' special characters of a line
+
+        Args:
+            line (str): line read from the interactive shell
+
+        Returns:
+            str: the line without escape sequences, backspaces and carriage returns
+        """
+        return ANSI_ESCAPE.sub("", line).replace("\b", "").replace("\r", "")
+
+    def _write(self, data: str) -> None:
+        """Write to the interactive shell
+
+        Args:
+            self:       self
+            data (str): the characters to send
+        """
+        TIMING.sent()
+        self.channel.sendall(data.encode())
+
+    def _readlines(self, deadline: float):
+        """Read the lines of the interactive shell until the deadline
+
+        The wait is done with select on the channel rather than with SIGALRM,
+        so it works from any thread and supports sub-second timeouts.
+
+        Args:
+            self:             self
+            deadline (float): time.monotonic() value after which to give up
+
+        Yields:
+            str: the next line, including the line ending
+
+        Raises:
+            Exception: timeout, or the channel was closed
+        """
+        while True:
+            index = self.buffer.find("\n")
+            if index != -1:
+                line = self.buffer[: index + 1]
+                self.buffer = self.buffer[index + 1:]
+                yield line
+                continue
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self.timeout_handler(None, None)
+            readable, _, _ = select.select([self.channel], [], [], remaining)
+            if readable:
+                data = self.channel.recv(65536)
+                TIMING.received(len(data))
+                if not data:
+                    raise Exception("channel closed")
+                self.buffer += self.decoder.decode(data)
+
+    def _testpmd_lines(self, deadline: float):
+        """Read the lines of a testpmd until the deadline, and track its state:
+           a prompt means it is running, "Bye..." or a closed channel that it
+           is not, and a timeout leaves its state unknown
+
+        Args:
+            self:             self
+            deadline (float): time.monotonic() value after which to give up
+
+        Yields:
+            str: the next line, including the line ending
+
+        Raises:
+            Exception: timeout, or the channel was closed
+        """
+        try:
+            for line in self._readlines(deadline):
+                if str(line).startswith("testpmd>"):
+                    self.testpmd_prompt = True
+                elif str(line).startswith("Bye..."):
+                    self.testpmd_prompt = False
+                yield line
+        except Exception as err:
+            self.testpmd_prompt = False if str(err) == "channel closed" else None
+            raise
+
+    def _cached_testpmd_state(self) -> bool:
+        """Get the testpmd state without a round trip to the host
+
+        The output received since the last read is consumed: at the testpmd
+        prompt, testpmd can only have stopped if it printed something else.
+
+        Args:
+            self: self
+
+        Returns:
+            bool: True if testpmd is at its prompt, False if it is not
+                  running, None if unknown
+        """
+        if self.testpmd_prompt is not True:
+            return self.testpmd_prompt
+        while select.select([self.channel], [], [], 0)[0]:
+            data = self.channel.recv(65536)
+            TIMING.received(len(data))
+            if not data:
+                self.testpmd_prompt = False
+                return False
+            self.buffer += self.decoder.decode(data)
+        # lines left over from the previous commands, before the prompt
+        lines, _, prompt = self.buffer.rpartition("\n")
+        if "Bye..." in lines:
+            self.testpmd_prompt = False
+        elif lines and not self.clean_line(prompt).startswith("testpmd>"):
+            self.testpmd_prompt = None
+        else:
+            self.buffer = prompt
+        return self.testpmd_prompt
+
+    @timed("testpmd")
+    @synchronized
     def start_testpmd(self, cmd: str) -> Tuple[int, list, list]:
         """ Start the TestPMD application
 
@@ -77,40 +589,34 @@ class ShellHandler:
             sherr (list):      list of stderr lines
         """
         cmd = cmd.strip("\n")
+        self._ensure_connected()
         print(cmd)
-        self.stdin.write(cmd + "\n")
-        self.stdin.write("\n")
+        self._write(cmd + "\n")
+        self._write("\n")
         finish = "testpmd>"
-        self.stdin.flush()
 
         shout = []
         sherr = []
         exit_status = 0
-        signal.signal(signal.SIGALRM, self.timeout_handler)
-        signal.alarm(30)
+        deadline = time.monotonic() + 30
         try:
-            for line in self.stdout:
+            for line in self._testpmd_lines(deadline):
                 if str(line).startswith(cmd):
                     shout = []
                 elif str(line).startswith(finish):
                     break
                 else:
-                    shout.append(
-                        re.compile(r"(\x9B|\x1B\[)[0-?]*[ -/]*[@-~]")
-                        .sub("", line)
-                        .replace("\b", "")
-                        .replace("\r", "")
-                    )
+                    shout.append(self.clean_line(line))
         except Exception as err:
             exit_status = -1
             sherr.append(str(err))
-        finally:
-            signal.alarm(0)
         return exit_status, shout, sherr
 
+    @timed("testpmd")
+    @synchronized
     def testpmd_active(self) -> bool:
-        """A test of activity for the TestPMD session by sending a newline
-            heartbeat
+        """A test of activity for the TestPMD session, from the state tracked
+            in its output, or else by sending a newline heartbeat
 
         Args:
             self: self
@@ -118,22 +624,24 @@ class ShellHandler:
         Returns:
             active (boolean): True if TestPMD prompt exists, False otherwise
         """
-        self.stdin.write("\n")
-        self.stdin.flush()
+        active = self._cached_testpmd_state()
+        if active is not None:
+            return active
+        self._write("\n")
         finish = "testpmd>"
         active = True
-        signal.signal(signal.SIGALRM, self.timeout_handler)
-        signal.alarm(1)
+        deadline = time.monotonic() + 1
         try:
-            for line in self.stdout:
+            for line in self._testpmd_lines(deadline):
                 if str(line).startswith(finish):
                     break
         except Exception:
             active = False
-        finally:
-            signal.alarm(0)
+            self.testpmd_prompt = False
         return active
 
+    @timed("testpmd")
+    @synchronized
     def stop_testpmd(self) -> int:
         """Stop TestPMD if the SSH session has the TestPMD application running
 
@@ -145,28 +653,27 @@ class ShellHandler:
         """
         if not self.testpmd_active():
             return 0
-        self.stdin.write("quit\n")
+        self._write("quit\n")
         finish = "Bye..."
-        self.stdin.flush()
 
         exit_status = 0
-        signal.signal(signal.SIGALRM, self.timeout_handler)
-        signal.alarm(10)
+        deadline = time.monotonic() + 10
         try:
-            for line in self.stdout:
+            for line in self._testpmd_lines(deadline):
                 print(line)
                 if str(line).startswith(finish):
                     break
         except Exception:
             exit_status = -1
-        finally:
-            signal.alarm(0)
         # sleep before return
         time.sleep(1)
         return exit_status
 
+    @timed("testpmd")
+    @synchronized
     def testpmd_cmd(self, cmd: str) -> int:
-        """Send a command to the TestPMD application
+        """Send a command to the TestPMD application, and wait for the prompt
+           that follows its output
 
         Args:
             self:      self
@@ -175,37 +682,157 @@ class ShellHandler:
         Returns:
             exit_code (int): the exit status (0 on success, non-zero otherwise)
 
+        Raises:
+            Exception: TestPMD not active
+        """
+        exit_code, _ = self.testpmd_execute(cmd)
+        return exit_code
+
+    @timed("testpmd")
+    @synchronized
+    def testpmd_execute(self, cmd: str, timeout: float = 5) -> Tuple[int, list]:
+        """Send a command to the TestPMD application and read its output
+
+        An empty line is sent after cmd, so that the prompt that follows the
+        output ends a line, and the output is complete when it is read.
+
+        Args:
+            self:            self
+            cmd (str):       the command to be executed in the TestPMD session
+            timeout (float): timeout for the output (default 5)
+
+        Returns:
+            exit_code (int): the exit status (0 on success, non-zero otherwise)
+            output (list):   list of the output lines
+
         Raises:
             Exception: TestPMD not active
         """
         if not self.testpmd_active():
             raise Exception("TestPMD not active")
         cmd = cmd.strip("\n")
-        self.stdin.write(cmd + "\n")
-        self.stdin.flush()
+        self._write(cmd + "\n\n")
         finish = "testpmd>"
-        signal.signal(signal.SIGALRM, self.timeout_handler)
-        signal.alarm(1)
+        deadline = time.monotonic() + timeout
         exit_code = 0
+        output = []
+        echoed = False
         try:
-            for line in self.stdout:
+            for line in self._testpmd_lines(deadline):
                 if str(line).startswith(finish):
-                    break
+                    if echoed:
+                        break
+                    # the prompt followed by cmd
+                    echoed = True
+                elif echoed:
+                    output.append(self.clean_line(line))
         except Exception:
             exit_code = -1
+
+        return exit_code, output
+
+    @timed("execute")
+    def execute(self, cmd: str, timeout: float = 5) -> Tuple[int, list, list]:
+        """Execute a command in the SSH session
+
+        Args:
+            self:          self
+            cmd (str):     the command to execute over SSH
+            timeout (float): timeout for command to run (default 5)
+
+        Returns:
+            exit_status (int): the exit status (0 on success, non-zero otherwise)
+            shout (list):      list of stdout lines
+            sherr (list):      list of stderr lines
+        """
+        cmd = cmd.strip("\n")
+        self._ensure_connected()
+        if cmd.startswith("set -o ") or cmd.startswith("set +o "):
+            # keep track of the shell options so that the exec channels,
+            # which start a new shell for every command, see them as well
+            if cmd not in self.shell_state:
+                self.shell_state.append(cmd)
+            if ShellHandler.use_exec_channel:
+                # the interactive shell still runs testpmd and executeWithSearch
+                self.execute_shell(cmd, timeout)
+        if ShellHandler.use_exec_channel:
+            return self.execute_channel(cmd, timeout)
+        return self.execute_shell(cmd, timeout)
+
+    @timed("execute")
+    def execute_channel(self, cmd: str, timeout: float = 5) -> Tuple[int, list, list]:
+        """Execute a command on its own exec channel over the SSH transport
+
+        Unlike the interactive shell, the exec channel reports the real exit
+        status of the command and keeps stderr apart from stdout.
+
+        Args:
+            self:          self
+            cmd (str):     the command to execute over SSH
+            timeout (float): timeout for command to run (default 5)
+
+        Returns:
+            exit_status (int): the exit status (0 on success, non-zero otherwise)
+            shout (list):      list of stdout lines
+            sherr (list):      list of stderr lines
+        """
+        cmd = cmd.strip("\n")
+        if ShellHandler.debug_cmd_execute:
+            print(f"exec channel: {cmd}")
+        stdout = b""
+        stderr = b""
+        exit_status = 0
+        channel = None
+        try:
+            channel = self._open_exec_channel(cmd, timeout)
+            TIMING.sent()
+            deadline = time.monotonic() + timeout
+            while True:
+                while channel.recv_ready():
+                    data = channel.recv(65536)
+                    TIMING.received(len(data))
+                    stdout += data
+                while channel.recv_stderr_ready():
+                    data = channel.recv_stderr(65536)
+                    TIMING.received(len(data))
+                    stderr += data
+                if (
+                    channel.exit_status_ready()
+                    and channel.eof_received
+                    and not channel.recv_ready()
+                    and not channel.recv_stderr_ready()
+                ):
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise Exception("timeout")
+                # the channel becomes readable on stdout data or EOF only, so
+                # cap the wait to also pick up stderr and the exit status
+                select.select([channel], [], [], min(remaining, 0.1))
+            exit_status = channel.recv_exit_status()
+        except Exception as err:
+            exit_status = -1
+            stderr += str(err).encode()
         finally:
-            signal.alarm(0)
+            if channel is not None:
+                channel.close()
 
-        return exit_code
+        shout = stdout.decode(errors="replace").splitlines(keepends=True)
+        sherr = stderr.decode(errors="replace").splitlines(keepends=True)
+        if ShellHandler.debug_cmd_execute:
+            print(f"returning shout: {shout}")
+            print(f"returning sherr: {sherr}")
+        return exit_status, shout, sherr
 
-    def execute(self, cmd: str, timeout: int = 5) \
+    @synchronized
+    def execute_shell(self, cmd: str, timeout: float = 5) \
             -> Tuple[int, list, list]:  # noqa: C901
-        """Execute a command in the SSH session
+        """Execute a command in the interactive shell of the SSH session
 
         Args:
             self:          self
             cmd (str):     the command to execute over SSH
-            timeout (int): timeout for command to run (default 5)
+            timeout (float): timeout for command to run (default 5)
 
         Returns:
             exit_status (int): the exit status (0 on success, non-zero otherwise)
@@ -213,19 +840,17 @@ class ShellHandler:
             sherr (list):      list of stderr lines
         """
         cmd = cmd.strip("\n")
-        self.stdin.write(cmd + "\n")
+        self._write(cmd + "\n")
         finish = "end of stdOUT buffer. finished with exit status"
         echo_cmd = "echo {} $?".format(finish)
-        self.stdin.write(echo_cmd + "\n")
-        self.stdin.flush()
+        self._write(echo_cmd + "\n")
 
         shout = []
         sherr = []
         exit_status = 0
-        signal.signal(signal.SIGALRM, self.timeout_handler)
-        signal.alarm(timeout)
+        deadline = time.monotonic() + timeout
         try:
-            for line in self.stdout:
+            for line in self._readlines(deadline):
                 if ShellHandler.debug_cmd_execute:
                     print(f"Got line: {repr(line)}")
                 if str(line).endswith(cmd + "\r\n") or str(line).endswith(cmd + "\n"):
@@ -240,6 +865,8 @@ class ShellHandler:
                 elif str(line).startswith(finish):
                     # our finish command ends with the exit status
                     exit_status = int(str(line).rsplit(maxsplit=1)[1])
+                    # the shell answers, testpmd is not running in it
+                    self.testpmd_prompt = False
                     if ShellHandler.debug_cmd_execute:
                         print(f"cmd exit_status: {exit_status}")
                     if exit_status:
@@ -252,20 +879,15 @@ class ShellHandler:
                     break
                 else:
                     # get rid of 'coloring and formatting' special characters
-                    shout.append(
-                        re.compile(r"(\x9B|\x1B\[)[0-?]*[ -/]*[@-~]")
-                        .sub("", line)
-                        .replace("\b", "")
-                        .replace("\r", "")
-                    )
+                    shout.append(self.clean_line(line))
                 if ShellHandler.debug_cmd_execute:
                     print(f"shout: {shout}")
                     print(f"sherr: {sherr}")
+            self.shell_failed = False
         except Exception as err:
             exit_status = -1
             sherr.append(str(err))
-        finally:
-            signal.alarm(0)
+            self.shell_failed = True
 
         # first and last lines of shout/sherr contain a prompt
         if shout and echo_cmd in shout[-1]:
@@ -281,6 +903,395 @@ class ShellHandler:
             print(f"returning sherr: {sherr}")
         return exit_status, shout, sherr
 
+    @staticmethod
+    def _batch_script(
+        cmds: list, stop_on_error: bool, to_stderr: bool, delay: float = 0
+    ) -> str:
+        """Build the shell script running cmds with a frame after each command
+
+        Args:
+            cmds (list):           list of str commands
+            stop_on_error (bool):  skip the commands after the first failure
+            to_stderr (bool):      also print the frames to stderr
+            delay (float):         seconds to sleep between commands (default 0)
+
+        Returns:
+            str: the script
+        """
+        # the commands run as one group with stdin from /dev/null: the shell
+        # reads the whole script before running it, so a command reading stdin
+        # cannot consume the lines of the next commands
+        start = f"printf '%s\\n' '{BATCH_START}'"
+        if to_stderr:
+            start += f"; {start} >&2"
+        lines = ["{", "__sriov_rc=0", start]
+        for index, cmd in enumerate(cmds):
+            frame = f"printf '%s %d %d\\n' '{BATCH_END}' {index} $__sriov_rc"
+            if to_stderr:
+                frame += f"; {frame} >&2"
+            if stop_on_error and index > 0:
+                lines.append("if [ $__sriov_rc -eq 0 ]; then")
+            if delay and index > 0:
+                lines.append(f"sleep {delay}")
+            lines.extend([cmd.strip("\n"), "__sriov_rc=$?; " + frame])
+            if stop_on_error and index > 0:
+                lines.append("fi")
+        done = f"printf '%s\\n' '{BATCH_DONE}'"
+        if to_stderr:
+            done += f"; {done} >&2"
+        lines.extend([done, "} < /dev/null"])
+        return "\n".join(lines)
+
+    @staticmethod
+    def _read_batch_frames(lines, frames: list, on_frame=None) -> list:
+        """Split the output of a batch script into the output of each command
+
+        Args:
+            lines (iterable): output lines of the batch script
+            frames (list):    (exit_status, lines) of each finished command are
+                              appended to this list as the frames are read
+            on_frame:         optional function called with the index,
+                              exit_status and lines of each frame once read
+
+        Returns:
+            list: lines read after the last frame, i.e. output of the command
+                  still running when the lines ran out
+        """
+        output = []
+        started = False
+        for line in lines:
+            line = ShellHandler.clean_line(line)
+            if not started:
+                # the prompt and the echo of the script
+                started = line.rstrip("\n").endswith(BATCH_START)
+                continue
+            if line.rstrip("\n").endswith(BATCH_DONE):
+                break
+            match = BATCH_END_RE.search(line.rstrip("\n"))
+            if match and int(match.group(1)) == len(frames):
+                if match.start() > 0:
+                    # last output line of the command, without a trailing newline
+                    output.append(line[: match.start()])
+                frames.append((int(match.group(2)), output))
+                if on_frame is not None:
+                    on_frame(len(frames) - 1, int(match.group(2)), output)
+                output = []
+            else:
+                output.append(line)
+        return output
+
+    @timed("batch")
+    def execute_batch(
+        self,
+        cmds: list,
+        timeout: float = 5,
+        stop_on_error: bool = False,
+        delay: float = 0,
+        on_result=None,
+    ) -> list:
+        """Execute a list of commands with a single write to the SSH session
+
+        Each command is followed by a frame carrying its exit status, so the
+        output and exit status of every command are recovered from one round
+        trip instead of one round trip per command.
+
+        Args:
+            self:                 self
+            cmds (list):          list of str commands to run in order
+            timeout (float):      timeout for the whole batch to run (default 5)
+            stop_on_error (bool): do not run the commands after the first failure
+                                  (default False)
+            delay (float):        seconds to sleep on the host between commands
+                                  (default 0)
+            on_result:            optional function called with the index and
+                                  the (exit_status, shout, sherr) tuple of each
+                                  command as soon as its result is read
+
+        Returns:
+            list: (exit_status, shout, sherr) tuple of each command that was run,
+                  in the order of cmds; with stop_on_error the list ends with the
+                  failed command
+        """
+        if not cmds:
+            return []
+        self._ensure_connected()
+        if ShellHandler.use_exec_channel:
+            return self._execute_batch_channel(
+                cmds, timeout, stop_on_error, delay, on_result
+            )
+        return self._execute_batch_shell(cmds, timeout, stop_on_error, delay, on_result)
+
+    def _execute_batch_channel(
+        self, cmds: list, timeout: float, stop_on_error: bool, delay: float, on_result
+    ) -> list:
+        """Execute a batch of commands on an exec channel, see execute_batch
+
+        Args:
+            self:                 self
+            cmds (list):          list of str commands to run in order
+            timeout (float):      timeout for the whole batch to run
+            stop_on_error (bool): do not run the commands after the first failure
+            delay (float):        seconds to sleep on the host between commands
+            on_result:            function called with the result of each command
+
+        Returns:
+            list: (exit_status, shout, sherr) tuple of each command that was run
+        """
+        script = self._batch_script(cmds, stop_on_error, True, delay)
+        code, out, err = self.execute_channel(script, timeout)
+        out_frames = []
+        err_frames = []
+        out_rest = self._read_batch_frames(out, out_frames)
+        err_rest = self._read_batch_frames(err, err_frames)
+        results = []
+        for (exit_status, shout), (_, sherr) in zip(out_frames, err_frames):
+            results.append((exit_status, shout, sherr))
+        if code != 0 and len(results) < len(cmds):
+            # the command still running when the batch failed, e.g. timeout
+            results.append((code, out_rest, err_rest))
+        if on_result is not None:
+            for index, result in enumerate(results):
+                on_result(index, result)
+        return results
+
+    @synchronized
+    def _execute_batch_shell(
+        self, cmds: list, timeout: float, stop_on_error: bool, delay: float, on_result
+    ) -> list:
+        """Execute a batch of commands in the interactive shell, see execute_batch
+
+        Args:
+            self:                 self
+            cmds (list):          list of str commands to run in order
+            timeout (float):      timeout for the whole batch to run
+            stop_on_error (bool): do not run the commands after the first failure
+            delay (float):        seconds to sleep on the host between commands
+            on_result:            function called with the result of each command
+
+        Returns:
+            list: (exit_status, shout, sherr) tuple of each command that was run
+        """
+
+        def shell_result(exit_status: int, lines: list) -> Tuple[int, list, list]:
+            # stderr is combined with stdout, as for execute()
+            if exit_status:
+                return exit_status, [], lines
+            return exit_status, lines, []
+
+        def on_frame(index: int, exit_status: int, lines: list) -> None:
+            if on_result is not None:
+                on_result(index, shell_result(exit_status, lines))
+
+        frames = []
+        output = []
+        deadline = time.monotonic() + timeout
+        try:
+            # one write and the reads of its output: the batch costs a single
+            # round trip, the shell is left as it was
+            self._write(self._batch_script(cmds, stop_on_error, False, delay) + "\n")
+            output = self._read_batch_frames(
+                self._readlines(deadline), frames, on_frame
+            )
+            error = None
+        except Exception as err:
+            error = str(err)
+            # interrupt the running command, this also discards the rest of the
+            # batch, and wait for the prompt, so that its output does not leak
+            # into the next command
+            self._write("\x03")
+            self.execute_shell("true")
+
+        results = [shell_result(exit_status, lines) for exit_status, lines in frames]
+        if error is not None:
+            results.append((-1, [], output + [error]))
+            if on_result is not None:
+                on_result(len(frames), results[-1])
+        if ShellHandler.debug_cmd_execute:
+            print(f"returning batch results: {results}")
+        return results
+
+    def submit(self, cmd: str, timeout: float = 5) -> Future:
+        """Queue a command, to be sent with the other queued commands by flush()
+
+        Args:
+            self:            self
+            cmd (str):       the command to execute
+            timeout (float): timeout for the command to run (default 5)
+
+        Returns:
+            Future: resolves to the (exit_status, shout, sherr) tuple of the
+                    command; it is cancelled if the command is not run
+        """
+        future = Future()
+        with self.lock:
+            self.pending.append((cmd, timeout, future))
+        return future
+
+    def flush(self, stop_on_error: bool = False, delay: float = 0) -> list:
+        """Send the commands queued by submit() back to back, in one write
+
+        The future of each command resolves as soon as its framed result is
+        read, so a failure is attributed to the exact command, while the whole
+        queue costs one round trip, see execute_batch.
+
+        Args:
+            self:                 self
+            stop_on_error (bool): do not run the commands after the first failure,
+                                  their futures are cancelled (default False)
+            delay (float):        seconds to sleep on the host between commands
+                                  (default 0)
+
+        Returns:
+            list: the futures of the flushed commands, in submission order
+        """
+        with self.lock:
+            pending, self.pending = self.pending, []
+        if not pending:
+            return []
+        cmds = [cmd for cmd, _, _ in pending]
+        futures = [future for _, _, future in pending]
+        timeout = sum(timeout for _, timeout, _ in pending) + delay * len(pending)
+
+        def on_result(index: int, result: Tuple[int, list, list]) -> None:
+            futures[index].set_result(result)
+
+        try:
+            self.execute_batch(cmds, timeout, stop_on_error, delay, on_result)
+        finally:
+            for future in futures:
+                # not run: skipped after a failure, or the batch was interrupted
+                future.cancel()
+        return futures
+
+    def execute_stream(
+        self, cmd: str, timeout: float = 5, tail_lines: int = 100
+    ) -> "CommandStream":
+        """Execute a command and iterate over its output lines as they arrive
+
+        Example:
+            stream = ssh_obj.execute_stream(cmd, 600)
+            for line in stream:
+                print(line, end="")
+            assert stream.exit_status == 0, stream.tail
+
+        Breaking out of the loop, or calling cancel(), interrupts the command.
+
+        Args:
+            self:             self
+            cmd (str):        the command to execute over SSH
+            timeout (float):  timeout for command to run (default 5)
+            tail_lines (int): number of last lines kept in the stream tail
+                              (default 100)
+
+        Returns:
+            CommandStream: iterable of the sanitized output lines
+        """
+        self._ensure_connected()
+        stream = CommandStream(cmd.strip("\n"), timeout, tail_lines)
+        if ShellHandler.use_exec_channel:
+            stream.lines = self._stream_channel(stream)
+        else:
+            stream.lines = self._stream_shell(stream)
+        if ShellHandler.cassette is not None:
+            ShellHandler.cassette.record_stream(self, cmd, stream)
+        return stream
+
+    def _stream_shell(self, stream: "CommandStream"):
+        """Generate the output lines of a command run in the interactive shell
+
+        Args:
+            self:                   self
+            stream (CommandStream): the stream to feed
+
+        Yields:
+            str: the next output line, stdout and stderr combined
+        """
+        with self.lock:
+            started = False
+            finished = False
+            deadline = time.monotonic() + stream.timeout
+            try:
+                self._write(self._batch_script([stream.cmd], False, False) + "\n")
+                for line in self._readlines(deadline):
+                    line = self.clean_line(line)
+                    if not started:
+                        # the prompt and the echo of the script
+                        started = line.rstrip("\n").endswith(BATCH_START)
+                        continue
+                    if line.rstrip("\n").endswith(BATCH_DONE):
+                        finished = True
+                        break
+                    match = BATCH_END_RE.search(line.rstrip("\n"))
+                    if match:
+                        stream.exit_status = int(match.group(2))
+                        if match.start() == 0:
+                            continue
+                        # last output line, without a trailing newline
+                        line = line[: match.start()]
+                    stream.tail.append(line)
+                    yield line
+                    if stream.cancelled:
+                        break
+            except Exception as err:
+                stream.err.append(str(err))
+            finally:
+                if not finished:
+                    # interrupt the command, cancelled or timed out, and wait
+                    # for the prompt
+                    self._write("\x03")
+                    stream.exit_status = -1
+                    self.execute_shell("true")
+
+    def _stream_channel(self, stream: "CommandStream"):
+        """Generate the output lines of a command run on an exec channel
+
+        Args:
+            self:                   self
+            stream (CommandStream): the stream to feed
+
+        Yields:
+            str: the next stdout line; stderr is collected in stream.err
+        """
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        buffer = ""
+        stderr = b""
+        channel = None
+        try:
+            channel = self._open_exec_channel(stream.cmd, stream.timeout)
+            deadline = time.monotonic() + stream.timeout
+            while not stream.cancelled:
+                if channel.recv_ready():
+                    buffer += decoder.decode(channel.recv(65536))
+                    lines = buffer.splitlines(keepends=True)
+                    buffer = lines.pop() if not lines[-1].endswith("\n") else ""
+                    for line in lines:
+                        stream.tail.append(line)
+                        yield line
+                    continue
+                if channel.recv_stderr_ready():
+                    stderr += channel.recv_stderr(65536)
+                    continue
+                if channel.exit_status_ready() and channel.eof_received:
+                    if buffer:
+                        stream.tail.append(buffer)
+                        yield buffer
+                    stream.exit_status = channel.recv_exit_status()
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise Exception("timeout")
+                select.select([channel], [], [], min(remaining, 0.1))
+        except Exception as err:
+            stream.err.append(str(err))
+        finally:
+            if channel is not None:
+                channel.close()
+            if stream.exit_status is None:
+                stream.exit_status = -1
+            stream.err = (
+                stderr.decode(errors="replace").splitlines(keepends=True) + stream.err
+            )
+
     def log_str(self, string: str) -> None:
         """Print out the input string.
 
@@ -294,7 +1305,9 @@ class ShellHandler:
         print_out += string
         print(print_out)
 
-    def executeWithSearch(self, cmd: str, assertOnStr: str, timeout: int = 5) \
+    @timed("executeWithSearch")
+    @synchronized
+    def executeWithSearch(self, cmd: str, assertOnStr: str, timeout: float = 5) \
             -> Tuple[int, list, list]:  # noqa: C901
         """  Execute a command in the SSH session, designed for
              the command to be a podman/docker execution of a
@@ -305,7 +1318,7 @@ class ShellHandler:
             cmd (str):     the command to execute over SSH
             assertOnStr(str): throws an assert if the output of the command
                               contains this string
-            timeout (int): timeout for command to run (default 5)
+            timeout (float): timeout for command to run (default 5)
 
         Returns:
             exit_status (int): the exit status (0 on success, non-zero otherwise)
@@ -314,22 +1327,21 @@ class ShellHandler:
                                assertOnStr string was found
         """
         cmd = cmd.strip("\n")
+        self._ensure_connected()
 
         finish = "end of stdOUT buffer."
         echo_cmd = ";echo {} ".format(finish)
 
         # run the command and the echo in one shot
-        self.stdin.write(cmd + echo_cmd + "\n")
-        self.stdin.flush()
+        self._write(cmd + echo_cmd + "\n")
 
         shout = []
         sherr = []
-        signal.signal(signal.SIGALRM, self.timeout_handler)
-        signal.alarm(timeout)
+        deadline = time.monotonic() + timeout
         exit_status = 0
 
         try:
-            for line in self.stdout:
+            for line in self._readlines(deadline):
                 if ShellHandler.debug_cmd_execute:
                     print(f"Got line: {repr(line)}")
                 if str(line).endswith(cmd + "\r\n") or str(line).endswith(cmd + "\n"):
@@ -347,12 +1359,7 @@ class ShellHandler:
 
                 else:
                     # get rid of 'coloring and formatting' special characters
-                    shout.append(
-                        re.compile(r"(\x9B|\x1B\[)[0-?]*[ -/]*[@-~]")
-                        .sub("", line)
-                        .replace("\b", "")
-                        .replace("\r", "")
-                    )
+                    shout.append(self.clean_line(line))
                 if ShellHandler.debug_cmd_execute:
                     print(f"shout: {shout}")
                     print(f"sherr: {sherr}")
@@ -369,8 +1376,6 @@ class ShellHandler:
 
         except Exception as err:
             sherr.append(str(err))
-        finally:
-            signal.alarm(0)
 
         # first and last lines of shout/sherr contain a prompt
         if shout and echo_cmd in shout[-1]:
@@ -385,3 +1390,446 @@ class ShellHandler:
             print(f"returning shout: {shout}")
             print(f"returning sherr: {sherr}")
         return exit_status, shout, sherr
+
+
+class LocalShellHandler(ShellHandler):
+    """ShellHandler running the commands in a local bash on a pseudo terminal,
+       selected for the "localhost" host; it speaks the same protocol as the
+       SSH shell, so utils.py can be run and profiled without a remote host.
+    """
+
+    def _connect(self) -> None:
+        """Start the local interactive bash on a pseudo terminal
+
+        Args:
+            self: self
+        """
+        self.channel = PtyChannel()
+
+    def _disconnect(self) -> None:
+        """Terminate the local bash
+
+        Args:
+            self: self
+        """
+        self.channel.close()
+
+    def _open_exec_channel(self, cmd: str, timeout: float):
+        """Start cmd in a new local bash process
+
+        Args:
+            self:            self
+            cmd (str):       the command to execute
+            timeout (float): unused, the process is started right away
+
+        Returns:
+            LocalExecChannel: the channel running cmd
+        """
+        return LocalExecChannel("".join(s + "; " for s in self.shell_state) + cmd)
+
+    def put_file(self, local_path: str, remote_path: str) -> None:
+        """Copy a file
+
+        Args:
+            self:              self
+            local_path (str):  path of the file to copy
+            remote_path (str): destination path
+        """
+        if os.path.abspath(local_path) != os.path.abspath(remote_path):
+            shutil.copyfile(local_path, remote_path)
+
+    def is_connected(self) -> bool:
+        """Check that the local bash is still running
+
+        Args:
+            self: self
+
+        Returns:
+            bool: True if connected
+        """
+        return not self.channel.closed
+
+
+class PtyChannel:
+    def __init__(self) -> None:
+        """Fork an interactive bash on a pseudo terminal, 300 columns wide like
+           the SSH shell, with the terminal type paramiko requests
+
+        Args:
+            self: self
+        """
+        env = dict(os.environ, TERM="vt100", PS1="[\\u@\\h \\W]\\$ ")
+        self.pid, self.fd = pty.fork()
+        if self.pid == 0:
+            os.execvpe("bash", ["bash", "--norc", "--noprofile", "-i"], env)
+        fcntl.ioctl(self.fd, termios.TIOCSWINSZ, struct.pack("HHHH", 50, 300, 0, 0))
+        self.closed = False
+        # the escape sequences of the bracketed paste mode would end up in the
+        # echo of the commands; the output of this line is skipped as junk
+        # by the first command
+        self.sendall(b"bind 'set enable-bracketed-paste off' 2>/dev/null\n")
+
+    def fileno(self) -> int:
+        """Return the file descriptor to select on
+
+        Args:
+            self: self
+
+        Returns:
+            int: the pty master file descriptor
+        """
+        return self.fd
+
+    def recv(self, nbytes: int) -> bytes:
+        """Read the terminal output
+
+        Args:
+            self:         self
+            nbytes (int): maximum number of bytes to read
+
+        Returns:
+            bytes: the data read, empty once bash is gone
+        """
+        try:
+            data = os.read(self.fd, nbytes)
+        except OSError:
+            # EIO when bash has exited
+            data = b""
+        if not data:
+            self.closed = True
+        return data
+
+    def sendall(self, data: bytes) -> None:
+        """Type data on the terminal
+
+        Args:
+            self:          self
+            data (bytes):  the data to write
+        """
+        while data:
+            data = data[os.write(self.fd, data):]
+
+    def close(self) -> None:
+        """Terminate bash and close the terminal
+
+        Args:
+            self: self
+        """
+        if self.closed and self.fd is None:
+            return
+        self.closed = True
+        try:
+            os.kill(self.pid, signal.SIGKILL)
+            os.waitpid(self.pid, 0)
+        except OSError:
+            pass
+        os.close(self.fd)
+        self.fd = None
+
+
+class LocalExecChannel:
+    def __init__(self, cmd: str) -> None:
+        """Run cmd in a local bash, with the subset of the paramiko exec
+           channel API used by ShellHandler
+
+        Args:
+            self:      self
+            cmd (str): the command to execute
+        """
+        self.process = subprocess.Popen(
+            ["bash", "-c", cmd],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            start_new_session=True,
+        )
+        # data read ahead while checking for EOF, by stream
+        self.pending = {self.process.stdout: b"", self.process.stderr: b""}
+        self.eof = {self.process.stdout: False, self.process.stderr: False}
+
+    def _ready(self, pipe) -> bool:
+        """Check if a pipe has data, like paramiko a pipe at EOF is not ready
+
+        Args:
+            self: self
+            pipe: the stdout or stderr pipe of the process
+
+        Returns:
+            bool: True if there is data to read
+        """
+        if not self.pending[pipe] and not self.eof[pipe]:
+            readable, _, _ = select.select([pipe], [], [], 0)
+            if readable:
+                data = os.read(pipe.fileno(), 65536)
+                self.pending[pipe] = data
+                self.eof[pipe] = not data
+        return bool(self.pending[pipe])
+
+    def _recv(self, pipe, nbytes: int) -> bytes:
+        """Read a pipe, blocking until there is data or EOF
+
+        Args:
+            self:         self
+            pipe:         the stdout or stderr pipe of the process
+            nbytes (int): maximum number of bytes to read
+
+        Returns:
+            bytes: the data read, empty on EOF
+        """
+        if not self.pending[pipe] and not self.eof[pipe]:
+            select.select([pipe], [], [])
+            self._ready(pipe)
+        data = self.pending[pipe][:nbytes]
+        self.pending[pipe] = self.pending[pipe][nbytes:]
+        return data
+
+    def fileno(self) -> int:
+        """Return the file descriptor to select on
+
+        Args:
+            self: self
+
+        Returns:
+            int: stdout until its EOF, then stderr
+        """
+        if self.eof[self.process.stdout] and not self.eof[self.process.stderr]:
+            return self.process.stderr.fileno()
+        return self.process.stdout.fileno()
+
+    def sendall(self, data: bytes) -> None:
+        """Write data to the stdin of the command
+
+        Args:
+            self:          self
+            data (bytes):  the data to write
+        """
+        self.process.stdin.write(data)
+        self.process.stdin.flush()
+
+    def recv_ready(self) -> bool:
+        """Check if stdout can be read without blocking
+
+        Args:
+            self: self
+
+        Returns:
+            bool: True if stdout has data
+        """
+        return self._ready(self.process.stdout)
+
+    def recv_stderr_ready(self) -> bool:
+        """Check if stderr can be read without blocking
+
+        Args:
+            self: self
+
+        Returns:
+            bool: True if stderr has data
+        """
+        return self._ready(self.process.stderr)
+
+    def recv(self, nbytes: int) -> bytes:
+        """Read stdout
+
+        Args:
+            self:         self
+            nbytes (int): maximum number of bytes to read
+
+        Returns:
+            bytes: the data read, empty on EOF
+        """
+        return self._recv(self.process.stdout, nbytes)
+
+    def recv_stderr(self, nbytes: int) -> bytes:
+        """Read stderr
+
+        Args:
+            self:         self
+            nbytes (int): maximum number of bytes to read
+
+        Returns:
+            bytes: the data read, empty on EOF
+        """
+        return self._recv(self.process.stderr, nbytes)
+
+    @property
+    def eof_received(self) -> bool:
+        """Check if both stdout and stderr reached EOF
+
+        Args:
+            self: self
+
+        Returns:
+            bool: True on EOF
+        """
+        self.recv_ready()
+        self.recv_stderr_ready()
+        return all(self.eof.values())
+
+    def exit_status_ready(self) -> bool:
+        """Check if the command has exited
+
+        Args:
+            self: self
+
+        Returns:
+            bool: True if the exit status is available
+        """
+        return self.process.poll() is not None
+
+    def recv_exit_status(self) -> int:
+        """Wait for the command to exit
+
+        Args:
+            self: self
+
+        Returns:
+            int: the exit status
+        """
+        return self.process.wait()
+
+    def close(self) -> None:
+        """Kill the command if it is still running and release the pipes
+
+        Args:
+            self: self
+        """
+        if self.process.poll() is None:
+            try:
+                os.killpg(self.process.pid, signal.SIGKILL)
+            except OSError:
+                pass
+        self.process.wait()
+        self.process.stdin.close()
+        self.process.stdout.close()
+        self.process.stderr.close()
+
+
+def create_shell_handler(host: str, user: str, psw: str, name: str) -> ShellHandler:
+    """Create the shell handler matching the host
+
+    Args:
+        host (str): the SSH IP address or hostname, "localhost" for a local shell
+        user (str): the SSH username
+        psw (str):  the SSH password
+        name (str): the name of the ShellHandler object
+
+    Returns:
+        ShellHandler: a LocalShellHandler for localhost, a ShellHandler otherwise
+    """
+    if host == "localhost":
+        return LocalShellHandler(host, user, psw, name)
+    return ShellHandler(host, user, psw, name)
+
+
+class ShellHandlerPool:
+    def __init__(self) -> None:
+        """Init the pool of SSH sessions shared by the whole test session
+
+        Args:
+            self: self
+        """
+        self.handlers = {}
+        # creates the handlers, e.g. ReplayShellHandler to replay cassettes
+        self.factory = create_shell_handler
+
+    def get(self, host: str, user: str, psw: str, name: str) -> ShellHandler:
+        """Get a ShellHandler, connecting only when there is none, and
+           reconnecting a handler whose session is dead or stuck
+
+        Only the transport and the shell channel are checked, the shell is
+        probed when its last command timed out; check_health() probes every
+        handler, once per test.
+
+        The handlers are keyed by host, user and name, so that the DUT and the
+        trafficgen keep separate sessions even if they are the same server.
+
+        Args:
+            self:       self
+            host (str): the SSH IP address or hostname
+            user (str): the SSH username
+            psw (str):  the SSH password
+            name (str): the name of the ShellHandler object
+
+        Returns:
+            ShellHandler: an authenticated SSH session ready for commands
+        """
+        key = (host, user, name)
+        handler = self.handlers.get(key)
+        if handler is not None and not handler.is_ready():
+            print(f"{name}: ssh session to {host} is not healthy, reconnecting")
+            handler.reconnect()
+        if handler is None:
+            handler = self.factory(host, user, psw, name)
+            if ShellHandler.use_agent:
+                handler.start_agent()
+            self.handlers[key] = handler
+        return handler
+
+    def check_health(self) -> None:
+        """Probe the shell of every handler, and reconnect the handlers whose
+           session is dead or stuck, e.g. at the end of a test
+
+        Args:
+            self: self
+        """
+        for (host, _, name), handler in self.handlers.items():
+            if not handler.is_healthy():
+                print(f"{name}: ssh session to {host} is not healthy, reconnecting")
+                handler.reconnect()
+
+    def close_all(self) -> None:
+        """Close every SSH session of the pool
+
+        Args:
+            self: self
+        """
+        for handler in self.handlers.values():
+            handler.close()
+        self.handlers = {}
+
+
+class CommandStream:
+    def __init__(self, cmd: str, timeout: float, tail_lines: int) -> None:
+        """Init the stream of output lines returned by ShellHandler.execute_stream
+
+        Args:
+            self:             self
+            cmd (str):        the command being executed
+            timeout (float):  timeout for command to run
+            tail_lines (int): number of last lines kept in tail
+        """
+        self.cmd = cmd
+        self.timeout = timeout
+        # exit status of the command, known once the iteration is over
+        # (-1 on timeout or cancel)
+        self.exit_status = None
+        # the last lines of output, so that the stream uses bounded memory
+        self.tail = collections.deque(maxlen=tail_lines)
+        self.err = []
+        self.cancelled = False
+        self.lines = iter(())
+
+    def __iter__(self):
+        """Iterate over the output lines; leaving the loop early cancels the
+           command
+
+        Args:
+            self: self
+
+        Yields:
+            str: the next output line
+        """
+        try:
+            yield from self.lines
+        finally:
+            self.lines.close()
+
+    def cancel(self) -> None:
+        """Interrupt the command; the iteration stops after the current line
+
+        Args:
+            self: self
+        """
+        self.cancelled = True
+        self.lines.close()
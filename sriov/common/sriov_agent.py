@@ -0,0 +1,200 @@
+"""Helper agent uploaded to the DUT and the trafficgen by RemoteAgent
+
+It reads one JSON request per line on stdin, {"id": 1, "method": "...",
+"params": {...}}, and writes one JSON response per line on stdout,
+{"id": 1, "result": ...} or {"id": 1, "error": "..."}.
+
+This file runs on the remote host: it must only use the python3 standard
+library and stay compatible with the platform python of RHEL 8 (3.6).
+"""
+import json
+import os
+import subprocess
+import sys
+
+
+def run(cmd: list) -> str:
+    """Run a command on the host
+
+    Args:
+        cmd (list): the command and its arguments
+
+    Returns:
+        str: the stdout of the command
+
+    Raises:
+        Exception: the command failed
+    """
+    proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if proc.returncode != 0:
+        raise Exception(proc.stderr.decode(errors="replace").strip())
+    return proc.stdout.decode(errors="replace")
+
+
+def ping() -> str:
+    """Check that the agent answers
+
+    Returns:
+        str: "pong"
+    """
+    return "pong"
+
+
+def read_sysfs(path: str) -> str:
+    """Read a sysfs attribute
+
+    Args:
+        path (str): path of the attribute
+
+    Returns:
+        str: the content of the attribute, without the trailing newline
+    """
+    with open(path) as f:
+        return f.read().rstrip("\n")
+
+
+def write_sysfs(path: str, value: str) -> bool:
+    """Write a sysfs attribute
+
+    Args:
+        path (str):  path of the attribute
+        value (str): value to write
+
+    Returns:
+        True: on success
+    """
+    with open(path, "w") as f:
+        f.write(value)
+    return True
+
+
+def readlink(path: str) -> str:
+    """Resolve a sysfs link, e.g. /sys/class/net/<interface>/device
+
+    Args:
+        path (str): path of the link
+
+    Returns:
+        str: the last component of the link target, e.g. a PCI address
+    """
+    return os.path.basename(os.readlink(path))
+
+
+def exists(paths: list) -> list:
+    """Check if paths exist
+
+    Args:
+        paths (list): paths to check
+
+    Returns:
+        list: a bool per path
+    """
+    return [os.path.exists(path) for path in paths]
+
+
+def modprobe(module: str) -> bool:
+    """Load a kernel module, unless its PCI driver is already registered
+
+    Args:
+        module (str): module name, example "vfio-pci"
+
+    Returns:
+        True: on success
+    """
+    if not os.path.isdir("/sys/bus/pci/drivers/" + module):
+        run(["modprobe", module])
+    return True
+
+
+def list_vfs(interface: str) -> list:
+    """List the VFs of a PF with their properties, from ip -json
+
+    Args:
+        interface (str): PF interface name
+
+    Returns:
+        list: a dict per VF, with at least "vf" (int) and "mac" (str)
+    """
+    links = json.loads(run(["ip", "-json", "-details", "link", "show", interface]))
+    vfs = []
+    for vf in links[0].get("vfinfo_list", []):
+        vf = dict(vf)
+        # the MAC is "address" with recent iproute2, "mac" with older ones
+        vf["mac"] = vf.get("address", vf.get("mac"))
+        vfs.append(vf)
+    return vfs
+
+
+def set_vf(interface: str, vf: int, props: list) -> bool:
+    """Set VF properties with ip link
+
+    Args:
+        interface (str): PF interface name
+        vf (int):        VF ID
+        props (list):    [name, value] pairs, example [["mac", "..."]]
+
+    Returns:
+        True: on success
+    """
+    cmd = ["ip", "link", "set", interface, "vf", str(vf)]
+    for name, value in props:
+        cmd += [str(name), str(value)]
+    run(cmd)
+    return True
+
+
+def bind_driver(pci: str, driver: str) -> bool:
+    """Bind a PCI device to a driver, in the same steps as utils.bind_driver
+
+    Args:
+        pci (str):    PCI address, example "0000:17:00.0"
+        driver (str): driver name, example "vfio-pci"
+
+    Returns:
+        True: on success
+    """
+    device_path = "/sys/bus/pci/devices/" + pci
+    modprobe(driver)
+    write_sysfs(device_path + "/driver/unbind", pci)
+    write_sysfs(device_path + "/driver_override", driver)
+    write_sysfs("/sys/bus/pci/drivers/{}/bind".format(driver), pci)
+    return True
+
+
+METHODS = {
+    method.__name__: method
+    for method in (
+        ping,
+        read_sysfs,
+        write_sysfs,
+        readlink,
+        exists,
+        modprobe,
+        list_vfs,
+        set_vf,
+        bind_driver,
+    )
+}
+
+
+def main() -> None:
+    """Answer the requests until stdin is closed"""
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        request = {}
+        try:
+            request = json.loads(line)
+            method = METHODS.get(request.get("method"))
+            if method is None:
+                raise Exception("unknown method {}".format(request.get("method")))
+            response = {"result": method(**request.get("params", {}))}
+        except Exception as err:
+            response = {"error": "{}: {}".format(type(err).__name__, err)}
+        response["id"] = request.get("id")
+        sys.stdout.write(json.dumps(response) + "\n")
+        sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    main()
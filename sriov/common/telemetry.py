@@ -0,0 +1,353 @@
+import collections
+import json
+import shlex
+import threading
+from sriov.common.exec import ShellHandler
+from sriov.common.testpmd import PortCounters
+
+
+# directory of the DPDK runtime files, one sub-directory per --file-prefix
+RUNTIME_DIR = "/var/run/dpdk"
+# the --file-prefix of a DPDK process started without it
+DEFAULT_FILE_PREFIX = "rte"
+# counters of /ethdev/stats sampled by default
+STATS_COUNTERS = (
+    "ipackets",
+    "opackets",
+    "ibytes",
+    "obytes",
+    "imissed",
+    "ierrors",
+    "oerrors",
+    "rx_nombuf",
+)
+
+# Sampler run with python3 where the telemetry socket is, e.g. in the testpmd
+# container. It takes a JSON argument, {"socket": ..., "ports": [...] or None
+# for all, "stats": [...], "xstats": [...], "interval": ..., "count": ... or 0
+# until "duration" seconds}, prints a header line {"ports": [...],
+# "counters": [...]}, then a line per sample [timestamp, [values of port 0],
+# [values of port 1], ...] with the counters in the order of the header.
+# It must stay compatible with the platform python of RHEL 8 (3.6).
+TELEMETRY_SAMPLER = r"""
+import json, socket, sys, time
+args = json.loads(sys.argv[1])
+sock = socket.socket(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+sock.connect(args["socket"])
+size = json.loads(sock.recv(1024).decode()).get("max_output_len", 16384)
+
+def query(cmd):
+    sock.send(cmd.encode())
+    return json.loads(sock.recv(size).decode()).get(cmd.split(",")[0]) or {}
+
+ports = args["ports"] if args["ports"] is not None else query("/ethdev/list")
+print(json.dumps({"ports": ports, "counters": args["stats"] + args["xstats"]}))
+start = time.monotonic()
+due = start
+count = 0
+while count < args["count"] or not args["count"]:
+    sample = [round(time.monotonic(), 6)]
+    for port in ports:
+        stats = query("/ethdev/stats,{}".format(port)) if args["stats"] else {}
+        xstats = query("/ethdev/xstats,{}".format(port)) if args["xstats"] else {}
+        sample.append(
+            [stats.get(name) for name in args["stats"]]
+            + [xstats.get(name) for name in args["xstats"]]
+        )
+    print(json.dumps(sample, separators=(",", ":")))
+    count += 1
+    due += args["interval"]
+    if due - start > args["duration"]:
+        break
+    time.sleep(max(due - time.monotonic(), 0))
+"""
+
+
+class TelemetryStats(PortCounters):
+    """Counters of a port read from the DPDK telemetry socket"""
+
+    rx_packets_counter = "ipackets"
+    tx_packets_counter = "opackets"
+    rx_bytes_counter = "ibytes"
+    tx_bytes_counter = "obytes"
+
+
+class TelemetrySeries:
+    def __init__(self, ports: list, counters: list, maxlen: int = None) -> None:
+        """Init the time series of the counters sampled by a TelemetryClient
+
+        A sample is kept as a tuple of values per port, in the order of
+        counters, rather than as a dict per port and sample.
+
+        Args:
+            self:            self
+            ports (list):    port IDs (int)
+            counters (list): counter names
+            maxlen (int):    number of last samples kept, None to keep all
+                             (default None)
+        """
+        self.ports = ports
+        self.counters = counters
+        self.timestamps = collections.deque(maxlen=maxlen)
+        self.values = collections.deque(maxlen=maxlen)
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    def append(self, timestamp: float, values: list) -> None:
+        """Add a sample
+
+        Args:
+            self:              self
+            timestamp (float): time.monotonic() value of the sampler
+            values (list):     list of the counter values per port, in the
+                               order of ports
+        """
+        self.values.append(tuple(tuple(port) for port in values))
+        self.timestamps.append(timestamp)
+
+    def sample(self, index: int = -1) -> dict:
+        """Get a sample
+
+        Args:
+            self:        self
+            index (int): index of the sample (default -1, the last one)
+
+        Returns:
+            dict: TelemetryStats by port ID
+        """
+        timestamp = self.timestamps[index]
+        return {
+            port: TelemetryStats(port, dict(zip(self.counters, values)), timestamp)
+            for port, values in zip(self.ports, self.values[index])
+        }
+
+    def rates(self, port: int) -> list:
+        """Compute the rates of a port between the consecutive samples
+
+        Args:
+            self:       self
+            port (int): port ID
+
+        Returns:
+            list: StatsRates per pair of consecutive samples
+        """
+        samples = [self.sample(index)[port] for index in range(len(self))]
+        return [
+            current.rates(previous) for previous, current in zip(samples, samples[1:])
+        ]
+
+    def last_rates(self) -> dict:
+        """Compute the rates between the last two samples
+
+        Args:
+            self: self
+
+        Returns:
+            dict: StatsRates by port ID, empty with less than two samples
+        """
+        if len(self) < 2:
+            return {}
+        previous = self.sample(-2)
+        return {
+            port: stats.rates(previous[port]) for port, stats in self.sample().items()
+        }
+
+
+class TelemetryClient:
+    def __init__(
+        self,
+        ssh_obj: ShellHandler,
+        container: str = None,
+        file_prefix: str = DEFAULT_FILE_PREFIX,
+        container_manager: str = "podman",
+        stats: tuple = STATS_COUNTERS,
+        xstats: tuple = (),
+        runtime_dir: str = RUNTIME_DIR,
+    ) -> None:
+        """Init the client of the telemetry socket of a DPDK process
+
+        The counters are read by a sampler run with python3 in the container
+        of the DPDK process, or on the host when container is None, so no
+        keystroke is sent to testpmd.
+
+        Args:
+            self:                    self
+            ssh_obj (ShellHandler):  ssh connection obj of the host
+            container (str):         name or ID of the container of the DPDK
+                                     process, None if it runs on the host
+                                     (default None)
+            file_prefix (str):       --file-prefix of the DPDK process
+                                     (default "rte")
+            container_manager (str): podman or docker (default "podman")
+            stats (tuple):           counters of /ethdev/stats to sample
+                                     (default STATS_COUNTERS)
+            xstats (tuple):          counters of /ethdev/xstats to sample,
+                                     e.g. ("rx_good_packets",) (default ())
+            runtime_dir (str):       DPDK runtime directory
+                                     (default "/var/run/dpdk")
+        """
+        self.ssh_obj = ssh_obj
+        self.container = container
+        self.container_manager = container_manager
+        self.socket = f"{runtime_dir}/{file_prefix}/dpdk_telemetry.v2"
+        self.stats = list(stats)
+        self.xstats = list(xstats)
+        self.series = None
+        self._stream = None
+        self._thread = None
+        self._subshell = None
+        self._error = None
+
+    def command(
+        self, interval: float, count: int, duration: float, ports: list = None
+    ) -> str:
+        """Get the command running the sampler
+
+        Args:
+            self:             self
+            interval (float): seconds between the samples
+            count (int):      number of samples, 0 for no limit
+            duration (float): seconds after which the sampler stops
+            ports (list):     port IDs, None for all the ports (default None)
+
+        Returns:
+            str: the command
+        """
+        args = {
+            "socket": self.socket,
+            "ports": ports,
+            "stats": self.stats,
+            "xstats": self.xstats,
+            "interval": interval,
+            "count": count,
+            "duration": duration,
+        }
+        cmd = "python3 -u -c {} {}".format(
+            shlex.quote(TELEMETRY_SAMPLER), shlex.quote(json.dumps(args))
+        )
+        if self.container is not None:
+            cmd = f"{self.container_manager} exec -i {self.container} {cmd}"
+        return cmd
+
+    def _read(self, stream, maxlen: int = None) -> None:
+        """Read the output of the sampler into self.series
+
+        Args:
+            self:          self
+            stream:        CommandStream of the sampler
+            maxlen (int):  number of last samples kept, None to keep all
+
+        Raises:
+            Exception: the sampler failed, e.g. no telemetry socket
+        """
+        for line in stream:
+            try:
+                data = json.loads(line)
+            except ValueError:
+                raise Exception(f"telemetry sampler: {line.strip()}")
+            if self.series is None:
+                self.series = TelemetrySeries(data["ports"], data["counters"], maxlen)
+            else:
+                self.series.append(data[0], data[1:])
+        if self.series is None:
+            raise Exception(
+                f"telemetry sampler failed: {''.join(stream.err + list(stream.tail))}"
+            )
+
+    def sample(
+        self, count: int = 2, interval: float = 1.0, ports: list = None
+    ) -> TelemetrySeries:
+        """Sample the counters, and wait for the samples
+
+        Args:
+            self:             self
+            count (int):      number of samples (default 2)
+            interval (float): seconds between the samples (default 1.0)
+            ports (list):     port IDs, None for all the ports (default None)
+
+        Returns:
+            TelemetrySeries: the samples
+
+        Raises:
+            Exception: the sampler failed, e.g. no telemetry socket
+        """
+        duration = count * interval
+        self.series = None
+        stream = self.ssh_obj.execute_stream(
+            self.command(interval, count, duration, ports), duration + 10
+        )
+        self._read(stream)
+        return self.series
+
+    def start(
+        self,
+        interval: float = 1.0,
+        duration: float = 3600,
+        ports: list = None,
+        maxlen: int = None,
+    ) -> None:
+        """Sample the counters in the background, until stop() or duration
+
+        The sampler runs in a subshell of ssh_obj, which stays free for the
+        test; the samples accumulate in self.series.
+
+        Args:
+            self:             self
+            interval (float): seconds between the samples (default 1.0)
+            duration (float): seconds after which the sampler stops
+                              (default 3600)
+            ports (list):     port IDs, None for all the ports (default None)
+            maxlen (int):     number of last samples kept, None to keep all
+                              (default None)
+        """
+        self.series = None
+        self._error = None
+        self._subshell = self.ssh_obj.open_subshell()
+        self._stream = self._subshell.execute_stream(
+            self.command(interval, 0, duration, ports), duration + 10
+        )
+
+        def read():
+            try:
+                self._read(self._stream, maxlen)
+            except Exception as err:
+                self._error = err
+
+        self._thread = threading.Thread(target=read, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> TelemetrySeries:
+        """Stop the background sampling
+
+        Args:
+            self: self
+
+        Returns:
+            TelemetrySeries: the samples
+
+        Raises:
+            Exception: the sampler failed, e.g. no telemetry socket
+        """
+        # the reading thread stops after the next sample
+        self._stream.cancelled = True
+        self._thread.join()
+        self._subshell.close()
+        self._stream = self._thread = self._subshell = None
+        if self._error is not None:
+            raise self._error
+        return self.series
+
+    def rates(self) -> dict:
+        """Compute the rates between the last two samples of the background
+           sampling
+
+        Args:
+            self: self
+
+        Returns:
+            dict: StatsRates by port ID, empty with less than two samples
+        """
+        if self.series is None:
+            return {}
+        return self.series.last_rates()
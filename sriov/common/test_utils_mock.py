@@ -1,9 +1,12 @@
+from concurrent.futures import Future
 from mock import Mock, patch
 from sriov.common.utils import (
     set_vf_mac,
     verify_vf_address,
     get_pci_address,
     bind_driver,
+    bind_drivers,
+    bind_drivers_cmd,
     get_driver,
     config_interface,
     clear_interface,
@@ -16,17 +19,54 @@ from sriov.common.utils import (
     reset_mtu,
     start_tmux,
     stop_tmux,
+    stop_testpmd_in_tmux_prefix,
+    wait_tmux_testpmd_ready,
     get_intf_mac,
     get_vf_mac,
     vfs_created,
     create_vfs,
+    set_numvfs,
     no_zero_macs_pf,
     no_zero_macs_vf,
     set_pipefail,
     execute_until_timeout,
     calc_required_pages_2M,
     get_nic_model,
+    get_driver_pci,
+    run_in_parallel,
+    execute_and_assert_parallel,
+    VfConfig,
+    VfStateSnapshot,
+    wait_until,
+    read_trafficgen_result,
 )  # noqa: E402
+from sriov.common.agent import AgentError
+from sriov.common.cassette import (
+    CassetteError,
+    CassettePlayer,
+    CassetteRecorder,
+    ReplayShellHandler,
+)
+from sriov.common.containers import ContainerManager, ContainerPool, helper_name
+from sriov.common.exec import LocalShellHandler, ShellHandler, ShellHandlerPool
+from sriov.common.testpmd import (
+    ALL_PORTS,
+    TestPmdInstance,
+    TestPmdSession,
+    launch_testpmd_instances,
+    parse_fwd_stats,
+    parse_port_stats,
+    parse_xstats,
+)
+from sriov.common.telemetry import TelemetryClient
+from sriov.common.timing import TIMING
+from sriov.common.topology import PfTopology, TopologyCache
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
 import unittest
 
 
@@ -34,9 +74,70 @@ class UtilsTest(unittest.TestCase):
     def create_mock_ssh_obj(self, code=0, out="", err=""):
         ssh_obj = Mock()
         ssh_obj.name = "mock"
+        ssh_obj.agent = None
         ssh_obj.execute.return_value = code, out, err
+
+        def execute_batch(cmds, timeout=5, stop_on_error=False, delay=0):
+            if stop_on_error and code != 0:
+                return [(code, out, err)]
+            return [(code, out, err) for cmd in cmds]
+
+        ssh_obj.execute_batch.side_effect = execute_batch
+        submitted = []
+
+        def submit(cmd, timeout=5):
+            submitted.append(Future())
+            return submitted[-1]
+
+        def flush(stop_on_error=False, delay=0):
+            futures = list(submitted)
+            submitted.clear()
+            for index, future in enumerate(futures):
+                if stop_on_error and code != 0 and index > 0:
+                    future.cancel()
+                else:
+                    future.set_result((code, out, err))
+            return futures
+
+        ssh_obj.submit.side_effect = submit
+        ssh_obj.flush.side_effect = flush
         return ssh_obj
 
+    def count_round_trips(self, ssh_obj, call):
+        """Run call, and count the writes to the shell of ssh_obj and the round
+           trips, i.e. the writes followed by a read waiting for their answer
+
+        Args:
+            self:    self
+            ssh_obj: LocalShellHandler obj
+            call:    function without arguments
+
+        Returns:
+            tuple: the return value of call, the number of writes and the
+                   number of round trips
+        """
+        ops = []
+        channel = ssh_obj.channel
+        sendall, recv = channel.sendall, channel.recv
+
+        def counted_sendall(data):
+            ops.append("write")
+            return sendall(data)
+
+        def counted_recv(nbytes):
+            ops.append("read")
+            return recv(nbytes)
+
+        with patch.object(channel, "sendall", counted_sendall):
+            with patch.object(channel, "recv", counted_recv):
+                result = call()
+        round_trips = sum(
+            1
+            for op, next_op in zip(ops, ops[1:])
+            if op == "write" and next_op == "read"
+        )
+        return result, ops.count("write"), round_trips
+
     def create_mock_testdata(self):
         testdata = Mock()
         testdata.ping = {}
@@ -50,6 +151,177 @@ class UtilsTest(unittest.TestCase):
     def test_bind_driver(self):
         ssh_obj = self.create_mock_ssh_obj()
         assert bind_driver(ssh_obj, "0000:00:00.0", "vfio-pci") is True
+        assert ssh_obj.submit.call_count == 4
+        ssh_obj.flush.assert_called_once_with(stop_on_error=True)
+        ssh_obj.execute.assert_not_called()
+
+        ssh_obj = self.create_mock_ssh_obj(1, "", "no such device")
+        with self.assertRaisesRegex(Exception, "no such device"):
+            bind_driver(ssh_obj, "0000:00:00.0", "vfio-pci")
+
+    def test_launch_testpmd_instances(self):
+        instances = [
+            TestPmdInstance(f"testpmd{i}", f"tmux{i}", "testpmd -i", f"0000:00:0{i}.0")
+            for i in range(3)
+        ]
+        ssh_obj = self.create_mock_ssh_obj(
+            0,
+            [f"bind {instance.pci} vfio-pci 0 900\n" for instance in instances],
+            [],
+        )
+        ssh_obj.execute_stream.return_value = [
+            "tmux1 ready 1500000\n",
+            "tmux0 ready 2000000\n",
+            "tmux2 ready 2500000\n",
+        ]
+        assert launch_testpmd_instances(ssh_obj, instances) is True
+        # one command binds the devices, one batch starts the sessions
+        ssh_obj.execute.assert_called_once()
+        assert "b 0000:00:02.0 vfio-pci;" in ssh_obj.execute.call_args[0][0]
+        assert len(ssh_obj.execute_batch.call_args[0][0]) == 3 * 5
+        # one command waits for all the sessions
+        ssh_obj.execute_stream.assert_called_once()
+        assert "for s in tmux0 tmux1 tmux2;" in ssh_obj.execute_stream.call_args[0][0]
+        assert [instance.ready_time for instance in instances] == [2, 1.5, 2.5]
+
+        ssh_obj.execute_stream.return_value = ["tmux1 exited\n"]
+        assert launch_testpmd_instances(ssh_obj, [instances[1]], None) is False
+        assert len(ssh_obj.execute_batch.call_args[0][0]) == 5
+        # no bind without a driver
+        ssh_obj.execute.assert_called_once()
+        assert instances[1].ready_time is None
+
+    def test_wait_tmux_testpmd_ready(self):
+        ssh_obj = self.create_mock_ssh_obj()
+        ssh_obj.execute_stream.return_value = ["tmux ready 120\n"]
+        assert wait_tmux_testpmd_ready(ssh_obj, "tmux", 15) is True
+        ssh_obj.execute_stream.return_value = ["tmux timeout\n"]
+        assert wait_tmux_testpmd_ready(ssh_obj, "tmux", 15) is False
+
+    def test_topology_cache(self):
+        out = [
+            "boot 1111\n",
+            "intf eth0 0000:17:00.0 ice 0 256 8 1 0x8086 0x1592\n",
+            "intf eth1 0000:17:00.1 ice 0 256 135 1 0x8086 0x1592\n",
+            "missing eth2\n",
+            "lshw pci@0000:17:00.0  eth0  network  Ethernet Controller E810-C\n",
+        ]
+        ssh_obj = self.create_mock_ssh_obj(0, out, [])
+        ssh_obj.host = "dut"
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "topology.json")
+            topology = TopologyCache(path).get(ssh_obj, ["eth0", "eth1"])
+            eth0 = topology.interfaces["eth0"]
+            assert eth0.pci == "0000:17:00.0"
+            assert eth0.driver == "ice"
+            assert eth0.total_vfs == 256
+            assert eth0.model == "Ethernet Controller E810-C"
+            assert eth0.vf_pci(0) == "0000:17:01.0"
+            assert topology.interfaces["eth1"].vf_pci(1) == "0000:17:11.1"
+            assert topology.interfaces["eth1"].model is None
+            with self.assertRaises(Exception):
+                TopologyCache(path).get(ssh_obj, ["eth2"])
+
+            # a new session on the same boot only reads the boot ID
+            ssh_obj = self.create_mock_ssh_obj(0, ["1111\n"], [])
+            ssh_obj.host = "dut"
+            cache = TopologyCache(path)
+            topology = cache.get(ssh_obj, ["eth0", "eth1"])
+            assert topology.interfaces["eth1"].pci == "0000:17:00.1"
+            cache.get(ssh_obj, ["eth0"])
+            ssh_obj.execute.assert_called_once()
+
+            # after a reboot, the topology is read again
+            out[0] = "boot 2222\n"
+            out[1] = "intf eth0 0000:18:00.0 ice 1 256 8 1 0x8086 0x1592\n"
+            ssh_obj = self.create_mock_ssh_obj(0, out, [])
+            ssh_obj.host = "dut"
+            topology = TopologyCache(path).get(ssh_obj, ["eth0", "eth1"])
+            assert topology.boot_id == "2222"
+            assert topology.interfaces["eth0"].numa_node == 1
+            assert ssh_obj.execute.call_count == 2
+
+        # no VF offset and stride
+        assert PfTopology("eth0", "0000:17:00.0").vf_pci(0) is None
+
+    def test_topology_refresh(self):
+        out = ["boot 1111\n", "intf eth0 0000:17:00.0 ice 0 256 - - 0x8086 0x1592\n"]
+        ssh_obj = self.create_mock_ssh_obj(0, out, [])
+        ssh_obj.host = "dut"
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "topology.json")
+            cache = TopologyCache(path)
+            # no VF yet, the offset and stride are unknown
+            assert cache.get(ssh_obj, ["eth0"]).interfaces["eth0"].vf_pci(0) is None
+
+            out[1] = "intf eth0 0000:17:00.0 ice 0 256 8 1 0x8086 0x1592\n"
+            topology = cache.refresh(ssh_obj, ["eth0"])
+            assert topology.interfaces["eth0"].vf_pci(0) == "0000:17:01.0"
+            assert cache.get(ssh_obj, ["eth0"]) is topology
+            # the next sessions of the same boot get them from the file
+            ssh_obj = self.create_mock_ssh_obj(0, ["1111\n"], [])
+            ssh_obj.host = "dut"
+            topology = TopologyCache(path).get(ssh_obj, ["eth0"])
+            assert topology.interfaces["eth0"].vf_pci(1) == "0000:17:01.1"
+
+    def test_topology_cache_parallel(self):
+        out = ["boot 1111\n", "intf eth0 0000:17:00.0 ice 0 256 8 1 0x8086 0x1592\n"]
+
+        def slow_execute(cmd, timeout=5):
+            time.sleep(0.3)
+            return 0, out, []
+
+        hosts = []
+        for host in ("dut", "trafficgen", "dut"):
+            ssh_obj = self.create_mock_ssh_obj()
+            ssh_obj.host = host
+            ssh_obj.execute.side_effect = slow_execute
+            hosts.append(ssh_obj)
+        cache = TopologyCache(None)
+        start = time.monotonic()
+        run_in_parallel(*[lambda s=s: cache.get(s, ["eth0"]) for s in hosts])
+        # the hosts are read at the same time, and a host only once
+        assert time.monotonic() - start < 0.55
+        assert sum(s.execute.call_count for s in hosts) == 2
+
+    def test_container_manager(self):
+        ssh_obj = self.create_mock_ssh_obj(
+            0, ["present img1\n", "pulled img2\n", "bogus\n"], ""
+        )
+        containers = ContainerManager(ssh_obj, "podman", "-v /sys:/sys")
+        status = containers.preflight(["img1", "img2", "img3"])
+        assert status == {"img1": "present", "img2": "pulled", "img3": "missing"}
+        # one command checks all the images
+        ssh_obj.execute.assert_called_once()
+
+        # the helper starts on the first use, and runs the entrypoint
+        ssh_obj.execute.return_value = 0, ['["/entry", "a b"]\n', "id\n"], ""
+        cmd = containers.command("quay.io/trafficgen:v1", "client status")
+        name = helper_name("quay.io/trafficgen:v1")
+        assert name == "sriov_helper_quay.io_trafficgen_v1"
+        assert cmd == f"podman exec {name} /entry 'a b' client status"
+        assert "--entrypoint tail" in ssh_obj.execute.call_args[0][0]
+        ssh_obj.execute.return_value = 0, ["0000:00:01.0 bound\n"], ""
+        assert containers.run("quay.io/trafficgen:v1", "client stop")[0] == 0
+        assert ssh_obj.execute.call_args[0][0].startswith(f"podman exec {name} ")
+        assert containers.saved_time() > 0
+        containers.close()
+        assert ssh_obj.execute.call_args[0][0].startswith(f"podman kill {name}")
+
+        # no helper, each command runs a new container
+        ssh_obj.execute.return_value = 125, [], ["no such image\n"]
+        cmd = containers.command("img", "dpdk-devbind.py -s")
+        # with the volumes of the helpers, e.g. /sys for dpdk-devbind.py
+        assert cmd == "podman run --rm --privileged -v /sys:/sys img dpdk-devbind.py -s"
+        cmd = containers.command("img", "client status", "--net host")
+        assert cmd == "podman run --rm --net host img client status"
+        assert containers.saved_time() == 0
+
+        settings = Mock()
+        settings.config = {"container_manager": "docker"}
+        pool = ContainerPool()
+        assert pool.get(ssh_obj, settings) is pool.get(ssh_obj, settings)
+        assert pool.get(ssh_obj, settings).manager == "docker"
 
     def test_get_driver(self):
         ssh_obj = self.create_mock_ssh_obj(0, ["ice"], "")
@@ -126,53 +398,678 @@ class UtilsTest(unittest.TestCase):
         ssh_obj = self.create_mock_ssh_obj()
         assert stop_tmux(ssh_obj, "tmux") is True
 
+    def test_stop_testpmd_in_tmux_prefix(self):
+        prefix = f"sriov_test_{os.getpid()}_"
+        ssh_obj = LocalShellHandler("localhost", "root", None, "local")
+        try:
+            fake_testpmd = "'while read -r cmd; do [ $cmd = quit ] && exit; done'"
+            for name, cmd in [
+                (prefix + "0", f"bash -c {fake_testpmd}"),
+                (prefix + "1", "sleep 30"),
+                (prefix + "other", f"bash -c {fake_testpmd}"),
+            ]:
+                code, _, err = ssh_obj.execute(f"tmux new-session -d -s {name} {cmd}")
+                assert code == 0, err
+            start = time.monotonic()
+            stopped = stop_testpmd_in_tmux_prefix(ssh_obj, prefix, 0.5)
+            assert sorted(stopped) == [prefix + "0", prefix + "1"]
+            # sleep ignores quit, its session is killed after the timeout
+            assert 0.5 <= time.monotonic() - start < 5
+            code, out, _ = ssh_obj.execute("tmux ls -F '#S'")
+            assert prefix + "0\n" not in out and prefix + "1\n" not in out
+            assert prefix + "other\n" in out
+            assert stop_testpmd_in_tmux_prefix(ssh_obj, prefix) == []
+        finally:
+            ssh_obj.execute(f"tmux kill-session -t ={prefix}other")
+            ssh_obj.close()
+
     def test_get_intf_mac(self):
         ssh_obj = self.create_mock_ssh_obj(0, ["aa:bb:cc:dd:ee:00"], "")
         assert get_intf_mac(ssh_obj, "eth0") == "aa:bb:cc:dd:ee:00"
 
+    def ip_link_json(self, pf_mac="aa:bb:cc:dd:ee:ff", vf_macs=("aa:bb:cc:dd:ee:00",)):
+        """Output of "ip -j -d link show": eth0 with a VF per MAC of vf_macs,
+           and the netdev of each VF"""
+        vfs = [
+            {
+                "vf": vf,
+                "address": mac,
+                "vlan_list": [{"vlan": 10, "qos": 5, "protocol": "802.1Q"}],
+                "rate": {"max_tx": 10, "min_tx": 0},
+                "spoofchk": True,
+                "link_state": "auto",
+                "trust": False,
+            }
+            for vf, mac in enumerate(vf_macs)
+        ]
+        links = [{"ifname": "eth0", "address": pf_mac, "vfinfo_list": vfs}] + [
+            {"ifname": f"eth0v{vf}", "address": mac} for vf, mac in enumerate(vf_macs)
+        ]
+        return [line + "\n" for line in json.dumps(links, indent=1).splitlines()]
+
     def test_get_vf_mac(self):
-        ssh_obj = self.create_mock_ssh_obj(0, ["aa:bb:cc:dd:ee:00"], "")
+        ssh_obj = self.create_mock_ssh_obj(0, self.ip_link_json(), "")
         assert get_vf_mac(ssh_obj, "eth0", 0) == "aa:bb:cc:dd:ee:00"
+        with self.assertRaises(ValueError):
+            get_vf_mac(ssh_obj, "eth0", 1)
 
-    @patch("sriov.common.utils.get_intf_mac")
-    def test_set_vf_mac(self, mock_get_intf_mac):
-        ssh_obj = self.create_mock_ssh_obj()
-        mock_get_intf_mac.return_value = "aa:bb:cc:dd:ee:00"
+    def test_vf_state_snapshot(self):
+        ssh_obj = self.create_mock_ssh_obj(
+            0, self.ip_link_json(vf_macs=("aa:bb:cc:dd:ee:00", "00:00:00:00:00:00")), ""
+        )
+        snapshot = VfStateSnapshot.take(ssh_obj)
+        ssh_obj.execute.assert_called_once_with("ip -j -d link show", 5)
+        vf = snapshot.vf("eth0", 0)
+        assert (vf.mac, vf.vlan, vf.qos, vf.vlan_proto) == (
+            "aa:bb:cc:dd:ee:00",
+            10,
+            5,
+            "802.1Q",
+        )
+        assert vf.spoofchk is True and vf.trust is False and vf.link_state == "auto"
+        assert (vf.max_tx_rate, vf.min_tx_rate) == (10, 0)
+        assert snapshot.address("eth0v1") == "00:00:00:00:00:00"
+        assert snapshot.vf("eth0", 2) is None and snapshot.vf("eth1", 0) is None
+
+        # older iproute2
+        snapshot = VfStateSnapshot(
+            [
+                {
+                    "ifname": "eth0",
+                    "vfinfo_list": [
+                        {"vf": 0, "mac": "aa:bb:cc:dd:ee:00", "vlan": 10, "tx_rate": 5}
+                    ],
+                }
+            ]
+        )
+        vf = snapshot.vf("eth0", 0)
+        assert vf.mac == "aa:bb:cc:dd:ee:00" and vf.vlan == 10 and vf.qos == 0
+        assert vf.max_tx_rate == 5
+
+    def test_agent_helpers(self):
+        ssh_obj = self.create_mock_ssh_obj(0, ["shell output"], "")
+        ssh_obj.agent = Mock()
+        ssh_obj.agent.call.return_value = "0000:17:00.0"
+        assert get_pci_address(ssh_obj, "eth0") == "0000:17:00.0"
+        ssh_obj.agent.call.assert_called_once_with(
+            "readlink", path="/sys/class/net/eth0/device"
+        )
+
+        ssh_obj.agent.call.return_value = [
+            {"vf": 0, "mac": "aa:bb:cc:dd:ee:00"},
+            {"vf": 1, "mac": "aa:bb:cc:dd:ee:01"},
+        ]
+        assert get_vf_mac(ssh_obj, "eth0", 1) == "aa:bb:cc:dd:ee:01"
+        with self.assertRaises(ValueError):
+            get_vf_mac(ssh_obj, "eth0", 2)
+
+        ssh_obj.agent.call.return_value = [False, True]
+        assert get_driver_pci(ssh_obj, "0000:17:00.0") == "ice"
+
+        ssh_obj.agent.call.return_value = True
+        assert bind_driver(ssh_obj, "0000:17:00.0", "vfio-pci") is True
+        ssh_obj.execute.assert_not_called()
+
+        # the helpers fall back to shell commands when the agent fails
+        ssh_obj.agent.call.side_effect = AgentError("timeout")
+        assert get_pci_address(ssh_obj, "eth0") == "shell output"
+        assert bind_driver(ssh_obj, "0000:17:00.0", "vfio-pci") is True
+
+    def test_local_shell_handler_reconnect(self):
+        ssh_obj = LocalShellHandler("localhost", "root", None, "local")
+        try:
+            assert set_pipefail(ssh_obj) is True
+            # the shell is lost, the next command reconnects
+            ssh_obj.channel.close()
+            assert not ssh_obj.is_connected()
+            code, _, _ = ssh_obj.execute("false | true")
+            assert code == 1, "pipefail was not restored"
+            assert ssh_obj.reconnect_count == 1
+            assert ssh_obj.reconnect_time > 0
+        finally:
+            ssh_obj.close()
+
+    def test_reconnect_backoff(self):
+        ssh_obj = LocalShellHandler("localhost", "root", None, "local")
+        connect = ssh_obj._connect
+        failures = [OSError("refused"), OSError("refused")]
+
+        def flaky_connect():
+            if failures:
+                raise failures.pop(0)
+            connect()
+
+        try:
+            with patch.object(ssh_obj, "_connect", side_effect=flaky_connect):
+                with patch("sriov.common.exec.time.sleep") as sleep:
+                    ssh_obj.reconnect()
+            # short waits, independent of the keepalive interval
+            assert [c[0][0] for c in sleep.call_args_list] == [0.5, 1]
+            assert ssh_obj.execute("echo 1") == (0, ["1\n"], [])
+        finally:
+            ssh_obj.close()
+
+    def test_local_subshell(self):
+        ssh_obj = LocalShellHandler("localhost", "root", None, "local")
+        try:
+            assert set_pipefail(ssh_obj) is True
+            subshell = ssh_obj.open_subshell()
+            assert subshell.name == "local-1" and subshell.parent is ssh_obj
+            # the shell options of the parent apply to the sub-handler
+            code, _, _ = subshell.execute("false | true")
+            assert code == 1
+            results = {}
+            start = time.monotonic()
+            run_in_parallel(
+                lambda: results.update(parent=ssh_obj.execute("sleep 0.5; echo 1")),
+                lambda: results.update(sub=subshell.execute("sleep 0.5; echo 2")),
+            )
+            assert time.monotonic() - start < 0.9
+            assert results["parent"][1] == ["1\n"] and results["sub"][1] == ["2\n"]
+            subshell.close()
+            assert ssh_obj.subshells == [] and ssh_obj.is_connected()
+            subshell = ssh_obj.open_subshell("capture")
+        finally:
+            ssh_obj.close()
+        assert not subshell.is_connected()
+
+    def test_testpmd_stats(self):
+        port_stats = """
+  ######################## NIC statistics for port 0  ########################
+  RX-packets: 10         RX-missed: 1          RX-bytes:  640
+  RX-errors: 0
+  RX-nombuf:  0
+  TX-packets: 20         TX-errors: 0          TX-bytes:  1280
+
+  Throughput (since last show)
+  Rx-pps:            5          Rx-bps:            2560
+  Tx-pps:           10          Tx-bps:            5120
+  ############################################################################
+"""
+        fwd_stats = """
+  ---------------------- Forward statistics for port {port}  ----------------------
+  RX-packets: 0              RX-dropped: 0             RX-total: 0
+  TX-packets: {tx}        TX-dropped: 0             TX-total: {tx}
+  ----------------------------------------------------------------------------
+
+  +++++++++++++++ Accumulated forward statistics for all ports+++++++++++++++
+  RX-packets: 0              RX-dropped: 0             RX-total: 0
+  TX-packets: {tx}        TX-dropped: 0             TX-total: {tx}
+  ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+"""
+        xstats = """###### NIC extended statistics for port 1
+rx_good_packets: 3
+tx_good_packets: 4
+rx_good_bytes: 300
+tx_good_bytes: 400
+rx_q0_packets: 3
+"""
+        stats = parse_port_stats(port_stats.splitlines(), 1.0)[0]
+        assert stats.rx_packets == 10 and stats.tx_bytes == 1280
+        assert stats["rx_missed"] == 1 and stats["tx_pps"] == 10
+        later = parse_port_stats(
+            port_stats.replace("20 ", "120").replace("1280", "7680").splitlines(), 3.0
+        )[0]
+        rates = later.rates(stats)
+        assert rates.tx_pps == 50 and rates.tx_bps == 25600 and rates.rx_pps == 0
+
+        before = parse_fwd_stats(fwd_stats.format(port=0, tx=100).splitlines(), 1.0)
+        after = parse_fwd_stats(fwd_stats.format(port=0, tx=600).splitlines(), 1.5)
+        assert set(after) == {0, ALL_PORTS}
+        rates = after[ALL_PORTS].rates(before[ALL_PORTS])
+        assert rates.tx_pps == 1000 and rates.tx_bps is None
+
+        stats = parse_xstats(xstats.splitlines())[1]
+        assert stats.rx_packets == 3 and stats.tx_bytes == 400
+        assert stats["rx_q0_packets"] == 3
+
+        # the output of a command in a tmux pane, after the marker comment
+        pane = [
+            "testpmd> show fwd stats all",
+            "old output",
+            "testpmd> # marker",
+            "testpmd> show fwd stats all",
+        ]
+        assert TestPmdSession._output_after(pane, "# marker") is None
+        pane += fwd_stats.format(port=0, tx=5).splitlines() + ["testpmd>"]
+        output = TestPmdSession._output_after(pane, "# marker")
+        assert parse_fwd_stats(output)[0].tx_packets == 5
+
+    def test_testpmd_prompt_tracking(self):
+        # answers like testpmd: prompt, echo of the command, "Bye..." on quit
+        fake_testpmd = (
+            "bash -c 'stty -echo; while printf \"testpmd> \"; read -r cmd; do "
+            'echo "$cmd"; if [ "$cmd" = quit ]; then echo Bye...; stty echo; '
+            "break; fi; done'"
+        )
+        ssh_obj = LocalShellHandler("localhost", "root", None, "local")
+        try:
+            # known not running, no heartbeat
+            start = time.monotonic()
+            assert not ssh_obj.testpmd_active()
+            assert time.monotonic() - start < 0.5
+            code, _, _ = ssh_obj.start_testpmd(fake_testpmd)
+            assert code == 0 and ssh_obj.testpmd_prompt is True
+            start = time.monotonic()
+            for _ in range(20):
+                assert ssh_obj.testpmd_cmd("show port stats all") == 0
+            assert time.monotonic() - start < 2
+            assert ssh_obj.stop_testpmd() == 0
+            assert ssh_obj.testpmd_prompt is False
+            assert ssh_obj.execute("echo ALIVE")[1] == ["ALIVE\n"]
+
+            # testpmd exits on its own, seen in its pending output
+            ssh_obj.start_testpmd(fake_testpmd)
+            ssh_obj._write("quit\n")
+            time.sleep(0.2)
+            start = time.monotonic()
+            assert not ssh_obj.testpmd_active()
+            assert time.monotonic() - start < 0.5
+            assert ssh_obj.execute("echo ALIVE")[1] == ["ALIVE\n"]
+        finally:
+            ssh_obj.close()
+
+    def test_telemetry_client(self):
+        runtime_dir = tempfile.mkdtemp()
+        os.mkdir(os.path.join(runtime_dir, "rte"))
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        server.bind(os.path.join(runtime_dir, "rte", "dpdk_telemetry.v2"))
+        server.listen(4)
+        packets = {0: 0, 1: 0}
+
+        # answers like the telemetry socket of a DPDK process with 2 ports,
+        # each forwarding 1000 packets of 64 bytes per query
+        def serve(conn):
+            conn.send(json.dumps({"version": "DPDK 21.11.0", "pid": 1,
+                                  "max_output_len": 16384}).encode())
+            while True:
+                cmd = conn.recv(1024).decode()
+                if not cmd:
+                    break
+                if cmd == "/ethdev/list":
+                    reply = {cmd: [0, 1]}
+                elif cmd.startswith("/ethdev/stats,"):
+                    port = int(cmd.split(",")[1])
+                    packets[port] += 1000
+                    reply = {"/ethdev/stats": {"ipackets": packets[port],
+                                               "opackets": packets[port],
+                                               "ibytes": packets[port] * 64,
+                                               "obytes": packets[port] * 64}}
+                else:
+                    reply = {cmd.split(",")[0]: None}
+                conn.send(json.dumps(reply).encode())
+            conn.close()
+
+        def accept():
+            while True:
+                try:
+                    conn, _ = server.accept()
+                except OSError:
+                    break
+                threading.Thread(target=serve, args=(conn,), daemon=True).start()
+
+        threading.Thread(target=accept, daemon=True).start()
+        ssh_obj = LocalShellHandler("localhost", "root", None, "local")
+        try:
+            client = TelemetryClient(
+                ssh_obj, runtime_dir=runtime_dir, xstats=("rx_good_packets",)
+            )
+            series = client.sample(3, 0.1)
+            assert series.ports == [0, 1] and len(series) == 3
+            stats = series.sample()[1]
+            assert stats.rx_packets == packets[1] and stats.tx_bytes == 64 * packets[1]
+            assert stats["imissed"] is None and stats["rx_good_packets"] is None
+            rates = series.rates(0)
+            assert len(rates) == 2
+            assert 5000 < rates[0].rx_pps < 20000
+            assert rates[0].tx_bps == rates[0].tx_pps * 512
+
+            # in the background, while the handler runs other commands
+            client.start(0.05, maxlen=4)
+            time.sleep(0.5)
+            assert ssh_obj.execute("echo ALIVE")[1] == ["ALIVE\n"]
+            assert set(client.rates()) == {0, 1}
+            series = client.stop()
+            assert len(series) == 4 and ssh_obj.subshells == []
+
+            client = TelemetryClient(
+                ssh_obj, file_prefix="none", runtime_dir=runtime_dir
+            )
+            with self.assertRaises(Exception):
+                client.sample(2, 0.1)
+        finally:
+            ssh_obj.close()
+            server.close()
+
+    def test_command_timing(self):
+        ssh_obj = LocalShellHandler("localhost", "root", None, "local")
+        TIMING.current_test = "test_command_timing"
+        try:
+            execute_and_assert(ssh_obj, ["sleep 0.2"], 0)
+            ssh_obj.execute("seq 3")
+        finally:
+            TIMING.current_test = None
+            ssh_obj.close()
+        sleep, seq = [r for r in TIMING.records if r.test == "test_command_timing"]
+        assert sleep.helper == "execute_and_assert"
+        assert sleep.kind == "execute" and sleep.cmd == "sleep 0.2"
+        assert sleep.test == "test_command_timing"
+        assert sleep.start <= sleep.sent <= sleep.first_byte <= sleep.done
+        assert sleep.duration >= 0.2
+        assert seq.helper is None
+        assert seq.lines == 3 and seq.bytes > 0 and seq.exit_status == 0
+
+        TIMING.test_finished("test_command_timing", sleep.duration + seq.duration)
+        report = TIMING.report()
+        assert report["helpers"]["execute_and_assert"]["commands"] >= 1
+        test = report["tests"]["test_command_timing"]
+        assert test["commands"] == 2
+        assert test["remote_wait"] >= 0.2
+
+    def test_cassette_record_replay(self):
+        def run(ssh_obj):
+            results = execute_and_assert(ssh_obj, ["echo 1", "echo 2"], 0)
+            results += ssh_obj.execute("sleep 0.2; false")
+            stream = ssh_obj.execute_stream("echo 3; echo 4")
+            return results, list(stream), stream.exit_status
+
+        with tempfile.TemporaryDirectory() as directory:
+            ShellHandler.cassette = CassetteRecorder(directory)
+            ssh_obj = LocalShellHandler("localhost", "root", None, "local")
+            try:
+                ShellHandler.cassette.start_test("test_cassette")
+                recorded = run(ssh_obj)
+                ShellHandler.cassette.finish_test()
+            finally:
+                ssh_obj.close()
+                ShellHandler.cassette.close()
+                ShellHandler.cassette = None
+
+            ReplayShellHandler.player = CassettePlayer(directory)
+            replay = ReplayShellHandler("localhost", "root", None, "local")
+            ReplayShellHandler.player.start_test("test_cassette")
+            start = time.monotonic()
+            assert run(replay) == recorded
+            # the recorded 0.2 seconds of sleep are not replayed
+            assert time.monotonic() - start < 0.2
+            with self.assertRaises(CassetteError):
+                replay.execute("echo 1")
+
+    def test_pool_health(self):
+        pool = ShellHandlerPool()
+        try:
+            dut = pool.get("localhost", "root", None, "dut")
+            dut.execute("true")
+            # handing out a working session costs no command
+            handler, writes, _ = self.count_round_trips(
+                dut, lambda: pool.get("localhost", "root", None, "dut")
+            )
+            assert handler is dut and writes == 0
+
+            # after a timeout, the stuck shell is probed and reconnected
+            code, _, _ = dut.execute("sleep 10", 0.2)
+            assert code == -1 and dut.shell_failed
+            assert pool.get("localhost", "root", None, "dut") is dut
+            assert dut.reconnect_count == 1 and not dut.shell_failed
+            assert dut.execute("echo 1") == (0, ["1\n"], [])
+
+            # the probe of the end of a test keeps the healthy sessions
+            pool.check_health()
+            assert dut.reconnect_count == 1
+        finally:
+            pool.close_all()
+
+    def test_replay_pool(self):
+        with tempfile.TemporaryDirectory() as directory:
+            ReplayShellHandler.player = CassettePlayer(directory)
+            pool = ShellHandlerPool()
+            pool.factory = ReplayShellHandler
+            try:
+                dut = pool.get("localhost", "root", None, "dut")
+                # the second get checks that the replay handler is ready
+                assert pool.get("localhost", "root", None, "dut") is dut
+                assert dut.reconnect_count == 0
+            finally:
+                pool.close_all()
+                ReplayShellHandler.player = None
+
+    def test_local_agent(self):
+        ssh_obj = LocalShellHandler("localhost", "root", None, "local")
+        try:
+            assert ssh_obj.start_agent()
+            assert ssh_obj.agent.call("ping") == "pong"
+            assert ssh_obj.agent.call("exists", paths=["/proc", "/nonexistent"]) == [
+                True,
+                False,
+            ]
+            with self.assertRaisesRegex(Exception, "unknown method"):
+                ssh_obj.agent.call("unknown")
+            # a failed request does not stop the agent
+            assert ssh_obj.agent.call("read_sysfs", path="/proc/sys/kernel/ostype")
+            ssh_obj.agent.close()
+            with self.assertRaises(AgentError):
+                ssh_obj.agent.call("ping")
+        finally:
+            ssh_obj.close()
+
+    def wait_until_output(self, code=0, attempts=1, output=()):
+        """Output of the wait_until loop"""
+        return ["wait_until output\n"] + list(output) + [
+            f"wait_until {code} {attempts} 1500\n"
+        ]
+
+    def test_wait_until(self):
+        ssh_obj = self.create_mock_ssh_obj(
+            0, self.wait_until_output(0, 3, ["ready\n"]), []
+        )
+        result = wait_until(ssh_obj, "test -e /tmp/ready", 5, 0.1)
+        assert result
+        assert result.attempts == 3
+        assert result.seconds == 0.0015
+        assert result.output == ["ready\n"]
+        # the loop runs on the host, in one command
+        ssh_obj.execute.assert_called_once()
+        assert "test -e /tmp/ready" in ssh_obj.execute.call_args[0][0]
+
+        ssh_obj = self.create_mock_ssh_obj(0, self.wait_until_output(1, 50), [])
+        result = wait_until(ssh_obj, "test -e /tmp/ready", 5, 0.1)
+        assert not result
+        assert result.code == 1
+        assert wait_until(ssh_obj, "test -e /tmp/ready", 5, 0.1, 1)
+
+        # no result of the loop, e.g. the command timed out
+        ssh_obj = self.create_mock_ssh_obj(1, [], ["timeout\n"])
+        assert not wait_until(ssh_obj, "true")
+
+        ssh_obj = LocalShellHandler("localhost", "root", None, "local")
+        try:
+            with tempfile.TemporaryDirectory() as tmp:
+                path = os.path.join(tmp, "ready")
+                result = wait_until(ssh_obj, f"echo waiting; test -e {path}", 0.3, 0.1)
+                assert not result
+                assert result.attempts >= 3
+                assert result.output == ["waiting\n"]
+                open(path, "w").close()
+                result = wait_until(ssh_obj, f"test -e {path}", 1, 0.1)
+                assert result
+                assert result.attempts == 1
+        finally:
+            ssh_obj.close()
+
+    def test_set_vf_mac(self):
+        ssh_obj = self.create_mock_ssh_obj(0, self.wait_until_output(), [])
         assert set_vf_mac(ssh_obj, "eth0", 0, "aa:bb:cc:dd:ee:00")
+        assert "eth0v0/address" in ssh_obj.execute.call_args[0][0]
+        ssh_obj = self.create_mock_ssh_obj(0, self.wait_until_output(1, 11), [])
         assert not set_vf_mac(ssh_obj, "eth0", 0, "aa:bb:cc:dd:ee:11", timeout=1)
 
-    @patch("sriov.common.utils.get_vf_mac")
-    def test_verify_vf_address(self, mock_get_vf_mac):
-        mock_get_vf_mac.return_value = "aa:bb:cc:dd:ee:00"
-        ssh_obj = self.create_mock_ssh_obj()
+    def test_verify_vf_address(self):
+        ssh_obj = self.create_mock_ssh_obj(
+            0, self.wait_until_output(output=self.ip_link_json()), []
+        )
         assert verify_vf_address(ssh_obj, "eth0", 0, "aa:bb:cc:dd:ee:00")
+        assert "ip -j -d link show eth0" in ssh_obj.execute.call_args[0][0]
+        ssh_obj = self.create_mock_ssh_obj(
+            0, self.wait_until_output(1, 6, self.ip_link_json()), []
+        )
         assert not verify_vf_address(
             ssh_obj, "eth0", 0, "aa:bb:cc:dd:ee:11", timeout=1, interval=0.2
         )
+        # one command however many times the address is polled
+        ssh_obj.execute.assert_called_once()
+        # a missing VF does not have the address
+        assert not verify_vf_address(ssh_obj, "eth0", 1, "aa:bb:cc:dd:ee:00")
+
+    def test_vf_config(self):
+        config = VfConfig("ens7f0")
+        config.set(0, mac="aa:bb:cc:dd:ee:00", spoof="off", trust="on")
+        config.set(0, vlan=10, qos=5).set(1, vlan=None, max_tx_rate=10)
+        assert config.lines() == [
+            "link set dev ens7f0 vf 0 mac aa:bb:cc:dd:ee:00",
+            "link set dev ens7f0 vf 0 spoof off",
+            "link set dev ens7f0 vf 0 trust on",
+            "link set dev ens7f0 vf 0 vlan 10 qos 5",
+            "link set dev ens7f0 vf 1 max_tx_rate 10",
+        ]
+        with self.assertRaises(ValueError):
+            VfConfig("ens7f0").set(0, qos=5)
+
+        ssh_obj = self.create_mock_ssh_obj()
+        assert config.apply(ssh_obj) is True
+        ssh_obj.execute.assert_called_once()
+        assert "ip -force -batch -" in ssh_obj.execute.call_args[0][0]
+
+        ssh_obj = self.create_mock_ssh_obj(
+            1,
+            [
+                "RTNETLINK answers: Invalid argument\n",
+                "Command failed -:3\n",
+                "RTNETLINK answers: Operation not permitted\n",
+                "Command failed -:5\n",
+            ],
+            [],
+        )
+        with self.assertRaisesRegex(
+            Exception,
+            r"vf 0 trust \(trust on\): RTNETLINK answers: Invalid argument; "
+            r"vf 1 max_tx_rate \(max_tx_rate 10\): .*not permitted",
+        ):
+            config.apply(ssh_obj)
+
+        # lo has no VF, every line fails
+        ssh_obj = LocalShellHandler("localhost", "root", None, "local")
+        try:
+            config = VfConfig("lo").set(0, trust="on").set(1, spoof="off")
+            with self.assertRaisesRegex(Exception, r"vf 0 trust .*; vf 1 spoof"):
+                config.apply(ssh_obj)
+        finally:
+            ssh_obj.close()
 
     def test_vfs_created(self):
-        ssh_obj = self.create_mock_ssh_obj(0, ["1"], "")
+        ssh_obj = self.create_mock_ssh_obj(0, self.wait_until_output(), [])
         assert vfs_created(ssh_obj, "eth0", 1) is True
 
-    @patch("sriov.common.utils.vfs_created")
-    def test_create_vfs(self, mock_vfs_created):
-        ssh_obj = self.create_mock_ssh_obj()
-        mock_vfs_created.return_value = True
-        assert create_vfs(ssh_obj, "eth0", 1) is True
+    def test_create_vfs(self):
+        ssh_obj = self.create_mock_ssh_obj(
+            0, ["numvfs eth0 0 0 0 1200\n", "numvfs eth0 2 2 2 180500\n"], ""
+        )
+        assert create_vfs(ssh_obj, "eth0", 2) is True
+        # the removal and the creation are waited for in one command
+        ssh_obj.execute.assert_called_once()
+        assert "v eth0 0 10; v eth0 2 10" in ssh_obj.execute.call_args[0][0]
+
+        ssh_obj = self.create_mock_ssh_obj(
+            0, ["numvfs eth0 0 0 0 1200\n", "numvfs eth0 2 1 2 10000000\n"], ""
+        )
+        assert create_vfs(ssh_obj, "eth0", 2) is False
+        ssh_obj = self.create_mock_ssh_obj(0, ["numvfs eth0 0 failed\n"], "")
+        assert create_vfs(ssh_obj, "eth0", 2) is False
+
+    def test_set_numvfs(self):
+        ssh_obj = self.create_mock_ssh_obj(
+            0, ["noise\n", "numvfs eth1 0 0 0 2000\n", "numvfs eth0 0 failed\n"], ""
+        )
+        assert set_numvfs(ssh_obj, [("eth0", 0), ("eth1", 0)]) == [
+            None,
+            (0, 0, 0.002),
+        ]
+
+    def test_bind_drivers(self):
+        devices = [
+            ("0000:17:01.0", "vfio-pci"),
+            ("0000:17:01.1", "vfio-pci"),
+            ("0000:17:01.2", "iavf"),
+        ]
+        cmd = bind_drivers_cmd(devices, driverctl=False)
+        # each module is loaded once
+        assert cmd.count("modprobe vfio-pci") == 1
+        assert cmd.count("modprobe iavf") == 1
+        assert "dc=0" in cmd
+
+        ssh_obj = self.create_mock_ssh_obj(
+            1,
+            [
+                "bind 0000:17:01.0 vfio-pci 0 1500\n",
+                "bind 0000:17:01.1 vfio-pci 1 800 No such device\n",
+            ],
+            [],
+        )
+        assert bind_drivers(ssh_obj, devices) == {
+            "0000:17:01.0": (True, 0.0015),
+            "0000:17:01.1": (False, 0.0008),
+            "0000:17:01.2": (False, None),
+        }
+        # one command for all the devices
+        ssh_obj.execute.assert_called_once()
 
     def test_no_zero_macs_pf(self):
-        ssh_obj = self.create_mock_ssh_obj(0, ["aa:bb:cc:dd:ee:00"], "")
+        ssh_obj = self.create_mock_ssh_obj(
+            0, self.wait_until_output(output=self.ip_link_json()), []
+        )
         assert no_zero_macs_pf(ssh_obj, "eth0") is True
 
-        ssh_obj = self.create_mock_ssh_obj(0, ["00:00:00:00:00:00"], "")
-        assert no_zero_macs_pf(ssh_obj, "eth0") is False
+        output = self.ip_link_json(vf_macs=["00:00:00:00:00:00"])
+        ssh_obj = self.create_mock_ssh_obj(0, self.wait_until_output(1, 21, output), [])
+        assert no_zero_macs_pf(ssh_obj, "eth0", 2) is False
+        ssh_obj.execute.assert_called_once()
+
+        # the last snapshot is checked again, e.g. on a host without python3
+        ssh_obj = self.create_mock_ssh_obj(0, self.wait_until_output(0, 1, output), [])
+        assert no_zero_macs_pf(ssh_obj, "eth0", 2) is False
+
+        # no snapshot, e.g. no such interface
+        ssh_obj = self.create_mock_ssh_obj(
+            0, self.wait_until_output(1, 21, ['Device "eth0" does not exist.\n']), []
+        )
+        assert no_zero_macs_pf(ssh_obj, "eth0", 2) is False
 
     def test_no_zero_macs_vf(self):
-        ssh_obj = self.create_mock_ssh_obj(0, ["aa:bb:cc:dd:ee:00"], "")
-        assert no_zero_macs_vf(ssh_obj, "eth0", 1) is True
+        macs = ["aa:bb:cc:dd:ee:{:02x}".format(vf) for vf in range(64)]
+        output = self.ip_link_json(vf_macs=macs)
+        ssh_obj = self.create_mock_ssh_obj(0, self.wait_until_output(0, 1, output), [])
+        assert no_zero_macs_vf(ssh_obj, "eth0", 64) is True
+        # one command for all the VFs
+        ssh_obj.execute.assert_called_once()
+
+        macs[5] = "00:00:00:00:00:00"
+        output = self.ip_link_json(vf_macs=macs)
+        ssh_obj = self.create_mock_ssh_obj(0, self.wait_until_output(1, 21, output), [])
+        assert no_zero_macs_vf(ssh_obj, "eth0", 64, 2) is False
 
-        ssh_obj = self.create_mock_ssh_obj(0, ["00:00:00:00:00:00"], "")
-        assert no_zero_macs_vf(ssh_obj, "eth0", 1) is False
+    def test_read_trafficgen_result(self):
+        lines = [
+            '{"0": {"rx_l1_bps": 25000000000}, "1": {"rx_l1_bps": 24000000000}}\n',
+            "status: stopping\n",
+            '{"0": {"rx_l1_bps": 0}}\n',
+            '{"0": {"state": "idle"}}\n',
+        ]
+        # the later status JSON of port 0 is not the result
+        result = read_trafficgen_result(iter(lines))
+        assert result["0"]["rx_l1_bps"] == 25000000000
+        assert result["1"]["rx_l1_bps"] == 24000000000
+        assert read_trafficgen_result([]) is None
+        with self.assertRaises(ValueError):
+            read_trafficgen_result(["starting\n", '{"0": {}}\n'])
 
     def test_set_pipefail(self):
         ssh_obj = self.create_mock_ssh_obj()
@@ -184,9 +1081,178 @@ class UtilsTest(unittest.TestCase):
         assert outs == ["output", "output"]
         assert errs == ["errors", "errors"]
 
+    def test_run_in_parallel(self):
+        def sleep_and_return(value):
+            time.sleep(0.5)
+            return value
+
+        start = time.monotonic()
+        results = run_in_parallel(
+            lambda: sleep_and_return(1), lambda: sleep_and_return(2)
+        )
+        assert time.monotonic() - start < 1
+        assert results == [1, 2]
+
+        def fail():
+            raise ValueError("failed")
+
+        with self.assertRaises(ValueError):
+            run_in_parallel(lambda: 1, fail)
+
+    def test_execute_and_assert_parallel(self):
+        dut = self.create_mock_ssh_obj(0, "dut output", "")
+        trafficgen = self.create_mock_ssh_obj(0, "trafficgen output", "")
+        results = execute_and_assert_parallel(
+            [(dut, ["cmd"]), (trafficgen, ["cmd", "cmd_2"])], 0
+        )
+        assert results == [
+            (["dut output"], [""]),
+            (["trafficgen output", "trafficgen output"], ["", ""]),
+        ]
+
+        trafficgen = self.create_mock_ssh_obj(1, "", "errors")
+        trafficgen.name = "trafficgen"
+        with self.assertRaisesRegex(AssertionError, "^trafficgen: "):
+            execute_and_assert_parallel([(dut, ["cmd"]), (trafficgen, ["cmd"])], 0)
+
+    def test_execute_and_assert_batch(self):
+        ssh_obj = self.create_mock_ssh_obj(0, "output", "errors")
+        execute_and_assert(ssh_obj, ["cmd", "cmd_2"], 0)
+        ssh_obj.execute_batch.assert_called_once_with(
+            ["cmd", "cmd_2"], 10, stop_on_error=True, delay=0
+        )
+        ssh_obj.execute.assert_not_called()
+
+        # the inter-command delay is slept on the host, when asked for
+        ssh_obj = self.create_mock_ssh_obj(0, "output", "errors")
+        execute_and_assert(ssh_obj, ["cmd", "cmd_2"], 0, timeout=0.5, batch=True)
+        ssh_obj.execute_batch.assert_called_once_with(
+            ["cmd", "cmd_2"], 11, stop_on_error=True, delay=0.5
+        )
+        ssh_obj.execute.assert_not_called()
+
+        # one command at a time with a timeout between cmds, or when opted out
+        for kwargs in ({"timeout": 0.1}, {"batch": False}):
+            ssh_obj = self.create_mock_ssh_obj(0, "output", "errors")
+            execute_and_assert(ssh_obj, ["cmd", "cmd_2"], 0, **kwargs)
+            assert ssh_obj.execute.call_count == 2
+            ssh_obj.execute_batch.assert_not_called()
+
+        # non zero exit code runs one command at a time
+        ssh_obj = self.create_mock_ssh_obj(1, "output", "errors")
+        outs, errs = execute_and_assert(ssh_obj, ["cmd", "cmd_2"], 1, batch=True)
+        assert outs == ["output", "output"]
+        ssh_obj.execute_batch.assert_not_called()
+
+        ssh_obj = self.create_mock_ssh_obj(1, "output", "errors")
+        with self.assertRaises(AssertionError):
+            execute_and_assert(ssh_obj, ["cmd", "cmd_2"], 0)
+
+    def test_local_execute_batch(self):
+        cmds = ["printf A", "cat", "printf 'B\\nC'", "echo D"]
+        for use_exec_channel in (False, True):
+            ssh_obj = LocalShellHandler("localhost", "root", None, "local")
+            ssh_obj.use_exec_channel = use_exec_channel
+            try:
+                results = ssh_obj.execute_batch(cmds, 10)
+                # cat does not read the next commands, and the output without
+                # a trailing newline is kept
+                assert [out for _, out, _ in results] == [
+                    ["A"],
+                    [],
+                    ["B\n", "C"],
+                    ["D\n"],
+                ]
+                assert [code for code, _, _ in results] == [0] * 4
+                # the shell is left as it was
+                assert ssh_obj.execute("echo E") == (0, ["E\n"], [])
+            finally:
+                ssh_obj.close()
+
+    def test_local_execute_batch_round_trips(self):
+        ssh_obj = LocalShellHandler("localhost", "root", None, "local")
+        try:
+            ssh_obj.execute("true")
+            results, writes, round_trips = self.count_round_trips(
+                ssh_obj, lambda: ssh_obj.execute_batch(["echo 1", "false"])
+            )
+            assert results == [(0, ["1\n"], []), (1, [], [])]
+            assert writes == 1 and round_trips == 1
+
+            # one round trip per command without the batch
+            _, _, round_trips = self.count_round_trips(
+                ssh_obj,
+                lambda: execute_and_assert(
+                    ssh_obj, ["echo 1", "echo 2"], 0, batch=False
+                ),
+            )
+            assert round_trips == 2
+            outs, writes, round_trips = self.count_round_trips(
+                ssh_obj, lambda: execute_and_assert(ssh_obj, ["echo 1", "echo 2"], 0)
+            )
+            assert outs == ([["1\n"], ["2\n"]], [[], []])
+            assert writes == 1 and round_trips == 1
+
+            # a timed out batch is interrupted, and the shell still answers
+            results = ssh_obj.execute_batch(["echo 1", "sleep 5", "echo 3"], 0.5)
+            assert results[0] == (0, ["1\n"], [])
+            assert results[1][0] == -1 and len(results) == 2
+            assert ssh_obj.execute("echo 4") == (0, ["4\n"], [])
+        finally:
+            ssh_obj.close()
+
+    def test_local_submit_flush(self):
+        for use_exec_channel in (False, True):
+            ssh_obj = LocalShellHandler("localhost", "root", None, "local")
+            ssh_obj.use_exec_channel = use_exec_channel
+            try:
+                futures = [
+                    ssh_obj.submit(cmd) for cmd in ["printf A", "cat", "echo B"]
+                ]
+                assert ssh_obj.flush(stop_on_error=True) == futures
+                # the output without a trailing newline is kept
+                assert [future.result() for future in futures] == [
+                    (0, ["A"], []),
+                    (0, [], []),
+                    (0, ["B\n"], []),
+                ]
+            finally:
+                ssh_obj.close()
+
+        # the 4 steps of bind_driver cost one round trip
+        ssh_obj = LocalShellHandler("localhost", "root", None, "local")
+        try:
+            ssh_obj.execute("true")
+            for step in ["echo 1", "echo 2", "echo 3", "false"]:
+                ssh_obj.submit(step)
+            futures, writes, round_trips = self.count_round_trips(
+                ssh_obj, lambda: ssh_obj.flush(stop_on_error=True)
+            )
+            assert [future.result()[0] for future in futures] == [0, 0, 0, 1]
+            assert writes == 1 and round_trips == 1
+        finally:
+            ssh_obj.close()
+
+    def test_local_shell_handler(self):
+        for use_exec_channel in (False, True):
+            ssh_obj = LocalShellHandler("localhost", "root", None, "local")
+            ssh_obj.use_exec_channel = use_exec_channel
+            try:
+                assert set_pipefail(ssh_obj) is True
+                outs, errs = execute_and_assert(ssh_obj, ["echo 1", "echo 2"], 0)
+                assert outs == [["1\n"], ["2\n"]]
+                code, _, _ = ssh_obj.execute("false | true")
+                assert code == 1
+                assert ssh_obj.is_healthy()
+            finally:
+                ssh_obj.close()
+            assert not ssh_obj.is_connected()
+
     def test_execute_until_timeout(self):
-        ssh_obj = self.create_mock_ssh_obj()
+        ssh_obj = self.create_mock_ssh_obj(0, self.wait_until_output(), [])
         assert execute_until_timeout(ssh_obj, "cmd") is True
+        ssh_obj = self.create_mock_ssh_obj(0, self.wait_until_output(0, 10), [])
+        assert execute_until_timeout(ssh_obj, "cmd", 10, 1) is False
 
     @patch("sriov.common.utils.get_hugepage_info")
     def test_calc_required_pages_2M(self, mock_get_hugepage_info):
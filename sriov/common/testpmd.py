@@ -0,0 +1,510 @@
+import re
+import shlex
+import time
+from sriov.common.exec import ShellHandler
+from sriov.common.utils import (
+    bind_drivers,
+    execute_and_assert,
+    start_tmux,
+    start_tmux_steps,
+    stop_testpmd_in_tmux,
+    wait_tmux_testpmd_ready,
+    wait_tmux_testpmd_sessions,
+)
+
+
+# key of the accumulated statistics of all ports in parse_fwd_stats()
+ALL_PORTS = "all"
+
+PROMPT = "testpmd>"
+# MB of hugepages of a testpmd instance, the 200 2M pages per instance of
+# calc_required_pages_2M
+INSTANCE_MEMORY = 400
+
+COUNTER = re.compile(r"([A-Za-z][\w-]*):\s*(\d+)")
+PORT_STATS_HEADER = re.compile(r"#+ NIC statistics for port (\d+)")
+FWD_STATS_HEADER = re.compile(r"-+ Forward statistics for port (\d+)")
+FWD_STATS_ACCUMULATED = re.compile(r"\++ Accumulated forward statistics for all ports")
+XSTATS_HEADER = re.compile(r"#+ NIC extended statistics for port (\d+)")
+
+
+class StatsRates:
+    def __init__(
+        self, interval: float, rx_pps: float, tx_pps: float, rx_bps, tx_bps
+    ) -> None:
+        """Init the rates of a port between two samples of its counters
+
+        Args:
+            self:             self
+            interval (float): seconds between the samples
+            rx_pps (float):   received packets per second
+            tx_pps (float):   transmitted packets per second
+            rx_bps (float):   received bits per second, None if unknown
+            tx_bps (float):   transmitted bits per second, None if unknown
+        """
+        self.interval = interval
+        self.rx_pps = rx_pps
+        self.tx_pps = tx_pps
+        self.rx_bps = rx_bps
+        self.tx_bps = tx_bps
+
+    def __repr__(self) -> str:
+        return (
+            f"StatsRates(interval={self.interval}, rx_pps={self.rx_pps}, "
+            f"tx_pps={self.tx_pps}, rx_bps={self.rx_bps}, tx_bps={self.tx_bps})"
+        )
+
+
+class PortCounters:
+    # names of the packet and byte counters, None when not reported
+    rx_packets_counter = "rx_packets"
+    tx_packets_counter = "tx_packets"
+    rx_bytes_counter = "rx_bytes"
+    tx_bytes_counter = "tx_bytes"
+
+    def __init__(self, port, counters: dict, timestamp: float) -> None:
+        """Init the counters of one port in the output of a testpmd command
+
+        Args:
+            self:              self
+            port:              port ID (int), or ALL_PORTS
+            counters (dict):   counter values (int) by name, the testpmd names
+                               in lower case with "_" for "-", e.g. "tx_packets"
+            timestamp (float): time.monotonic() value of the sample
+        """
+        self.port = port
+        self.counters = counters
+        self.timestamp = timestamp
+
+    def __getitem__(self, name: str) -> int:
+        """Get a counter by name, e.g. stats["rx_missed"]"""
+        return self.counters[name]
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}(port={self.port}, counters={self.counters})"
+
+    def _get(self, name: str) -> int:
+        """Get a counter, None if the name is None or the counter is missing"""
+        return None if name is None else self.counters.get(name)
+
+    @property
+    def rx_packets(self) -> int:
+        """Received packets"""
+        return self._get(self.rx_packets_counter)
+
+    @property
+    def tx_packets(self) -> int:
+        """Transmitted packets"""
+        return self._get(self.tx_packets_counter)
+
+    @property
+    def rx_bytes(self) -> int:
+        """Received bytes, None if not reported"""
+        return self._get(self.rx_bytes_counter)
+
+    @property
+    def tx_bytes(self) -> int:
+        """Transmitted bytes, None if not reported"""
+        return self._get(self.tx_bytes_counter)
+
+    def rates(self, previous: "PortCounters") -> StatsRates:
+        """Compute the rates since a previous sample of the same port
+
+        Args:
+            self:     self
+            previous: the previous sample
+
+        Returns:
+            StatsRates: the packet rates, and the bit rates when the bytes
+                        are reported
+
+        Raises:
+            Exception: the samples were taken at the same time
+        """
+        interval = self.timestamp - previous.timestamp
+        if interval <= 0:
+            raise Exception("the samples must be taken at different times")
+
+        def rate(current, before, scale=1):
+            if current is None or before is None:
+                return None
+            return (current - before) * scale / interval
+
+        return StatsRates(
+            interval,
+            rate(self.rx_packets, previous.rx_packets),
+            rate(self.tx_packets, previous.tx_packets),
+            rate(self.rx_bytes, previous.rx_bytes, 8),
+            rate(self.tx_bytes, previous.tx_bytes, 8),
+        )
+
+
+class PortStats(PortCounters):
+    """Counters of a port in the output of "show port stats" """
+
+
+class FwdStats(PortCounters):
+    """Counters of a port in the output of "show fwd stats", which has no bytes"""
+
+    rx_bytes_counter = None
+    tx_bytes_counter = None
+
+
+class XStats(PortCounters):
+    """Counters of a port in the output of "show port xstats" """
+
+    rx_packets_counter = "rx_good_packets"
+    tx_packets_counter = "tx_good_packets"
+    rx_bytes_counter = "rx_good_bytes"
+    tx_bytes_counter = "tx_good_bytes"
+
+
+def _counter_name(name: str) -> str:
+    """Convert a testpmd counter name, e.g. "RX-packets" to "rx_packets" """
+    return name.lower().replace("-", "_")
+
+
+def _parse_sections(lines: list, headers: list, cls, timestamp: float) -> dict:
+    """Parse the per port sections of the output of a testpmd command
+
+    Args:
+        lines (list):      output lines
+        headers (list):    (regex, port) pairs of the section headers, port
+                           being None to take it from the first regex group
+        cls:               PortCounters subclass of the sections
+        timestamp (float): time.monotonic() value of the sample, None for now
+
+    Returns:
+        dict: cls object by port
+    """
+    if timestamp is None:
+        timestamp = time.monotonic()
+    sections = {}
+    counters = None
+    for line in lines:
+        for header, port in headers:
+            match = header.search(line)
+            if match:
+                if port is None:
+                    port = int(match.group(1))
+                counters = {}
+                sections[port] = cls(port, counters, timestamp)
+                break
+        else:
+            if counters is not None:
+                for name, value in COUNTER.findall(line):
+                    counters[_counter_name(name)] = int(value)
+    return sections
+
+
+def parse_port_stats(lines: list, timestamp: float = None) -> dict:
+    """Parse the output of "show port stats"
+
+    Args:
+        lines (list):      output lines
+        timestamp (float): time.monotonic() value of the sample (default now)
+
+    Returns:
+        dict: PortStats by port ID
+    """
+    return _parse_sections(lines, [(PORT_STATS_HEADER, None)], PortStats, timestamp)
+
+
+def parse_fwd_stats(lines: list, timestamp: float = None) -> dict:
+    """Parse the output of "show fwd stats all"
+
+    Args:
+        lines (list):      output lines
+        timestamp (float): time.monotonic() value of the sample (default now)
+
+    Returns:
+        dict: FwdStats by port ID, and of all the ports by ALL_PORTS
+    """
+    headers = [(FWD_STATS_HEADER, None), (FWD_STATS_ACCUMULATED, ALL_PORTS)]
+    return _parse_sections(lines, headers, FwdStats, timestamp)
+
+
+def parse_xstats(lines: list, timestamp: float = None) -> dict:
+    """Parse the output of "show port xstats"
+
+    Args:
+        lines (list):      output lines
+        timestamp (float): time.monotonic() value of the sample (default now)
+
+    Returns:
+        dict: XStats by port ID
+    """
+    return _parse_sections(lines, [(XSTATS_HEADER, None)], XStats, timestamp)
+
+
+class TestPmdSession:
+    # not a test class, despite the name
+    __test__ = False
+
+    def __init__(self, ssh_obj: ShellHandler, tmux_session: str = None) -> None:
+        """Init a session driving a testpmd, either in the interactive shell of
+           ssh_obj, or in a tmux session of its host
+
+        Args:
+            self:               self
+            ssh_obj:            ssh connection obj
+            tmux_session (str): tmux session name, None to run testpmd in
+                                the interactive shell (default None)
+        """
+        self.ssh_obj = ssh_obj
+        self.tmux_session = tmux_session
+        self.marker = 0
+
+    def start(self, cmd: str, timeout: int = 15) -> bool:
+        """Start testpmd
+
+        Args:
+            self:          self
+            cmd (str):     the command starting testpmd in interactive mode
+            timeout (int): seconds to wait for the prompt (default 15)
+
+        Returns:
+            bool: True if the testpmd prompt is ready
+        """
+        if self.tmux_session is None:
+            code, _, _ = self.ssh_obj.start_testpmd(cmd)
+            return code == 0 and self.ssh_obj.testpmd_active()
+        return start_tmux(
+            self.ssh_obj, self.tmux_session, cmd
+        ) and wait_tmux_testpmd_ready(self.ssh_obj, self.tmux_session, timeout)
+
+    def stop(self) -> None:
+        """Quit testpmd
+
+        Args:
+            self: self
+        """
+        if self.tmux_session is None:
+            self.ssh_obj.stop_testpmd()
+        else:
+            stop_testpmd_in_tmux(self.ssh_obj, self.tmux_session)
+
+    def execute(self, cmd: str, timeout: float = 5) -> list:
+        """Run a testpmd command and return its output
+
+        Args:
+            self:            self
+            cmd (str):       the testpmd command, e.g. "show port stats all"
+            timeout (float): timeout for the output (default 5)
+
+        Returns:
+            list: the output lines
+
+        Raises:
+            Exception: the command did not complete before the timeout
+        """
+        if self.tmux_session is None:
+            code, output = self.ssh_obj.testpmd_execute(cmd, timeout)
+        else:
+            code, output = self._execute_tmux(cmd, timeout)
+        if code != 0:
+            raise Exception(f"testpmd command {cmd!r} did not complete")
+        return output
+
+    def _execute_tmux(self, cmd: str, timeout: float) -> tuple:
+        """Run a testpmd command in the tmux session
+
+        The command is preceded by a unique testpmd comment, so that its output
+        is found in the pane after the echo of the comment, whatever the
+        commands run before. The output is complete when it is followed by
+        the prompt.
+
+        Args:
+            self:            self
+            cmd (str):       the testpmd command
+            timeout (float): timeout for the output
+
+        Returns:
+            exit_code (int): 0 on success, -1 on timeout
+            output (list):   list of the output lines
+        """
+        self.marker += 1
+        marker = f"# {self.tmux_session} {self.marker} {time.time():.6f}"
+        send = (
+            f"tmux send-keys -t {self.tmux_session} {shlex.quote(marker)} ENTER "
+            f"{shlex.quote(cmd)} ENTER"
+        )
+        execute_and_assert(self.ssh_obj, [send], 0)
+        capture = [f"tmux capture-pane -p -J -S -1000 -t {self.tmux_session}"]
+        deadline = time.monotonic() + timeout
+        while True:
+            outs, _ = execute_and_assert(self.ssh_obj, capture, 0)
+            output = self._output_after(outs[0], marker)
+            if output is not None:
+                return 0, output
+            if time.monotonic() > deadline:
+                return -1, []
+            time.sleep(0.1)
+
+    @staticmethod
+    def _output_after(lines: list, marker: str) -> list:
+        """Find the output of the command sent after marker in a pane
+
+        Args:
+            lines (list):  lines of the pane
+            marker (str):  the comment sent before the command
+
+        Returns:
+            list: the output lines, None if not complete yet
+        """
+        lines = [line.rstrip("\r\n") for line in lines]
+        for index, line in enumerate(lines):
+            if line.startswith(PROMPT) and line[len(PROMPT):].strip() == marker:
+                break
+        else:
+            return None
+        output = None
+        for line in lines[index + 1:]:
+            if line.startswith(PROMPT):
+                if output is not None:
+                    return output
+                # the prompt followed by the command
+                output = []
+            elif output is not None:
+                output.append(line + "\n")
+        return None
+
+    def port_stats(self, port="all") -> dict:
+        """Sample the port statistics
+
+        Args:
+            self: self
+            port: port ID, or "all" (default "all")
+
+        Returns:
+            dict: PortStats by port ID
+        """
+        return parse_port_stats(self.execute(f"show port stats {port}"))
+
+    def fwd_stats(self) -> dict:
+        """Sample the forwarding statistics
+
+        Args:
+            self: self
+
+        Returns:
+            dict: FwdStats by port ID, and of all the ports by ALL_PORTS
+        """
+        return parse_fwd_stats(self.execute("show fwd stats all"))
+
+    def xstats(self, port="all") -> dict:
+        """Sample the extended port statistics
+
+        Args:
+            self: self
+            port: port ID, or "all" (default "all")
+
+        Returns:
+            dict: XStats by port ID
+        """
+        return parse_xstats(self.execute(f"show port xstats {port}"))
+
+    def wait_for_rate(
+        self,
+        rate: str = "tx_pps",
+        minimum: float = 0,
+        port=ALL_PORTS,
+        timeout: float = 10,
+        interval: float = 0.5,
+    ) -> StatsRates:
+        """Sample the forwarding statistics until a rate of a port is above
+           minimum
+
+        Args:
+            self:             self
+            rate (str):       StatsRates attribute, "rx_pps" or "tx_pps"
+                              (default "tx_pps")
+            minimum (float):  rate to exceed (default 0)
+            port:             port ID, or ALL_PORTS (default ALL_PORTS)
+            timeout (float):  seconds to wait (default 10)
+            interval (float): seconds between the samples (default 0.5)
+
+        Returns:
+            StatsRates: the rates of the last samples if the rate exceeded
+                        minimum before the timeout, None otherwise
+        """
+        deadline = time.monotonic() + timeout
+        previous = self.fwd_stats().get(port)
+        while time.monotonic() < deadline:
+            time.sleep(interval)
+            current = self.fwd_stats().get(port)
+            if previous is not None and current is not None:
+                rates = current.rates(previous)
+                if getattr(rates, rate) > minimum:
+                    return rates
+            previous = current
+        return None
+
+
+class TestPmdInstance:
+    # not a test class, despite the name
+    __test__ = False
+
+    def __init__(self, name: str, tmux_session: str, cmd: str, pci: str = None):
+        """Init a testpmd instance started in a tmux session by
+           launch_testpmd_instances()
+
+        Args:
+            self:               self
+            name (str):         name of the instance, e.g. its container name
+            tmux_session (str): tmux session name
+            cmd (str):          the command starting testpmd in interactive
+                                mode; parallel instances must use their own
+                                CPUs, and their own hugepages with
+                                --file-prefix and -m INSTANCE_MEMORY
+            pci (str):          PCI address of the device of the instance,
+                                bound to the DPDK driver before the launch
+                                (default None)
+        """
+        self.name = name
+        self.tmux_session = tmux_session
+        self.cmd = cmd
+        self.pci = pci
+        # seconds from the start of the tmux session to the testpmd prompt, None
+        # if not ready
+        self.ready_time = None
+
+
+def launch_testpmd_instances(
+    ssh_obj: ShellHandler, instances: list, driver: str = "vfio-pci", timeout: int = 15
+) -> bool:
+    """Bind the devices of testpmd instances to the DPDK driver in one
+       command, start the instances in their tmux sessions at the same time,
+       and wait for all of them to be ready
+
+    Args:
+        ssh_obj:         ssh connection obj
+        instances (list): TestPmdInstance objects
+        driver (str):    driver of the devices, None to leave them bound as
+                         they are (default "vfio-pci")
+        timeout (int):   seconds to wait for the instances (default 15)
+
+    Returns:
+        bool: True if every instance is ready; the ready_time of the
+              instances is set to the seconds from their start to the prompt
+
+    Raises:
+        AssertionError: a device could not be bound, or a tmux session
+                        could not be started
+    """
+    if driver is not None:
+        devices = [
+            (instance.pci, driver) for instance in instances if instance.pci is not None
+        ]
+        results = bind_drivers(ssh_obj, devices)
+        assert all(ok for ok, _ in results.values()), results
+    steps = []
+    for instance in instances:
+        steps += start_tmux_steps(instance.tmux_session, instance.cmd)
+    execute_and_assert(ssh_obj, steps, 0)
+    started = wait_tmux_testpmd_sessions(
+        ssh_obj, [instance.tmux_session for instance in instances], timeout
+    )
+    for instance in instances:
+        instance.ready_time = started[instance.tmux_session]
+    return all(instance.ready_time is not None for instance in instances)
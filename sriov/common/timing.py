@@ -0,0 +1,296 @@
+import html
+import json
+import sys
+import threading
+import time
+
+
+class CommandTiming:
+    def __init__(
+        self, host: str, name: str, test: str, helper: str, kind: str, cmd: str
+    ) -> None:
+        """Init the timing record of one ShellHandler call
+
+        Args:
+            self:        self
+            host (str):  host of the ShellHandler
+            name (str):  name of the ShellHandler, e.g. "dut"
+            test (str):  pytest node id of the running test, or None
+            helper (str): outermost sriov.common.utils function in the call
+                          stack, or None
+            kind (str):  ShellHandler method, e.g. "execute"
+            cmd (str):   the command
+        """
+        self.host = host
+        self.name = name
+        self.test = test
+        self.helper = helper
+        self.kind = kind
+        self.cmd = cmd
+        self.timestamp = time.time()
+        # time.monotonic() values: call, first write, first byte read, return
+        self.start = time.monotonic()
+        self.sent = None
+        self.first_byte = None
+        self.done = None
+        self.bytes = 0
+        self.lines = 0
+        self.exit_status = None
+
+    @property
+    def duration(self) -> float:
+        """Seconds from the call to the return"""
+        return self.done - self.start
+
+    @property
+    def remote_wait(self) -> float:
+        """Seconds from the first write to the return, i.e. waiting on the host"""
+        return self.done - (self.sent if self.sent is not None else self.start)
+
+    def to_dict(self) -> dict:
+        """Convert the record for the JSON report
+
+        Args:
+            self: self
+
+        Returns:
+            dict: the record, with the times relative to the call
+        """
+
+        def relative(value):
+            return None if value is None else round(value - self.start, 6)
+
+        return {
+            "host": self.host,
+            "name": self.name,
+            "test": self.test,
+            "helper": self.helper,
+            "kind": self.kind,
+            "cmd": self.cmd,
+            "timestamp": self.timestamp,
+            "sent": relative(self.sent),
+            "first_byte": relative(self.first_byte),
+            "duration": relative(self.done),
+            "bytes": self.bytes,
+            "lines": self.lines,
+            "exit_status": self.exit_status,
+        }
+
+
+class TimingRecorder:
+    def __init__(self) -> None:
+        """Init the recorder of the ShellHandler calls of the session
+
+        Args:
+            self: self
+        """
+        self.records = []
+        # pytest node id -> wall time of the test
+        self.tests = {}
+        self.current_test = None
+        self.lock = threading.Lock()
+        # record of the call running in the thread, updated by the I/O
+        self.local = threading.local()
+
+    @staticmethod
+    def _helper() -> str:
+        """Find the helper of utils.py the command is run for
+
+        Returns:
+            str: name of the outermost sriov.common.utils function in the stack
+        """
+        helper = None
+        frame = sys._getframe(2)
+        while frame is not None:
+            if frame.f_globals.get("__name__") == "sriov.common.utils":
+                helper = frame.f_code.co_name
+            frame = frame.f_back
+        return helper
+
+    def start(self, handler, kind: str, cmd: str) -> CommandTiming:
+        """Start the record of a ShellHandler call
+
+        Args:
+            self:       self
+            handler:    the ShellHandler
+            kind (str): ShellHandler method
+            cmd (str):  the command
+
+        Returns:
+            CommandTiming: the record, None for a call nested in a recorded one
+        """
+        if getattr(self.local, "record", None) is not None:
+            return None
+        record = CommandTiming(
+            handler.host, handler.name, self.current_test, self._helper(), kind, cmd
+        )
+        self.local.record = record
+        return record
+
+    def finish(self, record: CommandTiming, exit_status: int, lines: int) -> None:
+        """Complete and store the record of a ShellHandler call
+
+        Args:
+            self:              self
+            record:            the record returned by start()
+            exit_status (int): exit status of the call
+            lines (int):       number of output lines returned
+        """
+        record.done = time.monotonic()
+        record.exit_status = exit_status
+        record.lines = lines
+        self.local.record = None
+        with self.lock:
+            self.records.append(record)
+
+    def sent(self) -> None:
+        """Note that the running call wrote to the host
+
+        Args:
+            self: self
+        """
+        record = getattr(self.local, "record", None)
+        if record is not None and record.sent is None:
+            record.sent = time.monotonic()
+
+    def received(self, nbytes: int) -> None:
+        """Note that the running call read from the host
+
+        Args:
+            self:         self
+            nbytes (int): number of bytes read
+        """
+        record = getattr(self.local, "record", None)
+        if record is not None and nbytes:
+            if record.first_byte is None:
+                record.first_byte = time.monotonic()
+            record.bytes += nbytes
+
+    def test_finished(self, nodeid: str, wall: float) -> None:
+        """Store the wall time of a test
+
+        Args:
+            self:         self
+            nodeid (str): pytest node id
+            wall (float): seconds spent in setup, call and teardown
+        """
+        self.tests[nodeid] = wall
+
+    def report(self, slowest: int = 20) -> dict:
+        """Summarize the records
+
+        Args:
+            self:          self
+            slowest (int): number of slowest commands to list (default 20)
+
+        Returns:
+            dict: "slowest" commands, per "helpers" totals, and per "tests" wall
+                  time split between remote wait and local overhead
+        """
+        with self.lock:
+            records = list(self.records)
+        helpers = {}
+        tests = {
+            nodeid: {"wall": wall, "remote_wait": 0.0, "commands": 0}
+            for nodeid, wall in self.tests.items()
+        }
+        for record in records:
+            if record.helper is not None:
+                helper = helpers.setdefault(
+                    record.helper, {"commands": 0, "total": 0.0, "bytes": 0}
+                )
+                helper["commands"] += 1
+                helper["total"] += record.duration
+                helper["bytes"] += record.bytes
+            if record.test in tests:
+                tests[record.test]["remote_wait"] += record.remote_wait
+                tests[record.test]["commands"] += 1
+        for test in tests.values():
+            # commands run in parallel threads may overlap
+            test["local"] = max(test["wall"] - test["remote_wait"], 0.0)
+        records.sort(key=lambda record: record.duration, reverse=True)
+        return {
+            "commands": len(records),
+            "slowest": [record.to_dict() for record in records[:slowest]],
+            "helpers": dict(
+                sorted(helpers.items(), key=lambda item: item[1]["total"], reverse=True)
+            ),
+            "tests": tests,
+        }
+
+    def write_json(self, path: str) -> None:
+        """Write the report and every record to a JSON file
+
+        Args:
+            self:       self
+            path (str): path of the file
+        """
+        report = self.report()
+        with self.lock:
+            report["records"] = [record.to_dict() for record in self.records]
+        with open(path, "w") as f:
+            json.dump(report, f, indent=1)
+
+    def html_summary(self, slowest: int = 10) -> str:
+        """Render the report for the pytest-html summary
+
+        Args:
+            self:          self
+            slowest (int): number of slowest commands to list (default 10)
+
+        Returns:
+            str: HTML tables of the slowest commands, helpers and tests
+        """
+        report = self.report(slowest)
+
+        def table(title: str, header: list, rows: list) -> str:
+            cells = "".join(f"<th>{html.escape(str(cell))}</th>" for cell in header)
+            body = "".join(
+                "<tr>"
+                + "".join(f"<td>{html.escape(str(cell))}</td>" for cell in row)
+                + "</tr>"
+                for row in rows
+            )
+            return f"<h3>{title}</h3><table><tr>{cells}</tr>{body}</table>"
+
+        return (
+            table(
+                f"Slowest commands (of {report['commands']})",
+                ["seconds", "first byte", "host", "helper", "command"],
+                [
+                    [
+                        record["duration"],
+                        record["first_byte"],
+                        record["name"],
+                        record["helper"],
+                        record["cmd"],
+                    ]
+                    for record in report["slowest"]
+                ],
+            )
+            + table(
+                "Helpers",
+                ["helper", "commands", "seconds"],
+                [
+                    [name, helper["commands"], round(helper["total"], 3)]
+                    for name, helper in report["helpers"].items()
+                ],
+            )
+            + table(
+                "Tests",
+                ["test", "wall", "remote wait", "local"],
+                [
+                    [
+                        nodeid,
+                        round(test["wall"], 3),
+                        round(test["remote_wait"], 3),
+                        round(test["local"], 3),
+                    ]
+                    for nodeid, test in report["tests"].items()
+                ],
+            )
+        )
+
+
+# the recorder of the ShellHandler calls of the session
+TIMING = TimingRecorder()
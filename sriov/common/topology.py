@@ -0,0 +1,385 @@
+import json
+import os
+import re
+import shlex
+import threading
+from sriov.common.exec import ShellHandler
+
+
+# the ID of the current boot of a host, a new one after each reboot
+BOOT_ID_PATH = "/proc/sys/kernel/random/boot_id"
+# local file of the topologies of the hosts, kept across the sessions
+DEFAULT_CACHE_PATH = os.path.join(
+    os.path.expanduser("~"), ".cache", "sriov", "topology.json"
+)
+
+# Bash function printing the topology of an interface on one line:
+# "intf <name> <pci> <driver> <numa node> <totalvfs> <VF offset> <VF stride>
+# <vendor> <device>", "-" for a missing value, or "missing <name>"; the VF
+# offset and stride may change with the number of VFs, they are only read
+# while the PF has VFs
+TOPOLOGY_FUNCTION = (
+    "q() { d=/sys/class/net/$1/device; "
+    '[ -e "$d" ] || { echo "missing $1"; return; }; '
+    'p=$(readlink -f "$d"); r=$(readlink "$d/driver"); r=${r##*/}; '
+    'n=$(cat "$d/sriov_numvfs" 2>/dev/null || echo 0); '
+    'echo "intf $1 ${p##*/} ${r:--} '
+    '$(cat "$d/numa_node" 2>/dev/null || echo -1) '
+    '$(cat "$d/sriov_totalvfs" 2>/dev/null || echo 0) '
+    '$([ "$n" -gt 0 ] && cat "$d/sriov_offset" 2>/dev/null || echo -) '
+    '$([ "$n" -gt 0 ] && cat "$d/sriov_stride" 2>/dev/null || echo -) '
+    '$(cat "$d/vendor") $(cat "$d/device")"; }'
+)
+
+
+class PfTopology:
+    def __init__(
+        self,
+        name: str,
+        pci: str,
+        driver: str = None,
+        numa_node: int = -1,
+        total_vfs: int = 0,
+        vf_offset: int = None,
+        vf_stride: int = None,
+        vendor: str = None,
+        device: str = None,
+        model: str = None,
+    ) -> None:
+        """Init the topology of a PF
+
+        Args:
+            self:            self
+            name (str):      interface name, e.g. "ens2f0"
+            pci (str):       PCI address, e.g. "0000:17:00.0"
+            driver (str):    driver the PF is bound to, e.g. "ice"
+            numa_node (int): NUMA node of the PF, -1 if unknown
+            total_vfs (int): sriov_totalvfs of the PF
+            vf_offset (int): routing ID offset of the first VF, read while the
+                             PF had VFs, None if unknown
+            vf_stride (int): routing ID stride of the VFs, read while the PF
+                             had VFs, None if unknown
+            vendor (str):    PCI vendor ID, e.g. "0x8086"
+            device (str):    PCI device ID, e.g. "0x1592"
+            model (str):     NIC model reported by lshw, None if unknown
+        """
+        self.name = name
+        self.pci = pci
+        self.driver = driver
+        self.numa_node = numa_node
+        self.total_vfs = total_vfs
+        self.vf_offset = vf_offset
+        self.vf_stride = vf_stride
+        self.vendor = vendor
+        self.device = device
+        self.model = model
+
+    @classmethod
+    def from_line(cls, line: str) -> "PfTopology":
+        """Parse an "intf" line of TOPOLOGY_FUNCTION
+
+        Args:
+            line (str): the line
+
+        Returns:
+            PfTopology: the topology of the PF
+        """
+        parts = [None if part == "-" else part for part in line.split()[1:]]
+        name, pci, driver, numa_node, total_vfs, offset, stride = parts[:7]
+        return cls(
+            name,
+            pci,
+            driver,
+            int(numa_node),
+            int(total_vfs),
+            int(offset) if offset is not None else None,
+            int(stride) if stride is not None else None,
+            *parts[7:9],
+        )
+
+    def vf_pci(self, vf: int) -> str:
+        """Compute the PCI address of a VF from the offset and stride of the
+           PF, without creating it
+
+        Args:
+            self:     self
+            vf (int): VF index, e.g. 0 for the VF of netdev <pf>v0
+
+        Returns:
+            str: PCI address of the VF, None if the offset or stride is unknown,
+                 e.g. they were read while the PF had no VFs
+        """
+        if self.vf_offset is None or self.vf_stride is None:
+            return None
+        domain, bus, devfn = self.pci.rsplit(":", 2)
+        dev, fn = devfn.split(".")
+        # the routing ID is bus, device and function, an 8 bit bus number
+        # followed by a 5 bit device and a 3 bit function number
+        rid = (int(bus, 16) << 8) + (int(dev, 16) << 3) + int(fn)
+        rid += self.vf_offset + vf * self.vf_stride
+        return f"{domain}:{rid >> 8:02x}:{(rid >> 3) & 0x1F:02x}.{rid & 0x7}"
+
+    def to_dict(self) -> dict:
+        """Convert the topology for the JSON cache
+
+        Args:
+            self: self
+
+        Returns:
+            dict: the attributes of the topology
+        """
+        return dict(vars(self))
+
+
+class HostTopology:
+    def __init__(self, host: str, boot_id: str, interfaces: dict = None) -> None:
+        """Init the topology of a host
+
+        Args:
+            self:              self
+            host (str):        host name or address
+            boot_id (str):     boot ID of the host when the topology was read
+            interfaces (dict): PfTopology by interface name (default empty)
+        """
+        self.host = host
+        self.boot_id = boot_id
+        self.interfaces = interfaces if interfaces is not None else {}
+
+    def has(self, names: list) -> bool:
+        """Check that the topology has interfaces
+
+        Args:
+            self:         self
+            names (list): interface names
+
+        Returns:
+            bool: True if every interface is in the topology
+        """
+        return all(name in self.interfaces for name in names)
+
+    @classmethod
+    def discover(cls, ssh_obj: ShellHandler, names: list) -> "HostTopology":
+        """Read the boot ID and the topology of interfaces in one command
+
+        Args:
+            ssh_obj (ShellHandler): ssh connection obj of the host
+            names (list):           interface names
+
+        Returns:
+            HostTopology: the topology of the interfaces found on the host
+
+        Raises:
+            Exception: command failure
+        """
+        cmd = (
+            f"( echo boot $(cat {BOOT_ID_PATH}); {TOPOLOGY_FUNCTION}; "
+            + "".join(f"q {shlex.quote(name)}; " for name in names)
+            + "command -v lshw >/dev/null && "
+            "lshw -C network -businfo 2>/dev/null | sed 's/^/lshw /'; true )"
+        )
+        ssh_obj.log_str(cmd)
+        code, out, err = ssh_obj.execute(cmd, 60)
+        if code != 0:
+            raise Exception(err)
+        topology = cls(ssh_obj.host, None)
+        models = {}
+        for line in out:
+            if line.startswith("boot "):
+                topology.boot_id = line.split()[1]
+            elif line.startswith("intf "):
+                pf = PfTopology.from_line(line)
+                topology.interfaces[pf.name] = pf
+            elif line.startswith("lshw pci@"):
+                # e.g. "pci@0000:17:00.0  ens2f0  network  Ethernet Controller E810"
+                columns = re.split(r"\s{2,}", line.split("@", 1)[1].strip())
+                models[columns[0]] = columns[-1]
+        for pf in topology.interfaces.values():
+            pf.model = models.get(pf.pci)
+        return topology
+
+    def to_dict(self) -> dict:
+        """Convert the topology for the JSON cache
+
+        Args:
+            self: self
+
+        Returns:
+            dict: the topology
+        """
+        return {
+            "boot_id": self.boot_id,
+            "interfaces": {
+                name: pf.to_dict() for name, pf in self.interfaces.items()
+            },
+        }
+
+    @classmethod
+    def from_dict(cls, host: str, data: dict) -> "HostTopology":
+        """Load a topology of the JSON cache
+
+        Args:
+            host (str):  host name or address
+            data (dict): the topology, see to_dict
+
+        Returns:
+            HostTopology: the topology
+        """
+        interfaces = {
+            name: PfTopology(**pf) for name, pf in data["interfaces"].items()
+        }
+        return cls(host, data["boot_id"], interfaces)
+
+
+class TopologyCache:
+    def __init__(self, path: str = DEFAULT_CACHE_PATH) -> None:
+        """Init the cache of the topologies of the hosts
+
+        The topologies are kept in a local JSON file by host, with the boot ID
+        of the host; a reboot changes the boot ID, and the topology is read
+        again. A host is checked once per session.
+
+        Args:
+            self:       self
+            path (str): path of the JSON file, None to keep the topologies
+                        in memory only (default DEFAULT_CACHE_PATH)
+        """
+        self.path = path
+        # topologies checked during this session, by host
+        self.topologies = {}
+        # guards the topologies, the host locks and the JSON file
+        self.lock = threading.Lock()
+        # held during the remote commands of a host, so that the hosts are
+        # read at the same time, and a host only once
+        self.host_locks = {}
+
+    def _load(self) -> dict:
+        """Read the JSON file
+
+        Args:
+            self: self
+
+        Returns:
+            dict: the cached topologies by host, empty if there is no file
+        """
+        if self.path is None or not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except ValueError:
+            # a corrupted cache is rebuilt
+            return {}
+
+    def _save(self, topology: HostTopology) -> None:
+        """Write the topology of a host to the JSON file
+
+        Args:
+            self:                   self
+            topology (HostTopology): the topology
+        """
+        if self.path is None:
+            return
+        data = self._load()
+        data[topology.host] = topology.to_dict()
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        # written aside and renamed, so a concurrent session never reads a
+        # partial file
+        tmp_path = f"{self.path}.{os.getpid()}"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def _host_lock(self, host: str) -> threading.Lock:
+        """Get the lock held during the remote commands of a host
+
+        Args:
+            self:       self
+            host (str): host name or address
+
+        Returns:
+            threading.Lock: the lock of the host
+        """
+        with self.lock:
+            return self.host_locks.setdefault(host, threading.Lock())
+
+    def get(self, ssh_obj: ShellHandler, names: list) -> HostTopology:
+        """Get the topology of interfaces of a host
+
+        The first call of a session for a host reads its boot ID, and uses the
+        cached topology if it is from the same boot. The interfaces missing
+        from the topology are discovered, and the cache is updated.
+
+        Args:
+            ssh_obj (ShellHandler): ssh connection obj of the host
+            names (list):           interface names
+
+        Returns:
+            HostTopology: the topology of the host
+
+        Raises:
+            Exception: an interface is not found on the host
+        """
+        with self._host_lock(ssh_obj.host):
+            with self.lock:
+                topology = self.topologies.get(ssh_obj.host)
+                cached = self._load().get(ssh_obj.host) if topology is None else None
+            if cached is not None:
+                cmd = f"cat {BOOT_ID_PATH}"
+                ssh_obj.log_str(cmd)
+                code, out, err = ssh_obj.execute(cmd)
+                if code == 0 and out and out[0].strip() == cached["boot_id"]:
+                    topology = HostTopology.from_dict(ssh_obj.host, cached)
+            if topology is None or not topology.has(names):
+                discovered = HostTopology.discover(ssh_obj, names)
+                if topology is not None and topology.boot_id == discovered.boot_id:
+                    topology.interfaces.update(discovered.interfaces)
+                else:
+                    topology = discovered
+                with self.lock:
+                    self._save(topology)
+            with self.lock:
+                self.topologies[ssh_obj.host] = topology
+        missing = [name for name in names if name not in topology.interfaces]
+        if missing:
+            raise Exception(f"{ssh_obj.name}: interfaces not found: {missing}")
+        return topology
+
+    def refresh(self, ssh_obj: ShellHandler, names: list) -> HostTopology:
+        """Read the topology of interfaces of a host again and update the cache,
+           e.g. to get the VF offset and stride of a PF once it has VFs
+
+        Args:
+            self:                   self
+            ssh_obj (ShellHandler): ssh connection obj of the host
+            names (list):           interface names
+
+        Returns:
+            HostTopology: the topology of the host
+
+        Raises:
+            Exception: command failure
+        """
+        with self._host_lock(ssh_obj.host):
+            discovered = HostTopology.discover(ssh_obj, names)
+            with self.lock:
+                topology = self.topologies.get(ssh_obj.host)
+                if topology is not None and topology.boot_id == discovered.boot_id:
+                    topology.interfaces.update(discovered.interfaces)
+                else:
+                    topology = discovered
+                self._save(topology)
+                self.topologies[ssh_obj.host] = topology
+        return topology
+
+    def clear(self) -> None:
+        """Forget the topologies checked during this session
+
+        Args:
+            self: self
+        """
+        with self.lock:
+            self.topologies = {}
+
+
+# the topology cache of the session
+TOPOLOGY = TopologyCache()
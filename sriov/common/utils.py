@@ -1,8 +1,118 @@
+from concurrent.futures import ThreadPoolExecutor
+import functools
+import json
 import re
+import shlex
+from sriov.common.agent import AgentError
 from sriov.common.configtestdata import ConfigTestData
+from sriov.common.containers import CONTAINERS
 from sriov.common.exec import ShellHandler
 import time
-from typing import Tuple
+from typing import Callable, Tuple
+
+
+# output of a tmux session started by start_tmux, after the start time in ns
+TMUX_LOG = "/tmp/sriov-tmux-{}.log"
+# waits up to $2 seconds for the testpmd prompt in the log of the tmux session
+# $1 as it is written, and prints "<session> ready <microseconds since start_tmux>",
+# "<session> exited" or "<session> timeout"; the prompt does not end with a
+# newline, it is found in the partial line read when read times out
+TMUX_TESTPMD_WAITER = (
+    "w() { s=$1; log=" + TMUX_LOG.format("$s") + "; "
+    '[ -f $log ] || { echo "$s exited"; return; }; '
+    "read -r start < $log; "
+    "exec 3< <(exec tail -c +1 -F $log 2>/dev/null); tp=$!; "
+    "(while tmux has-session -t $s 2>/dev/null; do sleep 0.2; done; "
+    "kill $tp 2>/dev/null) & wd=$!; "
+    'end=$((SECONDS + $2)); rc=timeout; part=""; '
+    "while [ $SECONDS -le $end ]; do "
+    'if IFS= read -r -t 0.01 line <&3; then rec=$line; part=""; '
+    'elif [ $? -gt 128 ]; then part=$part$line; rec=$part; '
+    "else rc=exited; break; fi; "
+    'case $rec in *testpmd\\>*|*"Press enter to exit"*) rc=ready; break;; esac; '
+    "done; kill $tp $wd 2>/dev/null; exec 3<&-; "
+    'if [ $rc = ready ]; then echo "$s ready $(( ($(date +%s%N) - start) / 1000 ))"; '
+    'else echo "$s $rc"; fi; }'
+)
+
+# sends quit to the testpmd of the tmux sessions named {prefix} followed by a
+# number, waits up to {tries} tenths of a second for the sessions to end, kills
+# the sessions left and prints "stopped <session>" for each of them
+TMUX_TESTPMD_STOPPER = (
+    "( s=; for t in $(tmux ls -F '#S' 2>/dev/null); do case $t in {prefix}[0-9]*) "
+    's="$s $t"; tmux send-keys -t "=$t:" quit ENTER;; esac; done; n=0; '
+    'while [ -n "$s" ] && [ $n -lt {tries} ]; do a=; for t in $s; do '
+    'tmux has-session -t "=$t" 2>/dev/null && a=1; done; [ -z "$a" ] && break; '
+    "sleep 0.1; n=$((n + 1)); done; "
+    'for t in $s; do tmux kill-session -t "=$t" 2>/dev/null; '
+    "rm -f " + TMUX_LOG.format("$t") + '; echo "stopped $t"; done; true )'
+)
+
+# writes $2 to sriov_numvfs of the PF $1 and waits up to $3 seconds for $2 VF
+# netdevs and PCI functions, woken up by the link events of ip monitor, then
+# prints "numvfs <pf> <num_vfs> <netdevs> <functions> <microseconds>", or
+# "numvfs <pf> <num_vfs> failed" if the write failed
+NUMVFS_WAITER = (
+    "v() { dev=/sys/class/net/$1/device; "
+    "exec 3< <(exec ip monitor link 2>/dev/null); mp=$!; "
+    "start=$(date +%s%N); "
+    'if ! echo $2 > $dev/sriov_numvfs; then echo "numvfs $1 $2 failed"; '
+    "kill $mp 2>/dev/null; exec 3<&-; return; fi; "
+    "end=$((SECONDS + $3)); "
+    "while :; do "
+    "nd=$(ls -d /sys/class/net/$1v* 2>/dev/null | wc -l); "
+    "nf=$(ls -d $dev/virtfn* 2>/dev/null | wc -l); "
+    "if [ $nd -eq $2 ] && [ $nf -eq $2 ] || [ $SECONDS -gt $end ]; then break; fi; "
+    "read -r -t 0.1 line <&3 || [ $? -gt 128 ] || sleep 0.1; "
+    "done; kill $mp 2>/dev/null; exec 3<&-; "
+    'echo "numvfs $1 $2 $nd $nf $(( ($(date +%s%N) - start) / 1000 ))"; }'
+)
+
+# binds the PCI device $1 to the driver $2, with driverctl if $dc is 1 or with
+# the sysfs unbind, driver_override and bind writes otherwise, and prints
+# "bind <pci> <driver> <exit status> <microseconds> <error>"; sets f=1 on error
+BIND_DRIVER_FUNCTION = (
+    "b() { dev=/sys/bus/pci/devices/$1; s=$(date +%s%N); "
+    "if [ $dc = 1 ]; then e=$(driverctl --nosave set-override $1 $2 2>&1); "
+    "else e=$( { if [ -e $dev/driver ]; then echo $1 > $dev/driver/unbind; fi "
+    "&& echo $2 > $dev/driver_override "
+    "&& echo $1 > /sys/bus/pci/drivers/$2/bind; } 2>&1 ); fi; "
+    "r=$?; [ $r = 0 ] || f=1; "
+    "echo \"bind $1 $2 $r $(( ($(date +%s%N) - s) / 1000 )) ${e//$'\\n'/ }\"; }"
+)
+
+# runs the condition on the host every {interval} seconds until it exits with
+# {exit_code} or the deadline is passed, then prints "wait_until output", its
+# last output and "wait_until <exit status> <attempts> <microseconds>"
+WAIT_UNTIL_LOOP = (
+    "( n=0; s=$(date +%s%N); e=$((s + {timeout_ns})); while :; do n=$((n + 1)); "
+    "o=$( {{ {condition}; }} 2>&1 ); r=$?; t=$(date +%s%N); "
+    "[ $r = {exit_code} ] || [ $t -ge $e ] && break; sleep {interval}; done; "
+    "echo 'wait_until output'; [ -z \"$o\" ] || printf '%s\\n' \"$o\"; "
+    "echo \"wait_until $r $n $(( (t - s) / 1000 ))\" )"
+)
+
+
+def agent_available(ssh_obj: ShellHandler) -> bool:
+    """Check if the helpers can send their requests to the agent of ssh_obj
+
+    Args:
+        ssh_obj: ssh_obj to the remote host
+
+    Returns:
+        bool: True if the agent is running
+    """
+    return ssh_obj.agent is not None and ssh_obj.agent.channel is not None
+
+
+def agent_failed(ssh_obj: ShellHandler, err: AgentError) -> None:
+    """Report that the agent stopped answering; the helpers use shell commands
+
+    Args:
+        ssh_obj:         ssh_obj to the remote host
+        err (AgentError): the agent failure
+    """
+    ssh_obj.log_str(f"agent: {err}, falling back to shell commands")
 
 
 def get_pci_address(ssh_obj: ShellHandler, iface: str) -> str:
@@ -18,6 +128,11 @@ def get_pci_address(ssh_obj: ShellHandler, iface: str) -> str:
     Raises:
         Exception: command failure
     """
+    if agent_available(ssh_obj):
+        try:
+            return ssh_obj.agent.call("readlink", path=f"/sys/class/net/{iface}/device")
+        except AgentError as err:
+            agent_failed(ssh_obj, err)
     cmd = "ethtool -i {}".format(iface) + " | awk '/bus-info:/{print $2;}'"
     ssh_obj.log_str(cmd)
     code, out, err = ssh_obj.execute(cmd)
@@ -41,6 +156,12 @@ def bind_driver(ssh_obj: ShellHandler, pci: str, driver: str, timeout: int = 5)
     Raises:
         Exception: command failure
     """
+    if agent_available(ssh_obj):
+        try:
+            ssh_obj.log_str(f"agent: bind {pci} to {driver}")
+            return ssh_obj.agent.call("bind_driver", timeout, pci=pci, driver=driver)
+        except AgentError as err:
+            agent_failed(ssh_obj, err)
     device_path = "/sys/bus/pci/devices/" + pci
     steps = [
         "modprobe {}".format(driver),
@@ -50,19 +171,85 @@ def bind_driver(ssh_obj: ShellHandler, pci: str, driver: str, timeout: int = 5)
     ]
     for step in steps:
         ssh_obj.log_str(step)
-        code, out, err = ssh_obj.execute(step, timeout)
+        ssh_obj.submit(step, timeout)
+    for future in ssh_obj.flush(stop_on_error=True):
+        code, out, err = future.result()
         if code != 0:
             raise Exception(err)
     return True
 
 
+def bind_drivers_cmd(devices: list, driverctl: bool = None) -> str:
+    """Get the command binding PCI devices to drivers, see bind_drivers
+
+    Args:
+        devices (list):   (pci, driver) tuples
+        driverctl (bool): bind with driverctl, None to use it if it is
+                          installed (default None)
+
+    Returns:
+        str: the command, which fails if a device could not be bound
+    """
+    if driverctl is None:
+        dc = "$(command -v driverctl >/dev/null && echo 1 || echo 0)"
+    else:
+        dc = "1" if driverctl else "0"
+    drivers = sorted({driver for _, driver in devices})
+    # each module is loaded once, unless its PCI driver is already registered
+    modprobe = "".join(
+        f"[ -d /sys/bus/pci/drivers/{driver} ] || modprobe {driver}; "
+        for driver in drivers
+    )
+    binds = "".join(f"b {pci} {driver}; " for pci, driver in devices)
+    return f"( f=0; dc={dc}; {BIND_DRIVER_FUNCTION}; {modprobe}{binds}exit $f )"
+
+
+def bind_drivers(
+    ssh_obj: ShellHandler, devices: list, timeout: int = 30, driverctl: bool = None
+) -> dict:
+    """Bind PCI devices to drivers in one remote command
+
+    Example:
+        results = bind_drivers(dut, [(pci, "vfio-pci") for pci in vf_pcis])
+        assert all(ok for ok, seconds in results.values())
+
+    Args:
+        ssh_obj:          ssh connection obj
+        devices (list):   (pci, driver) tuples, e.g. ("0000:17:01.0", "vfio-pci")
+        timeout (int):    seconds of timeout for execute (default 30)
+        driverctl (bool): bind with driverctl, None to use it if it is
+                          installed (default None)
+
+    Returns:
+        dict: (success, seconds) tuple by PCI address; a device missing from
+              the output, e.g. on timeout, is (False, None)
+    """
+    results = {pci: (False, None) for pci, _ in devices}
+    if not devices:
+        return results
+    ssh_obj.log_str(f"bind {' '.join(f'{pci}:{driver}' for pci, driver in devices)}")
+    code, out, err = ssh_obj.execute(bind_drivers_cmd(devices, driverctl), timeout)
+    # in the interactive shell, the output of a failed command is in err
+    for line in out + err:
+        parts = line.split(maxsplit=5)
+        if len(parts) < 5 or parts[0] != "bind" or parts[1] not in results:
+            continue
+        results[parts[1]] = (parts[3] == "0", int(parts[4]) / 1000000)
+        if parts[3] != "0":
+            ssh_obj.log_str(
+                f"bind {parts[1]} to {parts[2]} failed: {' '.join(parts[5:]).strip()}"
+            )
+    return results
+
+
 def bind_driver_with_dpdk(
     settings: object, ssh_obj: ShellHandler, pci: str, driver: str, timeout: int = 5
 ) -> bool:
     """Bind the PCI address to the driver using dpdk-devbind.py
-        in the dpdk container
+        in the helper container of the dpdk image
 
     Args:
+        settings:      settings obj
         ssh_obj:       ssh_obj to the remote host
         pci (str):     PCI address, example "0000:17:00.0"
         driver (str):  driver name, example "vfio-pci"
@@ -74,23 +261,19 @@ def bind_driver_with_dpdk(
     Raises:
         Exception: command failure
     """
+    step = "modprobe {}".format(driver)
+    ssh_obj.log_str(step)
+    code, out, err = ssh_obj.execute(step, timeout)
+    if code != 0:
+        raise Exception(err)
 
-    # use dpdk-devbind.py within the dpdk container to do the binding
-    dpdk_devbind_cmd = (
-        f"{settings.config['container_manager']} run -it --rm --privileged "
-        f"{settings.config['container_volumes']} "
-        f"{settings.config['dpdk_img']} dpdk-devbind.py -b {driver} {pci}\n"
+    # dpdk-devbind.py runs by exec in a long-lived container of the dpdk
+    # image, rather than in a new container per call
+    code, out, err = CONTAINERS.get(ssh_obj, settings).run(
+        settings.config["dpdk_img"], f"dpdk-devbind.py -b {driver} {pci}", timeout
     )
-
-    steps = [("modprobe {}".format(driver), None), (dpdk_devbind_cmd, "Error")]
-
-    for step, errorOnStr in steps:
-        ssh_obj.log_str(step)
-        # use executeWithSearch because you cannot get the errorcode
-        # from the container, so we search stdout for a desired error string
-        code, out, err = ssh_obj.executeWithSearch(step, errorOnStr, timeout)
-        if code != 0:
-            raise Exception(err)
+    if code != 0 or any("Error" in line for line in out):
+        raise Exception(err or out)
     return True
 
 
@@ -479,6 +662,31 @@ def reset_mtu(tgen: ShellHandler, dut: ShellHandler, testdata: ConfigTestData) -
     return True
 
 
+def start_tmux_steps(name: str, cmd: str) -> list:
+    """Get the commands that run cmd in a tmux session
+
+    The output of the session is appended to its log from the start, after
+    the start time, for wait_tmux_testpmd_sessions: cmd waits for pipe-pane
+    to be set up.
+
+    Args:
+        name (str): tmux session name
+        cmd (str):  a single command to run
+
+    Returns:
+        list: the commands
+    """
+    log = TMUX_LOG.format(name)
+    wrapped = f"tmux wait-for {name}-log; {cmd}"
+    return [
+        f"tmux kill-session -t {name} || true",
+        f"date +%s%N > {log}",
+        f"tmux new-session -s {name} -d {shlex.quote(wrapped)}",
+        f"tmux pipe-pane -t {name} 'cat >> {log}'",
+        f"tmux wait-for -S {name}-log",
+    ]
+
+
 def start_tmux(ssh_obj: ShellHandler, name: str, cmd: str) -> bool:
     """Run cmd in a tmux session
 
@@ -493,13 +701,7 @@ def start_tmux(ssh_obj: ShellHandler, name: str, cmd: str) -> bool:
     Raises:
         Exception: command failure
     """
-
-    steps = [
-        f"tmux kill-session -t {name} || true",
-        f"tmux new-session -s {name} -d {cmd}",
-    ]
-
-    for step in steps:
+    for step in start_tmux_steps(name, cmd):
         ssh_obj.log_str(step)
         code, _, err = ssh_obj.execute(step)
         if code != 0:
@@ -520,7 +722,7 @@ def stop_tmux(ssh_obj: ShellHandler, name: str) -> bool:
     Raises:
         Exception: command failure
     """
-    cmd = f"tmux kill-session -t {name} || true"
+    cmd = f"tmux kill-session -t {name} || true; rm -f {TMUX_LOG.format(name)}"
     ssh_obj.log_str(cmd)
     code, _, err = ssh_obj.execute(cmd)
     if code != 0:
@@ -553,6 +755,204 @@ def get_intf_mac(ssh_obj: ShellHandler, intf: str) -> str:
     raise ValueError("can't parse mac address")
 
 
+ZERO_MAC = "00:00:00:00:00:00"
+
+# Run with python3 on the host by wait_for_macs, on the output of
+# "ip -j -d link show" on stdin: the MACs of the [interface, VF ID] of argv[1]
+# (VF ID null for the interface itself, "*" for all its VFs, a missing one is
+# null) must all be argv[2], or, if argv[2] is empty, must not be all zeros.
+# It is the check of VfStateSnapshot.macs, in the platform python of RHEL 8.
+MAC_CHECK = r"""
+import json, sys
+links = {link["ifname"]: link for link in json.load(sys.stdin)}
+macs = []
+for intf, vf in json.loads(sys.argv[1]):
+    link = links.get(intf, {})
+    if vf is None:
+        macs.append(link.get("address"))
+        continue
+    found = [
+        info.get("address", info.get("mac"))
+        for info in link.get("vfinfo_list", [])
+        if vf == "*" or info["vf"] == vf
+    ]
+    macs.extend(found if found or vf == "*" else [None])
+if sys.argv[2]:
+    sys.exit(any(mac != sys.argv[2] for mac in macs))
+sys.exit("00:00:00:00:00:00" in macs)
+"""
+
+
+class VfState:
+    def __init__(self, info: dict) -> None:
+        """Init the state of a VF from its entry in the vfinfo_list of
+           "ip -j -d link show <pf>"
+
+        The fields of older iproute2 versions ("mac", "vlan" and "qos" without
+        "vlan_list", "tx_rate" without "rate") are read as well.
+
+        Args:
+            self:        self
+            info (dict): the vfinfo_list entry
+        """
+        self.vf = info["vf"]
+        self.mac = info.get("address", info.get("mac"))
+        vlan = (info.get("vlan_list") or [info])[0]
+        self.vlan = vlan.get("vlan", 0)
+        self.qos = vlan.get("qos", 0)
+        self.vlan_proto = vlan.get("protocol")
+        self.spoofchk = info.get("spoofchk")
+        self.trust = info.get("trust")
+        self.link_state = info.get("link_state")
+        rate = info.get("rate", {})
+        self.max_tx_rate = rate.get("max_tx", info.get("tx_rate", 0))
+        self.min_tx_rate = rate.get("min_tx", 0)
+
+    def __repr__(self) -> str:
+        return f"VfState({self.__dict__})"
+
+
+class VfStateSnapshot:
+    def __init__(self, links: list) -> None:
+        """Init the snapshot of the links, and of the VFs of the PFs
+
+        Args:
+            self:         self
+            links (list): the parsed output of "ip -j -d link show"
+        """
+        # link dict by interface name
+        self.links = {link["ifname"]: link for link in links}
+        # VfState by VF ID, by PF name
+        self.vfs = {
+            name: {vf["vf"]: VfState(vf) for vf in link.get("vfinfo_list", [])}
+            for name, link in self.links.items()
+        }
+
+    @classmethod
+    def take(
+        cls, ssh_obj: ShellHandler, intf: str = None, timeout: int = 5
+    ) -> "VfStateSnapshot":
+        """Take a snapshot with a single "ip -j -d link show" command
+
+        Args:
+            ssh_obj:       ssh connection obj
+            intf (str):    interface name, e.g. a PF, None for all the
+                           interfaces, e.g. a PF and its VF netdevs (default None)
+            timeout (int): seconds of timeout for execute (default 5)
+
+        Returns:
+            VfStateSnapshot: the snapshot
+
+        Raises:
+            Exception:  command failure
+            ValueError: failure in parsing
+        """
+        cmd = "ip -j -d link show" + (f" {intf}" if intf else "")
+        ssh_obj.log_str(cmd)
+        code, out, err = ssh_obj.execute(cmd, timeout)
+        if code != 0:
+            raise Exception(err)
+        return cls(json.loads("".join(out)))
+
+    def vf(self, pf: str, vf_id: int) -> VfState:
+        """Get the state of a VF
+
+        Args:
+            self:        self
+            pf (str):    PF interface name
+            vf_id (int): VF ID
+
+        Returns:
+            VfState: the state, None if the PF or the VF is not in the snapshot
+        """
+        return self.vfs.get(pf, {}).get(vf_id)
+
+    def address(self, intf: str) -> str:
+        """Get the MAC address of an interface, e.g. a VF netdev
+
+        Args:
+            self:       self
+            intf (str): interface name
+
+        Returns:
+            str: the MAC address, None if the interface is not in the snapshot
+        """
+        return self.links.get(intf, {}).get("address")
+
+    def macs(self, refs: list) -> list:
+        """Get the MAC addresses of interfaces and VFs
+
+        Args:
+            self:        self
+            refs (list): [interface, VF ID] pairs, the VF ID None for the
+                         interface itself or "*" for all the VFs of the PF
+
+        Returns:
+            list: the MAC addresses, None for a missing interface or VF
+        """
+        macs = []
+        for intf, vf_id in refs:
+            if vf_id is None:
+                macs.append(self.address(intf))
+            elif vf_id == "*":
+                macs.extend(vf.mac for vf in self.vfs.get(intf, {}).values())
+            else:
+                vf = self.vf(intf, vf_id)
+                macs.append(vf.mac if vf is not None else None)
+        return macs
+
+
+def wait_for_macs(
+    ssh_obj: ShellHandler,
+    intf: str,
+    refs: list,
+    address: str = None,
+    timeout: float = 10,
+    interval: float = 0.1,
+) -> bool:
+    """Wait until the MAC addresses of interfaces and VFs are address, or are
+       not all zeros
+
+    The snapshots of "ip -j -d link show" are taken and checked on the host by
+    wait_until, and the last one is checked again with VfStateSnapshot. A host
+    without python3 is checked on the first snapshot only.
+
+    Args:
+        ssh_obj (ShellHandler): ssh connection obj
+        intf (str):             interface of the snapshot, None for all
+        refs (list):            [interface, VF ID] pairs, see
+                                VfStateSnapshot.macs
+        address (str):          expected MAC address, None to check that no
+                                MAC address is all zeros (default None)
+        timeout (float):        seconds to wait (default 10)
+        interval (float):       seconds between the snapshots (default 0.1)
+
+    Returns:
+        bool: True if the MAC addresses are as expected before timeout
+    """
+    cmd = "ip -j -d link show" + (f" {intf}" if intf else "")
+    check = "python3 -c {} {} {}".format(
+        shlex.quote(MAC_CHECK),
+        shlex.quote(json.dumps(refs)),
+        shlex.quote(address or ""),
+    )
+    condition = (
+        f"j=$({cmd}) && printf '%s\\n' \"$j\" && "
+        f"{{ ! command -v python3 >/dev/null || {check} <<< \"$j\"; }}"
+    )
+    label = f"{cmd}, MACs of {refs} {address or 'not all zeros'}"
+    result = wait_until(ssh_obj, condition, timeout, interval, label=label)
+    try:
+        snapshot = VfStateSnapshot(json.loads("".join(result.output)))
+    except (ValueError, KeyError, TypeError):
+        print(f"\noutput:{result.output}\ncode:{result.code}")
+        return False
+    macs = snapshot.macs(refs)
+    if address is not None:
+        return all(mac == address for mac in macs)
+    return ZERO_MAC not in macs
+
+
 def get_vf_mac(ssh_obj: ShellHandler, intf: str, vf_id: int) -> str:
     """Get the MAC address from the interface's VF ID
 
@@ -568,15 +968,18 @@ def get_vf_mac(ssh_obj: ShellHandler, intf: str, vf_id: int) -> str:
         Exception:  command failure
         ValueError: failure in parsing
     """
-    cmd = f"ip link show {intf} | awk '/vf {vf_id}/" + "{print $4;}'"
-    ssh_obj.log_str(cmd)
-    code, out, err = ssh_obj.execute(cmd)
-    if code != 0:
-        raise Exception(err)
-    for line in out:
-        if len(line.split(":")) == 6:
-            return line.strip("\n")
-    raise ValueError("can't parse mac address")
+    if agent_available(ssh_obj):
+        try:
+            for vf in ssh_obj.agent.call("list_vfs", interface=intf):
+                if vf["vf"] == vf_id and vf["mac"]:
+                    return vf["mac"]
+            raise ValueError("can't parse mac address")
+        except AgentError as err:
+            agent_failed(ssh_obj, err)
+    vf = VfStateSnapshot.take(ssh_obj, intf).vf(intf, vf_id)
+    if vf is None or not vf.mac:
+        raise ValueError("can't parse mac address")
+    return vf.mac
 
 
 def set_vf_mac(
@@ -607,14 +1010,8 @@ def set_vf_mac(
     if code != 0:
         return False
 
-    count = int(timeout / interval) + 1
-    while count > 0:
-        vf_mac = get_intf_mac(ssh_obj, f"{intf}v{vf_id}")
-        if vf_mac == address:
-            return True
-        count -= 1
-        time.sleep(interval)
-    return False
+    condition = f'[ "$(cat /sys/class/net/{intf}v{vf_id}/address)" = "{address}" ]'
+    return wait_until(ssh_obj, condition, timeout, interval).success
 
 
 def verify_vf_address(
@@ -639,15 +1036,115 @@ def verify_vf_address(
         True: The VF has the specified address
         False: The VF doesn't have the specified address before timeout
     """
-    count = int(timeout / interval) + 1
-    while count > 0:
-        vf_mac = get_vf_mac(ssh_obj, intf, vf_id)
-        print(vf_mac)
-        if vf_mac == address:
+    return wait_for_macs(ssh_obj, intf, [[intf, vf_id]], address, timeout, interval)
+
+
+class VfConfig:
+    # error printed by "ip -force -batch" after the message of a failed line
+    FAILED_LINE = re.compile(r"Command failed -:(\d+)")
+
+    def __init__(self, pf: str) -> None:
+        """Init the builder of the properties of the VFs of a PF, applied
+           by a single "ip -batch" command
+
+        Example:
+            config = VfConfig("ens7f0")
+            for vf in range(128):
+                config.set(vf, mac=macs[vf], spoof="off", trust="on")
+            config.apply(dut)
+
+        Args:
+            self:     self
+            pf (str): PF interface name
+        """
+        self.pf = pf
+        # (vf, property, ip arguments) per line of the batch
+        self.entries = []
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def set(self, vf: int, **props) -> "VfConfig":
+        """Add properties of a VF, one batch line per property, in the order
+           of the arguments
+
+        Args:
+            self:     self
+            vf (int): VF ID
+            props:    values of the "ip link set <pf> vf <vf>" properties, e.g.
+                      mac="aa:bb:cc:dd:ee:00", trust="on", max_tx_rate=10;
+                      qos is added to the vlan line, None values are skipped
+
+        Returns:
+            VfConfig: self, to chain the calls
+
+        Raises:
+            ValueError: qos without vlan
+        """
+        qos = props.pop("qos", None)
+        if qos is not None and props.get("vlan") is None:
+            raise ValueError("qos requires vlan")
+        for prop, value in props.items():
+            if value is None:
+                continue
+            args = f"{prop} {value}"
+            if prop == "vlan" and qos is not None:
+                args += f" qos {qos}"
+            self.entries.append((vf, prop, args))
+        return self
+
+    def lines(self) -> list:
+        """Get the lines of the batch
+
+        Args:
+            self: self
+
+        Returns:
+            list: str "ip -batch" lines, e.g. "link set dev ens7f0 vf 0 trust on"
+        """
+        return [
+            f"link set dev {self.pf} vf {vf} {args}" for vf, _, args in self.entries
+        ]
+
+    def apply(self, ssh_obj: ShellHandler, timeout: int = 30) -> bool:
+        """Set all the properties with one "ip -force -batch" command, which
+           goes on after a failed line
+
+        Args:
+            self:          self
+            ssh_obj:       ssh connection obj
+            timeout (int): seconds of timeout for execute (default 30)
+
+        Returns:
+            True: all the properties are set
+
+        Raises:
+            Exception: the VF, property and error of each failed line
+        """
+        if not self.entries:
             return True
-        count -= 1
-        time.sleep(interval)
-    return False
+        cmd = "\n".join(
+            ["ip -force -batch - 2>&1 <<'SRIOV_IP_BATCH'"]
+            + self.lines()
+            + ["SRIOV_IP_BATCH"]
+        )
+        ssh_obj.log_str(f"ip -batch: {len(self.entries)} VF properties of {self.pf}")
+        code, out, err = ssh_obj.execute(cmd, timeout)
+        if code == 0:
+            return True
+        failures = []
+        # the error message of a failed line is printed right before the
+        # line number; in the interactive shell, err also has the script
+        output = [line.strip() for line in out + err]
+        for index, line in enumerate(output):
+            match = self.FAILED_LINE.search(line)
+            if match and 0 < int(match.group(1)) <= len(self.entries):
+                vf, prop, args = self.entries[int(match.group(1)) - 1]
+                message = output[index - 1] if index > 0 else ""
+                failures.append(f"vf {vf} {prop} ({args}): {message}")
+        if not failures:
+            raise Exception(f"ip -batch failed on {self.pf}: {out} {err}")
+        raise Exception(f"{self.pf}: " + "; ".join(failures))
 
 
 def vfs_created(
@@ -665,28 +1162,60 @@ def vfs_created(
         True: all VFs are created
         False: not all VFs are created before timeout exceeded
     """
-    cmd = "ls -d /sys/class/net/" + pf_interface + "v* | wc -w"
-    ssh_obj.log_str(cmd)
-    for i in range(timeout):
-        time.sleep(1)
-        code, out, err = ssh_obj.execute(cmd)
-        if code != 0:
+    condition = (
+        f"[ $(ls -d /sys/class/net/{pf_interface}v* 2>/dev/null | wc -w) "
+        f"-eq {num_vfs} ]"
+    )
+    return wait_until(ssh_obj, condition, timeout, 0.1).success
+
+
+def set_numvfs(ssh_obj: ShellHandler, steps: list, timeout: int = 10) -> list:
+    """Write sriov_numvfs of PFs, and wait for the VF netdevs and PCI
+       functions to be registered or removed after each write
+
+    The steps run in one command. A link event of ip monitor, started before
+    the write, wakes up the wait, so it returns as soon as the VFs are there.
+
+    Args:
+        ssh_obj:       ssh connection obj
+        steps (list):  (pf_interface, num_vfs) tuples, written in order
+        timeout (int): seconds to wait for the VFs of each step (default 10)
+
+    Returns:
+        list: (netdevs, functions, seconds) tuple per step, the numbers of
+              VF netdevs and PCI functions at the end of the wait and the
+              seconds since the write; None if the write failed
+    """
+    waits = "; ".join(f"v {pf} {num_vfs} {timeout}" for pf, num_vfs in steps)
+    for pf, num_vfs in steps:
+        ssh_obj.log_str(f"echo {num_vfs} > /sys/class/net/{pf}/device/sriov_numvfs")
+    # in a subshell, the function and the monitor fd stay out of the session
+    code, out, err = ssh_obj.execute(
+        f"( {NUMVFS_WAITER}; {waits} )", len(steps) * (timeout + 60)
+    )
+    results = {}
+    for line in out:
+        parts = line.split()
+        if len(parts) < 4 or parts[0] != "numvfs":
             continue
-        if int(out[0].strip()) == num_vfs:
-            return True
-    return False
+        if parts[3] == "failed":
+            results[(parts[1], int(parts[2]))] = None
+        elif len(parts) == 6:
+            netdevs, functions, us = map(int, parts[3:])
+            results[(parts[1], int(parts[2]))] = (netdevs, functions, us / 1000000)
+    return [results.get((pf, num_vfs)) for pf, num_vfs in steps]
 
 
 def destroy_vfs(ssh_obj: ShellHandler, pf_interface: str) -> None:
-    """Destroy the VFs on pf_interface
+    """Destroy the VFs on pf_interface, and wait for their removal
 
     Args:
         ssh_obj (ShellHandler): ssh connection obj
         pf_interface (str): name of the PF
     """
-    clear_vfs = f"echo 0 > /sys/class/net/{pf_interface}/device/sriov_numvfs"
-    ssh_obj.log_str(clear_vfs)
-    ssh_obj.execute(clear_vfs, 60)
+    (result,) = set_numvfs(ssh_obj, [(pf_interface, 0)])
+    if result is not None:
+        ssh_obj.log_str(f"{pf_interface}: VFs removed in {result[2]:.3f}s")
 
 
 def create_vfs(
@@ -698,20 +1227,24 @@ def create_vfs(
         ssh_obj:            ssh connection obj
         pf_interface (str): name of the PF
         num_vfs (int):      number of VFs to create under PF
-        timout (int):       times to check for VFs (default 10)
+        timout (int):       seconds to wait for the VFs (default 10)
 
     Returns:
         True: all VFs are created
         False: not all VFs are created before timeout exceeded
-
-    Raises:
-        Exception:  failed to create VFs before timeout exceeded
     """
-    destroy_vfs(ssh_obj, pf_interface)
-    create_vfs = f"echo {num_vfs} > /sys/class/net/{pf_interface}/device/sriov_numvfs"
-    ssh_obj.log_str(create_vfs)
-    ssh_obj.execute(create_vfs, 60)
-    return vfs_created(ssh_obj, pf_interface, num_vfs, timeout)
+    # the existing VFs are destroyed first, in the same command
+    removed, created = set_numvfs(
+        ssh_obj, [(pf_interface, 0), (pf_interface, num_vfs)], timeout
+    )
+    if created is None:
+        return False
+    netdevs, functions, seconds = created
+    ssh_obj.log_str(
+        f"{pf_interface}: {netdevs} VF netdevs and {functions} PCI functions "
+        f"in {seconds:.3f}s"
+    )
+    return netdevs == num_vfs and functions == num_vfs
 
 
 def no_zero_macs_pf(
@@ -729,21 +1262,8 @@ def no_zero_macs_pf(
         True: no interfaces have all zero MAC addresses
         False: an interface with zero MAC address was found or timeout exceeded
     """
-    check_vfs = "ip -d link show " + pf_interface
-    ssh_obj.log_str(check_vfs)
-    for i in range(timeout):
-        time.sleep(1)
-        code, out, err = ssh_obj.execute(check_vfs)
-        if code != 0:
-            continue
-        no_zeros = True
-        for out_slice in out:
-            if "00:00:00:00:00:00" in out_slice:
-                no_zeros = False
-                break
-        if no_zeros:
-            return True
-    return False
+    refs = [[pf_interface, None], [pf_interface, "*"]]
+    return wait_for_macs(ssh_obj, pf_interface, refs, timeout=timeout)
 
 
 def no_zero_macs_vf(
@@ -762,22 +1282,10 @@ def no_zero_macs_vf(
         True: no VFs of interface have all zero MAC addresses
         False: a VF with zero MAC address was found or timeout exceeded
     """
-    check_vfs = "ip -d link show " + pf_interface
-    ssh_obj.log_str(check_vfs)
-    for i in range(timeout):
-        time.sleep(1)
-        no_zeros = True
-        for i in range(num_vfs):
-            code, out, err = ssh_obj.execute(check_vfs + "v" + str(i))
-            if code != 0:
-                break
-            for out_slice in out:
-                if "00:00:00:00:00:00" in out_slice:
-                    no_zeros = False
-                    break
-        if no_zeros:
-            return True
-    return False
+    # one snapshot of all the links has the netdevs of every VF; a VF
+    # without netdev, e.g. bound to vfio-pci, is not checked
+    refs = [[f"{pf_interface}v{vf}", None] for vf in range(num_vfs)]
+    return wait_for_macs(ssh_obj, None, refs, timeout=timeout)
 
 
 def set_pipefail(ssh_obj: ShellHandler) -> bool:
@@ -806,6 +1314,7 @@ def execute_and_assert(
     exit_code: int,
     timeout: int = 0,
     cmd_timeout: int = 5,
+    batch: bool = None,
 ) -> Tuple[list, list]:
     """Execute the list of commands, assert exit code, and return stdouts and stderrs
 
@@ -815,6 +1324,10 @@ def execute_and_assert(
         exit_code (int): the code to assert
         timeout (int):   optional timeout between cmds (default 0)
         cmd_timeout (int): optional timeout to wait for commands to complete (default 5)
+        batch (bool):    send the commands in one round trip with execute_batch
+                         when exit code 0 is expected; the commands run in one
+                         shell group with stdin from /dev/null. None to batch
+                         them when there is no timeout between cmds (default None)
 
     Returns:
         outs (list): list of lists of str stdout lines
@@ -822,6 +1335,21 @@ def execute_and_assert(
     """
     outs = []
     errs = []
+    if batch is None:
+        batch = timeout == 0
+    if batch and exit_code == 0 and len(cmds) > 1:
+        # send them all in one round trip, the host sleeps between cmds
+        for cmd in cmds:
+            ssh_obj.log_str(cmd)
+        results = ssh_obj.execute_batch(
+            cmds, (cmd_timeout + timeout) * len(cmds), stop_on_error=True, delay=timeout
+        )
+        for code, out, err in results:
+            outs.append(out)
+            errs.append(err)
+            assert code == exit_code, "\nstdout:" + str(outs) + "\nstderr:" + str(errs)
+        return outs, errs
+
     for cmd in cmds:
         ssh_obj.log_str(cmd)
         code, out, err = ssh_obj.execute(cmd, cmd_timeout)
@@ -832,37 +1360,211 @@ def execute_and_assert(
     return outs, errs
 
 
+def run_in_parallel(*calls: Callable) -> list:
+    """Run the calls at the same time, each in its own thread, and wait for all
+       of them to finish
+
+    Args:
+        calls (Callable): functions without arguments, e.g. functools.partial
+                          objects wrapping the steps of one host
+
+    Returns:
+        list: the return values of the calls, in the order of the calls
+
+    Raises:
+        Exception: the first exception raised by a call, once all calls finished
+    """
+    with ThreadPoolExecutor(max_workers=max(1, len(calls))) as executor:
+        futures = [executor.submit(call) for call in calls]
+    return [future.result() for future in futures]
+
+
+def execute_and_assert_parallel(
+    host_cmds: list,
+    exit_code: int,
+    timeout: int = 0,
+    cmd_timeout: int = 5,
+    batch: bool = None,
+) -> list:
+    """Execute the list of commands of several hosts at the same time, assert exit
+       code per host, and return stdouts and stderrs per host
+
+    Args:
+        host_cmds (list):  list of (ssh_obj, cmds) tuples, cmds being a list of
+                           str commands to run in order on ssh_obj
+        exit_code (int):   the code to assert
+        timeout (int):     optional timeout between cmds (default 0)
+        cmd_timeout (int): optional timeout to wait for commands to complete (default 5)
+        batch (bool):      send the commands of each host in one round trip, see
+                           execute_and_assert (default None)
+
+    Returns:
+        list: (outs, errs) tuple of every host, in the order of host_cmds, as
+              returned by execute_and_assert
+    """
+
+    def execute_host(ssh_obj: ShellHandler, cmds: list) -> Tuple[list, list]:
+        try:
+            return execute_and_assert(
+                ssh_obj, cmds, exit_code, timeout, cmd_timeout, batch
+            )
+        except AssertionError as err:
+            raise AssertionError(f"{ssh_obj.name}: {err}") from err
+
+    return run_in_parallel(
+        *[functools.partial(execute_host, ssh_obj, cmds) for ssh_obj, cmds in host_cmds]
+    )
+
+
+class WaitResult:
+    def __init__(
+        self, success: bool, code: int, attempts: int, seconds: float, output: list
+    ) -> None:
+        """Init the result of wait_until
+
+        Args:
+            self:            self
+            success (bool):  the condition exited with the expected code
+            code (int):      exit status of the last run of the condition, None
+                             if the loop did not report
+            attempts (int):  number of runs of the condition
+            seconds (float): seconds from the first run to the last one
+            output (list):   output lines of the last run of the condition
+        """
+        self.success = success
+        self.code = code
+        self.attempts = attempts
+        self.seconds = seconds
+        self.output = output
+
+    def __bool__(self) -> bool:
+        return self.success
+
+
+def wait_until(
+    ssh_obj: ShellHandler,
+    condition: str,
+    timeout: float = 10,
+    interval: float = 1,
+    exit_code: int = 0,
+    label: str = None,
+) -> WaitResult:
+    """Run a condition on the host until it exits with exit_code or timeout
+
+    The loop runs on the host, so the polling costs one command however many
+    times the condition runs.
+
+    Example:
+        assert wait_until(dut, f"ip link show {pf}v0", 10, 0.1)
+
+    Args:
+        ssh_obj (ShellHandler): ssh connection obj
+        condition (str):        shell command, e.g. "test -e /dev/vfio/vfio"
+        timeout (float):        seconds before the last run (default 10)
+        interval (float):       seconds between the runs (default 1)
+        exit_code (int):        exit status of success (default 0)
+        label (str):            logged instead of the condition, e.g. for a
+                                long script (default None)
+
+    Returns:
+        WaitResult: the result, true on success
+    """
+    cmd = WAIT_UNTIL_LOOP.format(
+        condition=condition,
+        exit_code=exit_code,
+        timeout_ns=int(timeout * 1000000000),
+        interval=interval,
+    )
+    ssh_obj.log_str(f"wait_until {timeout}s every {interval}s: {label or condition}")
+    code, out, err = ssh_obj.execute(cmd, timeout + interval + 10)
+    # in the interactive shell, the output of a failed command is in err
+    lines = out if code == 0 else out + err
+    start = 0
+    for index, line in enumerate(lines):
+        parts = line.split()
+        if parts == ["wait_until", "output"]:
+            start = index + 1
+        elif len(parts) == 4 and parts[0] == "wait_until":
+            result = WaitResult(
+                int(parts[1]) == exit_code,
+                int(parts[1]),
+                int(parts[2]),
+                int(parts[3]) / 1000000,
+                lines[start:index],
+            )
+            ssh_obj.log_str(
+                f"wait_until: {'done' if result else 'timeout'} after "
+                f"{result.attempts} runs in {result.seconds:.3f}s"
+            )
+            return result
+    return WaitResult(False, None, 0, 0.0, lines)
+
+
 def execute_until_timeout(
-    ssh_obj: ShellHandler, cmd: str, timeout: int = 10, exit_code: int = 0
+    ssh_obj: ShellHandler,
+    cmd: str,
+    timeout: int = 10,
+    exit_code: int = 0,
+    interval: float = 1,
 ) -> bool:
     """Execute cmd and check for exit code until timeout
 
     Args:
-        ssh_obj:         ssh connection obj
-        cmd (str):       a single command to run
-        timeout (int):   optional timeout between cmds (default 10)
-        exit_code (int): optional code to check for (default 0)
+        ssh_obj:          ssh connection obj
+        cmd (str):        a single command to run
+        timeout (int):    optional timeout between cmds (default 10)
+        exit_code (int):  optional code to check for (default 0)
+        interval (float): optional seconds between the runs of cmd (default 1)
 
     Returns:
         True: cmd return exit code 0 before timeout
         False: cmd does not return exit code 0
     """
-    ssh_obj.log_str(cmd)
-    count = max(1, int(timeout))
-    while count > 0:
-        code, out, err = ssh_obj.execute(cmd)
-        if code == exit_code:
-            return True
-        count -= 1
-        time.sleep(1)
-    print("\nstdout:" + str(out) + "\nstderr:" + str(err) + "\ncode:" + str(code))
-    return False
+    result = wait_until(ssh_obj, cmd, timeout, interval, exit_code)
+    if not result:
+        print("\noutput:" + str(result.output) + "\ncode:" + str(result.code))
+    return result.success
+
+
+def wait_tmux_testpmd_sessions(
+    ssh_obj: ShellHandler, tmux_sessions: list, timeout: int
+) -> dict:
+    """Wait until the testpmd of tmux sessions started by start_tmux are ready
+
+    The output of the sessions is followed as it is written, so each session is
+    reported as soon as testpmd shows its prompt, with the time since it was
+    started by start_tmux.
+
+    Args:
+        ssh_obj (ShellHandler): ssh connection obj
+        tmux_sessions (list): tmux session names
+        timeout (int): how many seconds to wait
+
+    Returns:
+        dict: seconds from start_tmux to the testpmd prompt by session, None
+              for a session that is not ready
+    """
+    started = {tmux_session: None for tmux_session in tmux_sessions}
+    if not tmux_sessions:
+        return started
+    script = (
+        f"( {TMUX_TESTPMD_WAITER}; for s in {' '.join(tmux_sessions)}; "
+        f"do w $s {timeout} & done; wait )"
+    )
+    for line in ssh_obj.execute_stream(script, timeout + 5):
+        words = line.split()
+        if len(words) == 3 and words[0] in started and words[1] == "ready":
+            started[words[0]] = int(words[2]) / 1000000
+            print(f"{words[0]}: testpmd ready in {started[words[0]]:.3f}s")
+        elif len(words) == 2 and words[0] in started:
+            print(f"{words[0]}: testpmd not ready, {words[1]}")
+    return started
 
 
 def wait_tmux_testpmd_ready(
     ssh_obj: ShellHandler, tmux_session: str, timeout: int
 ) -> bool:
-    """Wait until the testpmd in a tmux session is ready
+    """Wait until the testpmd in a tmux session started by start_tmux is ready
 
     Args:
         ssh_obj (ShellHandler): ssh connection obj
@@ -872,14 +1574,8 @@ def wait_tmux_testpmd_ready(
     Returns:
         bool: True if success; False otherwise
     """
-    for i in range(timeout):
-        time.sleep(1)
-        cmd = [f"tmux capture-pane -pt {tmux_session}"]
-        outs, errs = execute_and_assert(ssh_obj, cmd, 0)
-        for line in outs[0]:
-            if line.startswith("Press enter to exit") or line.startswith("testpmd>"):
-                return True
-    return False
+    started = wait_tmux_testpmd_sessions(ssh_obj, [tmux_session], timeout)
+    return started[tmux_session] is not None
 
 
 def stop_testpmd_in_tmux(ssh_obj: ShellHandler, tmux_session: str) -> None:
@@ -892,10 +1588,60 @@ def stop_testpmd_in_tmux(ssh_obj: ShellHandler, tmux_session: str) -> None:
     cmd = f"tmux send-keys -t {tmux_session} 'quit' ENTER"
     ssh_obj.log_str(cmd)
     ssh_obj.execute(cmd)
-    time.sleep(1)
+    # testpmd ends the session as it exits
+    wait_until(ssh_obj, f"tmux has-session -t {tmux_session}", 1, 0.1, 1)
     assert stop_tmux(ssh_obj, tmux_session)
 
 
+def stop_testpmd_in_tmux_sessions(ssh_obj: ShellHandler, tmux_sessions: list) -> None:
+    """Stop the testpmd in several tmux sessions at the same time, each from its
+       own shell on the SSH connection of ssh_obj
+
+    Args:
+        ssh_obj (ShellHandler): ssh connection obj
+        tmux_sessions (list): tmux session names
+    """
+    subshells = [ssh_obj] + [ssh_obj.open_subshell() for _ in tmux_sessions[1:]]
+    try:
+        run_in_parallel(
+            *[
+                functools.partial(stop_testpmd_in_tmux, subshell, tmux_session)
+                for subshell, tmux_session in zip(subshells, tmux_sessions)
+            ]
+        )
+    finally:
+        for subshell in subshells[1:]:
+            subshell.close()
+
+
+def stop_testpmd_in_tmux_prefix(
+    ssh_obj: ShellHandler, prefix: str, timeout: float = 1
+) -> list:
+    """Stop the testpmd in every tmux session named prefix followed by a number,
+       with one command however many sessions are found
+
+    Args:
+        ssh_obj (ShellHandler): ssh connection obj
+        prefix (str):           prefix of the tmux session names, e.g. "sriov_job"
+        timeout (float):        seconds to wait for the testpmds to exit before
+                                the sessions are killed (default 1)
+
+    Returns:
+        list: names of the stopped sessions
+
+    Raises:
+        Exception: command failure
+    """
+    cmd = TMUX_TESTPMD_STOPPER.format(
+        prefix=shlex.quote(prefix), tries=int(timeout * 10)
+    )
+    ssh_obj.log_str(f"stop testpmd in the tmux sessions {prefix}<number>")
+    code, out, err = ssh_obj.execute(cmd, timeout + 10)
+    if code != 0:
+        raise Exception(err)
+    return [line.split()[1] for line in out if line.startswith("stopped ")]
+
+
 def get_isolated_cpus(ssh_obj: ShellHandler) -> list:
     """Return a list of the isolated CPUs
 
@@ -1125,16 +1871,55 @@ def get_driver_pci(ssh_obj: ShellHandler, pci: str) -> str:
         str: The driver this pci address is bound to
     """
     drivers = ["i40e", "ice"]
-    modprobe_cmds = []
-    cmds = []
-    for driver in drivers:
-        modprobe_cmds.append(f"modprobe {driver}")
-        cmds.append(f"find /sys/bus/pci/drivers/{driver}/ -name {pci}")
-    outs, _ = execute_and_assert(ssh_obj, modprobe_cmds, 0)
-    outs, _ = execute_and_assert(ssh_obj, cmds, 0)
-    if outs[0]:
+    bound = None
+    if agent_available(ssh_obj):
+        try:
+            for driver in drivers:
+                ssh_obj.agent.call("modprobe", module=driver)
+            paths = [f"/sys/bus/pci/drivers/{driver}/{pci}" for driver in drivers]
+            bound = ssh_obj.agent.call("exists", paths=paths)
+        except AgentError as err:
+            agent_failed(ssh_obj, err)
+    if bound is None:
+        modprobe_cmds = []
+        cmds = []
+        for driver in drivers:
+            modprobe_cmds.append(f"modprobe {driver}")
+            cmds.append(f"find /sys/bus/pci/drivers/{driver}/ -name {pci}")
+        outs, _ = execute_and_assert(ssh_obj, modprobe_cmds, 0)
+        outs, _ = execute_and_assert(ssh_obj, cmds, 0)
+        bound = [bool(out) for out in outs]
+    if bound[0]:
         return drivers[0]
-    elif outs[1]:
+    elif bound[1]:
         return drivers[1]
     else:
         assert Exception("Driver not in list: ", drivers)
+
+
+def read_trafficgen_result(lines) -> dict:
+    """Read the result of "client auto" of the trafficgen from its output lines,
+       printing the lines as they arrive
+
+    The result is the JSON object of the first output line, as it is once the
+    command is over; the lines after it, e.g. progress or status JSON, are only
+    printed, even when they have port "0".
+
+    Args:
+        lines (iterable): output lines, e.g. a CommandStream
+
+    Returns:
+        dict: the result by port, e.g. {"0": {"rx_l1_bps": ...}, ...}, None if
+              there is no output
+
+    Raises:
+        ValueError: the first line is not a JSON object
+    """
+    result = None
+    for line in lines:
+        print(line, end="")
+        if result is None:
+            result = json.loads(line)
+            if not isinstance(result, dict):
+                raise ValueError(f"not a trafficgen result: {line!r}")
+    return result
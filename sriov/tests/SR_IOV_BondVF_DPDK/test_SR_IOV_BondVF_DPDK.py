@@ -5,7 +5,7 @@ from sriov.common.utils import (
     set_vf_mac,
     get_vf_mac,
     execute_and_assert,
-    bind_driver,
+    bind_drivers,
     prepare_ping_test,
     get_pci_address,
     start_tmux,
@@ -57,11 +57,12 @@ def dut_setup(dut, settings, testdata, request) -> Bond:
     execute_and_assert(dut, steps, 0, 0.1)
 
     pci_pf1_vf0 = get_pci_address(dut, pf1 + "v0")
-    assert bind_driver(dut, pci_pf1_vf0, "vfio-pci")
     pci_pf1_vf1 = get_pci_address(dut, pf1 + "v1")
-    assert bind_driver(dut, pci_pf1_vf1, "vfio-pci")
     pci_pf2_vf0 = get_pci_address(dut, pf2 + "v0")
-    assert bind_driver(dut, pci_pf2_vf0, "vfio-pci")
+    results = bind_drivers(
+        dut, [(pci, "vfio-pci") for pci in (pci_pf1_vf0, pci_pf1_vf1, pci_pf2_vf0)]
+    )
+    assert all(ok for ok, _ in results.values()), results
 
     if explicit_mac:
         bond_mac = testdata.dut_spoof_mac
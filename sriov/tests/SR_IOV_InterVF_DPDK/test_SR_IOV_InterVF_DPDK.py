@@ -3,11 +3,12 @@ import time
 from sriov.common.utils import (
     start_tmux,
     create_vfs,
-    execute_and_assert,
     bind_driver,
     get_vf_mac,
     setup_hugepages,
-    stop_testpmd_in_tmux
+    stop_testpmd_in_tmux,
+    wait_tmux_testpmd_ready,
+    VfConfig,
 )
 
 
@@ -41,22 +42,18 @@ def test_SR_IOV_InterVF_DPDK(
 
     assert create_vfs(dut, pf, 2)
 
-    steps = []
+    config = VfConfig(pf)
     for i in range(2):
-        steps.extend(
-            [
-                f"ip link set {pf} vf {i} mac {mac_prefix}{i}",
-                f"ip link set {pf} vf {i} spoof {spoof}",
-                f"ip link set {pf} vf {i} trust {trust}",
-            ]
+        config.set(
+            i,
+            mac=f"{mac_prefix}{i}",
+            spoof=spoof,
+            trust=trust,
+            vlan=testdata.vlan if vlan else None,
+            qos=testdata.qos if vlan and qos else None,
+            max_tx_rate=testdata.max_tx_rate if max_tx_rate else None,
         )
-        if vlan:
-            qos_str = f"qos {testdata.qos}" if qos else ""
-            steps.append(f"ip link set {pf} vf {i} vlan {testdata.vlan} {qos_str}")
-        if max_tx_rate:
-            steps.append(f"ip link set {pf} vf {i} max_tx_rate {testdata.max_tx_rate}")
-
-    execute_and_assert(dut, steps, 0, 0.1)
+    assert config.apply(dut)
 
     # bind VF0 to vfio-pci
     vf_pci = settings.config["dut"]["interface"]["vf1"]["pci"]
@@ -68,18 +65,8 @@ def test_SR_IOV_InterVF_DPDK(
     assert start_tmux(dut, tmux_session, testdata.container_cmd_echo)
 
     # make sure tmux testpmd session has started
-    for i in range(15):
-        time.sleep(1)
-        cmd = [f"tmux capture-pane -pt {tmux_session}"]
-        outs, errs = execute_and_assert(dut, cmd, 0)
-        started = False
-        for line in outs[0]:
-            if line.startswith("Press enter to exit"):
-                started = True
-                break
-        if started:
-            print("tmux: testpmd started")
-            break
+    if wait_tmux_testpmd_ready(dut, tmux_session, 15):
+        print("tmux: testpmd started")
 
     # The following is not run through execute_and_assert as the handling of
     # the non-zero return code is a special case.
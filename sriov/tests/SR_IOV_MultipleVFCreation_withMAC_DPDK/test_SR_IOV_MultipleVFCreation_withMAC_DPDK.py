@@ -5,7 +5,8 @@ from sriov.common.utils import (
     create_vfs,
     set_pipefail,
     get_pci_address,
-    bind_driver,
+    bind_drivers,
+    VfConfig,
 )
 
 
@@ -32,23 +33,24 @@ def test_SRIOVMultipleVFCreationwithMACDPDK(dut, settings, testdata, execution_n
     assert create_vfs(dut, testdata.pfs[pf]["name"], int(max_vfs))
     # Some NICs (observed on xxv710) need time after VF creation
     time.sleep(0.1)
-    # Set the MAC address for each VF, bind each VF to vfio-pci
+    # Set the MAC address for each VF, in a single ip -batch
+    config = VfConfig(testdata.pfs[pf]["name"])
+    macs = []
     for i in range(int(max_vfs)):
         base_mac = "{:012X}".format(int(base_mac, 16) + 1)
         new_mac = ":".join(
             base_mac[i] + base_mac[i + 1] for i in range(0, len(base_mac), 2)
         )
-        steps = [
-            "ip link set "
-            + testdata.pfs[pf]["name"]
-            + " vf "
-            + str(i)
-            + " mac "
-            + new_mac
-        ]
-        execute_and_assert(dut, steps, 0)
+        config.set(i, mac=new_mac)
+        macs.append(new_mac)
+    assert config.apply(dut)
+
+    # Bind all the VFs to vfio-pci at once
+    vfs_pci = []
+    for i, new_mac in enumerate(macs):
         iface = testdata.pfs[pf]["name"] + "v" + str(i)
         mac_check_cmd = f"ip link show {iface} | grep link/ether | grep {new_mac}"
         execute_until_timeout(dut, mac_check_cmd)
-        vf_pci = get_pci_address(dut, iface)
-        assert bind_driver(dut, vf_pci, "vfio-pci")
+        vfs_pci.append(get_pci_address(dut, iface))
+    results = bind_drivers(dut, [(pci, "vfio-pci") for pci in vfs_pci], 120)
+    assert all(ok for ok, _ in results.values()), results
@@ -4,6 +4,7 @@ from sriov.common.utils import (
     execute_and_assert,
     prepare_ping_test,
     execute_until_timeout,
+    VfConfig,
 )
 
 
@@ -30,22 +31,24 @@ def test_SR_IOV_Permutation(
     """
 
     pf = settings.config["dut"]["interface"]["pf1"]["name"]
-    steps = [
-        f"ip link set {pf}v0 down",
-        f"ip link set {pf} vf 0 mac {testdata.dut_mac}",
-        f"ip link set {pf} vf 0 spoof {spoof}",
-        f"ip link set {pf} vf 0 trust {trust}",
-    ]
-    if vlan:
-        qos_str = f"qos {testdata.qos}" if qos else ""
-        steps.append(f"ip link set {pf} vf 0 vlan {testdata.vlan} {qos_str}")
-    if max_tx_rate:
-        steps.append(f"ip link set {pf} vf 0 max_tx_rate {testdata.max_tx_rate}")
-    steps.append(f"ip addr add {testdata.dut_ip}/24 dev {pf}v0")
-    steps.append(f"ip link set {pf}v0 up")
+    config = VfConfig(pf).set(
+        0,
+        mac=testdata.dut_mac,
+        spoof=spoof,
+        trust=trust,
+        vlan=testdata.vlan if vlan else None,
+        qos=testdata.qos if vlan and qos else None,
+        max_tx_rate=testdata.max_tx_rate if max_tx_rate else None,
+    )
 
     create_vfs(dut, pf, 1)
 
+    execute_and_assert(dut, [f"ip link set {pf}v0 down"], 0)
+    assert config.apply(dut)
+    steps = [
+        f"ip addr add {testdata.dut_ip}/24 dev {pf}v0",
+        f"ip link set {pf}v0 up",
+    ]
     execute_and_assert(dut, steps, 0, 0.1)
 
     trafficgen_pf = settings.config["trafficgen"]["interface"]["pf1"]["name"]
@@ -2,14 +2,19 @@ import pytest
 import random
 import time
 from sriov.common.utils import (
-    start_tmux,
     create_vfs,
     execute_and_assert,
     execute_until_timeout,
     bind_driver,
-    wait_tmux_testpmd_ready,
     get_pci_address,
     setup_hugepages,
+    stop_testpmd_in_tmux_sessions,
+)
+from sriov.common.testpmd import (
+    INSTANCE_MEMORY,
+    TestPmdInstance,
+    TestPmdSession,
+    launch_testpmd_instances,
 )
 
 
@@ -20,7 +25,7 @@ def get_container_cmd(
         f"{container_manager} run -it --name {name} --rm --privileged "
         f"{container_volumes} "
         f"--cpuset-cpus {cpus} {dpdk_img} dpdk-testpmd -l {cpus} "
-        f"-n 4 -a {vf_pci} "
+        f"-n 4 -a {vf_pci} --file-prefix {name} -m {INSTANCE_MEMORY} "
         "-- --nb-cores=1 --forward=txonly -i"
     )
     return tmux_cmd
@@ -84,12 +89,9 @@ def test_SR_IOV_RandomlyTerminate_DPDK(dut, settings, testdata, options):
 
     base_name = "random_terminate"
     dpdk_img = settings.config["dpdk_img"]
-    tmux_list = []
+    instances = []
     for i in range(num_vfs):
-        # Bind VF0 to vfio-pci
         vf_pci = get_pci_address(dut, pf + "v" + str(i))
-        assert bind_driver(dut, vf_pci, "vfio-pci")
-
         cpus = get_testpmd_cpus(settings.config["randomly_terminate_control_core"], i)
         name = base_name + str(i)
         tmux_cmd = get_container_cmd(
@@ -100,31 +102,20 @@ def test_SR_IOV_RandomlyTerminate_DPDK(dut, settings, testdata, options):
             dpdk_img,
             vf_pci,
         )
+        instances.append(
+            TestPmdInstance(name, testdata.tmux_session_name + str(i), tmux_cmd, vf_pci)
+        )
 
-        # Start instance of testpmd
-        tmux_session = testdata.tmux_session_name + str(i)
-        assert start_tmux(dut, tmux_session, tmux_cmd)
-        assert wait_tmux_testpmd_ready(dut, tmux_session, 15)
-        tmux_list.append([tmux_session, vf_pci])
+    # Bind the VFs to vfio-pci, and start all the instances of testpmd together
+    assert launch_testpmd_instances(dut, instances)
 
     end = time.time() + 60 * settings.config["randomly_terminate_test_length"]
     while end > time.time():
         for i in range(num_vfs):
             if random.random() < settings.config["randomly_terminate_test_chance"]:
-                cpus = get_testpmd_cpus(
-                    settings.config["randomly_terminate_control_core"], i
-                )
-                name = base_name + str(i)
-                tmux_session = tmux_list[i][0]
-                vf_pci = tmux_list[i][1]
-                tmux_cmd = get_container_cmd(
-                    settings.config["container_manager"],
-                    settings.config["container_volumes"],
-                    name,
-                    cpus,
-                    dpdk_img,
-                    vf_pci,
-                )
+                name = instances[i].name
+                tmux_session = instances[i].tmux_session
+                vf_pci = instances[i].pci
 
                 # Kill the container
                 steps = [f"{settings.config['container_manager']} kill {name}"]
@@ -135,7 +126,7 @@ def test_SR_IOV_RandomlyTerminate_DPDK(dut, settings, testdata, options):
                     f"{settings.config['container_manager']} ps -f name={name}$ | "
                     f"grep {name}"
                 )
-                assert execute_until_timeout(dut, steps, 10, 1)
+                assert execute_until_timeout(dut, steps, 10, 1, 0.2)
 
                 # Restart the container, as well as rebind drivers if required
                 if options:
@@ -144,27 +135,17 @@ def test_SR_IOV_RandomlyTerminate_DPDK(dut, settings, testdata, options):
 
                 # Ensure that the tmux session has ended before proceeding
                 steps = f"tmux has-session -t {tmux_session}"
-                assert execute_until_timeout(dut, steps, 10, 1)
+                assert execute_until_timeout(dut, steps, 10, 1, 0.2)
 
-                assert start_tmux(dut, tmux_session, tmux_cmd)
-                assert wait_tmux_testpmd_ready(dut, tmux_session, 15)
+                assert launch_testpmd_instances(dut, [instances[i]], None)
 
-                # Start testpmd
-                steps = [
-                    f"tmux send-keys -t {tmux_session} 'start' ENTER",
-                ]
-                execute_and_assert(dut, steps, 0)
+                # Start testpmd, and ensure that it is transmitting
+                session = TestPmdSession(dut, tmux_session)
+                session.execute("start")
+                rates = session.wait_for_rate("tx_pps", 0, timeout=10)
+                assert rates is not None, "testpmd not transmitting"
 
-                # Baseline stats
-                stats_steps = [
-                    f"tmux send-keys -t {tmux_session} 'show fwd stats all' ENTER",
-                    f"tmux capture-pane -pt {tmux_session} | tail -4 | grep TX-packets",
-                ]
-                stats_outs, errs = execute_and_assert(dut, stats_steps, 0, 0.1)
-                stats_outs_2, errs = execute_and_assert(dut, stats_steps, 0, 0.1)
-
-                # Ensure testpmd is transmitting
-                if stats_outs[1] == stats_outs_2[1]:
-                    print(stats_outs)
-                    print(stats_outs_2)
-                    assert False, "testpmd not transmitting"
+    # Stop all the instances of testpmd together
+    stop_testpmd_in_tmux_sessions(
+        dut, [instance.tmux_session for instance in instances]
+    )
@@ -1,4 +1,5 @@
 from datetime import datetime
+from sriov.common.containers import CONTAINERS
 from sriov.tests.conftest import elastic
 from sriov.common.utils import (
     execute_and_assert,
@@ -6,9 +7,10 @@ from sriov.common.utils import (
     create_vfs,
     set_pipefail,
     get_pci_address,
-    bind_driver,
+    bind_drivers,
     get_isolated_cpus_numa,
     get_hugepage_info,
+    read_trafficgen_result,
 )
 import json
 
@@ -33,15 +35,15 @@ def test_SRIOV_Sanity_Performance(dut, trafficgen, settings, testdata):  # noqa:
         settings.config["trafficgen"]["interface"]["pf1"]["pci"],
         settings.config["trafficgen"]["interface"]["pf2"]["pci"],
     ]
-    steps = []
-    for pf_pci in trafficgen_pfs_pci:
-        steps.append(f"cat /sys/bus/pci/devices/{pf_pci}/numa_node")
-    outs, errs = execute_and_assert(trafficgen, steps, 0)
+    trafficgen_numas = {
+        settings.config["trafficgen"]["interface"][pf]["numa_node"]
+        for pf in ("pf1", "pf2")
+    }
 
-    if outs[0][0] != outs[1][0]:
+    if len(trafficgen_numas) != 1:
         assert False, "Trafficgen PFs are on different numa nodes"
     else:
-        trafficgen_numa = int(outs[0][0])
+        trafficgen_numa = trafficgen_numas.pop()
 
     total_1G, free_1G = get_hugepage_info(trafficgen, "1G")
     if free_1G < 2:
@@ -49,19 +51,14 @@ def test_SRIOV_Sanity_Performance(dut, trafficgen, settings, testdata):  # noqa:
         assert False, "Trafficgen 1G hugepages insufficient (2 minimum)"
 
     # Check dut ports are on the same numa node
-    dut_pfs_pci = [
-        settings.config["dut"]["interface"]["pf1"]["pci"],
-        settings.config["dut"]["interface"]["pf2"]["pci"],
-    ]
-    steps = []
-    for pf_pci in dut_pfs_pci:
-        steps.append(f"cat /sys/bus/pci/devices/{pf_pci}/numa_node")
-    outs, errs = execute_and_assert(dut, steps, 0)
+    dut_numas = {
+        settings.config["dut"]["interface"][pf]["numa_node"] for pf in ("pf1", "pf2")
+    }
 
-    if outs[0][0] != outs[1][0]:
+    if len(dut_numas) != 1:
         assert False, "DUT PFs are on different numa nodes"
     else:
-        dut_numa = int(outs[0][0])
+        dut_numa = dut_numas.pop()
 
     total_1G, free_1G = get_hugepage_info(dut, "1G")
     if free_1G < 2:
@@ -102,15 +99,17 @@ def test_SRIOV_Sanity_Performance(dut, trafficgen, settings, testdata):  # noqa:
     execute_and_assert(trafficgen, steps, 0)
 
     # Bind testpmd VFs to vfio-pci
-    dut_vfs_pci = []
-    for pf in dut_pfs:
-        pci_pf_vf = get_pci_address(dut, testdata.pfs[pf]["name"] + "v0")
-        dut_vfs_pci.append(pci_pf_vf)
-        assert bind_driver(dut, pci_pf_vf, "vfio-pci")
+    dut_vfs_pci = [
+        get_pci_address(dut, testdata.pfs[pf]["name"] + "v0") for pf in dut_pfs
+    ]
+    results = bind_drivers(dut, [(pci, "vfio-pci") for pci in dut_vfs_pci])
+    assert all(ok for ok, _ in results.values()), results
 
     # Bind trafficgen PFs to vfio-pci
-    for pf in trafficgen_pfs_pci:
-        assert bind_driver(trafficgen, pf, "vfio-pci")
+    results = bind_drivers(
+        trafficgen, [(pci, "vfio-pci") for pci in trafficgen_pfs_pci]
+    )
+    assert all(ok for ok, _ in results.values()), results
 
     # Start the testpmd auto
     dut_cpus_string = ""
@@ -152,20 +151,24 @@ def test_SRIOV_Sanity_Performance(dut, trafficgen, settings, testdata):  # noqa:
     outs, errs = execute_and_assert(trafficgen, trafficgen_cmd, 0)
     testdata.trafficgen_id = outs[0][0]
 
-    client_cmd = (
-        f"{settings.config['container_manager']} run --rm --privileged "
-        f"{settings.config['trafficgen_img']} client status "
-        f"--server-addr {settings.config['trafficgen']['host']} "
-        f"--server-port {settings.config['trafficgen_port']}"
+    # the client commands run by exec in a helper container of the image,
+    # instead of a new container each
+    containers = CONTAINERS.get(trafficgen, settings)
+    trafficgen_img = settings.config["trafficgen_img"]
+    client_cmd = containers.command(
+        trafficgen_img,
+        f"client status --server-addr {settings.config['trafficgen']['host']} "
+        f"--server-port {settings.config['trafficgen_port']}",
     )
     assert execute_until_timeout(trafficgen, client_cmd, 60)
 
     # Warmup
     client_cmd = [
-        f"{settings.config['container_manager']} run --rm --privileged "
-        f"{settings.config['trafficgen_img']} client start "
-        f"--server-addr {settings.config['trafficgen']['host']} "
-        f"--server-port {settings.config['trafficgen_port']} --timeout 60"
+        containers.command(
+            trafficgen_img,
+            f"client start --server-addr {settings.config['trafficgen']['host']} "
+            f"--server-port {settings.config['trafficgen_port']} --timeout 60",
+        )
     ]
     execute_and_assert(
         trafficgen,
@@ -174,10 +177,11 @@ def test_SRIOV_Sanity_Performance(dut, trafficgen, settings, testdata):  # noqa:
         cmd_timeout=70,
     )
     client_cmd = [
-        f"{settings.config['container_manager']} run --rm --privileged "
-        f"{settings.config['trafficgen_img']} client stop "
-        f"--server-addr {settings.config['trafficgen']['host']} "
-        f"--server-port {settings.config['trafficgen_port']}"
+        containers.command(
+            trafficgen_img,
+            f"client stop --server-addr {settings.config['trafficgen']['host']} "
+            f"--server-port {settings.config['trafficgen_port']}",
+        )
     ]
     outs, errs = execute_and_assert(
         trafficgen,
@@ -185,20 +189,19 @@ def test_SRIOV_Sanity_Performance(dut, trafficgen, settings, testdata):  # noqa:
         0,
     )
 
-    # Actual test
-    client_cmd = [
-        f"{settings.config['container_manager']} run --rm --privileged "
-        f"{settings.config['trafficgen_img']} client auto "
-        f"--server-addr {settings.config['trafficgen']['host']} "
-        f"--server-port {settings.config['trafficgen_port']}"
-    ]
-    outs, errs = execute_and_assert(
-        trafficgen,
-        client_cmd,
-        0,
-        cmd_timeout=60 * settings.config["trafficgen_timeout"],
+    # Actual test, the output is streamed to follow the trafficgen progress
+    client_cmd = containers.command(
+        trafficgen_img,
+        f"client auto --server-addr {settings.config['trafficgen']['host']} "
+        f"--server-port {settings.config['trafficgen_port']}",
+    )
+    trafficgen.log_str(client_cmd)
+    stream = trafficgen.execute_stream(
+        client_cmd, 60 * settings.config["trafficgen_timeout"]
     )
-    results = json.loads(outs[0][0])
+    results = read_trafficgen_result(stream)
+    assert stream.exit_status == 0, f"{list(stream.tail)} {stream.err}"
+    assert results is not None, list(stream.tail)
     if settings.config["log_performance"]:
         print(json.dumps(results))
     if settings.config["log_performance_elastic"]:
@@ -1,4 +1,4 @@
-from sriov.common.utils import create_vfs, execute_and_assert
+from sriov.common.utils import create_vfs, execute_and_assert, get_vf_mac
 
 
 def test_SR_IOV_TrustMode(dut, settings):
@@ -26,9 +26,7 @@ def test_SR_IOV_TrustMode(dut, settings):
     execute_and_assert(dut, steps, 0, 0.1)
 
     # check if vf 0 mac address is equal to mac_2
-    cmd = ["ip link show {}".format(pf) + " | awk '/vf 0/{print $4;}'"]
-    outs, errs = execute_and_assert(dut, cmd, 0)
-    vf_mac = outs[0][0].strip("\n")
+    vf_mac = get_vf_mac(dut, pf, 0)
     print(vf_mac)
     assert vf_mac == mac_2
 
@@ -44,8 +42,6 @@ def test_SR_IOV_TrustMode(dut, settings):
         print(err[0].strip("\n"))
 
     # check if vf 0 mac address is NOT equal to mac_3
-    cmd = ["ip link show {}".format(pf) + " | awk '/vf 0/{print $4;}'"]
-    outs, errs = execute_and_assert(dut, cmd, 0)
-    vf_mac = outs[0][0].strip("\n")
+    vf_mac = get_vf_mac(dut, pf, 0)
     print(vf_mac)
     assert vf_mac != mac_3
@@ -1,5 +1,11 @@
 import logging
+import threading
 import time
+import uuid
+from sriov.common.telemetry import TelemetryClient
+from sriov.common.testpmd import TestPmdSession
+from sriov.common.utils import bind_driver, create_vfs
+from sriov.tests.conftest import get_ssh_obj
 
 
 LOGGER = logging.getLogger(__name__)
@@ -14,6 +20,18 @@ def test_timeout_handler(dut):
         assert "timeout" in str(e)
 
 
+def test_ssh_pool_reuse(dut):
+    assert get_ssh_obj("dut") is dut
+    # a dead shell is reconnected in place
+    reconnects = dut.reconnect_count
+    dut.channel.close()
+    assert get_ssh_obj("dut") is dut
+    assert dut.reconnect_count == reconnects + 1
+    code, out, err = dut.execute("echo ALIVE")
+    assert code == 0, err
+    assert "ALIVE" in "".join(out)
+
+
 def test_execute_cmd_success(dut):
     cmd = "cat /proc/1/status"
     dut.log_str(cmd)
@@ -39,6 +57,61 @@ def test_execute_cmd_timeout(dut):
     assert code != 0 and "timeout" in err[0]
 
 
+def test_execute_cmd_subsecond_timeout(dut):
+    cmd = "sleep 1s"
+    dut.log_str(cmd)
+    start = time.monotonic()
+    code, out, err = dut.execute(cmd, 0.5)
+    assert time.monotonic() - start < 1
+    # Allow for original sleep to end before cleanup
+    time.sleep(1)
+    assert code != 0 and "timeout" in err[0]
+
+
+def test_execute_cmd_in_threads(dut, trafficgen):
+    results = {}
+
+    def run(ssh_obj):
+        results[ssh_obj.name] = ssh_obj.execute("sleep 2s; echo DONE")
+
+    threads = [threading.Thread(target=run, args=(obj,)) for obj in (dut, trafficgen)]
+    start = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # both commands ran at the same time
+    assert time.monotonic() - start < 4
+    for code, out, err in results.values():
+        assert code == 0, err
+        assert out[-1].strip("\n") == "DONE"
+
+
+def test_subshell(dut):
+    subshell = dut.open_subshell()
+    try:
+        assert subshell.ssh.get_transport() is dut.ssh.get_transport()
+        results = {}
+
+        def run(ssh_obj):
+            results[ssh_obj.name] = ssh_obj.execute("sleep 2s; echo DONE")
+
+        threads = [threading.Thread(target=run, args=(obj,)) for obj in (dut, subshell)]
+        start = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # both commands ran at the same time on the same connection
+        assert time.monotonic() - start < 4
+        for code, out, err in results.values():
+            assert code == 0, err
+            assert out[-1].strip("\n") == "DONE"
+    finally:
+        subshell.close()
+    assert subshell not in dut.subshells
+
+
 def test_execute_cmd_with_delay(dut):
     cmd = "sleep 1s"
     dut.log_str(cmd)
@@ -83,3 +156,177 @@ def test_start_and_stop_testpmd(dut, settings):
     assert code == 0, err
     print(out)
     assert out[0].strip("\n") == "ALIVE", out
+
+
+def start_testpmd_on_vf(dut, settings, container_name):
+    """Create the VF of pf1, bind it to vfio-pci, and start testpmd on it in
+       the interactive shell of dut, in a container named container_name
+    """
+    pf = settings.config["dut"]["interface"]["pf1"]["name"]
+    vf_pci = settings.config["dut"]["interface"]["vf1"]["pci"]
+    assert create_vfs(dut, pf, 1)
+    assert bind_driver(dut, vf_pci, "vfio-pci")
+    testpmd_container_cmd = (
+        f"{settings.config['container_manager']} run -it --name {container_name} "
+        f"--rm --privileged {settings.config['container_volumes']} "
+        f"--cpuset-cpus {settings.config['dut']['pmd_cpus']} "
+        f"{settings.config['dpdk_img']} dpdk-testpmd -l "
+        f"{settings.config['dut']['pmd_cpus']} -n 4 -a {vf_pci} -- --nb-cores=2 -i"
+    )
+    code, out, err = dut.start_testpmd(testpmd_container_cmd)
+    assert code == 0, err
+    assert dut.testpmd_active()
+
+
+def test_testpmd_session_stats(dut, settings):
+    start_testpmd_on_vf(dut, settings, f"sriov_exec_{uuid.uuid4().hex[:8]}")
+    session = TestPmdSession(dut)
+    stats = session.port_stats(0)
+    assert stats[0].rx_packets is not None and stats[0].tx_bytes is not None
+    assert dut.stop_testpmd() == 0
+
+
+def test_telemetry_sampler(dut, settings):
+    container_name = f"sriov_exec_{uuid.uuid4().hex[:8]}"
+    start_testpmd_on_vf(dut, settings, container_name)
+    client = TelemetryClient(
+        dut, container_name, container_manager=settings.config["container_manager"]
+    )
+    series = client.sample(2, 0.5)
+    assert series.ports == [0] and len(series) == 2
+    assert series.rates(0)[0].rx_pps is not None
+    assert dut.stop_testpmd() == 0
+
+
+def test_execute_channel_success(dut):
+    cmd = "cat /proc/1/status; echo STDERR >&2"
+    dut.log_str(cmd)
+    code, out, err = dut.execute_channel(cmd)
+    assert code == 0
+    assert "systemd" in out[0]
+    assert err == ["STDERR\n"]
+
+
+def test_execute_channel_fail(dut):
+    cmd = "cat /proc/-1/status"
+    dut.log_str(cmd)
+    code, out, err = dut.execute_channel(cmd)
+    assert code == 1
+    assert out == []
+    assert "No such file or directory" in err[0]
+
+
+def test_execute_channel_timeout(dut):
+    cmd = "sleep 6s"
+    dut.log_str(cmd)
+    code, out, err = dut.execute_channel(cmd)
+    assert code != 0 and "timeout" in err[0]
+
+
+def test_execute_channel_pipefail(dut):
+    # set_pipefail is applied by the dut fixture and must carry over
+    cmd = "false | true"
+    dut.log_str(cmd)
+    code, out, err = dut.execute_channel(cmd)
+    assert code != 0
+
+
+def test_execute_channel_latency(dut):
+    cmd = "cat /proc/version /etc/os-release"
+    iterations = 20
+    expected = None
+    for mode, execute in (
+        ("shell", dut.execute_shell),
+        ("exec channel", dut.execute_channel),
+    ):
+        start = time.monotonic()
+        for i in range(iterations):
+            code, out, err = execute(cmd)
+            assert code == 0, err
+            if expected is None:
+                expected = out
+            # every run of both modes returns the same lines
+            assert out == expected, f"{mode}: {out}"
+        latency = (time.monotonic() - start) / iterations
+        LOGGER.info(f"{mode}: {latency * 1000:.2f} ms per command")
+
+
+def test_execute_batch(dut):
+    cmds = ["echo A; echo B", "cat /proc/-1/status", "echo C"]
+    results = dut.execute_batch(cmds)
+    assert len(results) == 3
+    assert results[0] == (0, ["A\n", "B\n"], [])
+    assert results[1][0] != 0
+    assert "No such file or directory" in results[1][2][0]
+    assert results[2] == (0, ["C\n"], [])
+
+
+def test_execute_batch_stop_on_error(dut):
+    cmds = ["echo A", "cat /proc/-1/status", "echo C"]
+    results = dut.execute_batch(cmds, stop_on_error=True)
+    assert len(results) == 2
+    assert results[1][0] != 0
+
+
+def test_execute_batch_timeout(dut):
+    results = dut.execute_batch(["echo A", "sleep 3s", "echo C"], 1)
+    assert results[0] == (0, ["A\n"], [])
+    assert results[1][0] != 0 and "timeout" in results[1][2][-1]
+    # the shell is usable right after the timed out batch
+    code, out, err = dut.execute("echo ALIVE")
+    assert code == 0, err
+    assert out[0].strip("\n") == "ALIVE", out
+
+
+def test_submit_flush(dut):
+    futures = [dut.submit(cmd) for cmd in ["echo A", "cat /proc/-1/status", "echo C"]]
+    assert not any(future.done() for future in futures)
+    assert dut.flush(stop_on_error=True) == futures
+    assert futures[0].result() == (0, ["A\n"], [])
+    assert futures[1].result()[0] != 0
+    # the command after the failure was not run
+    assert futures[2].cancelled()
+    assert dut.flush() == []
+
+
+def test_flush_delay(dut):
+    done = []
+    for cmd in ["echo A", "echo B", "echo C"]:
+        dut.submit(cmd).add_done_callback(lambda _: done.append(time.monotonic()))
+    start = time.monotonic()
+    futures = dut.flush(delay=0.5)
+    assert [future.result()[1] for future in futures] == [["A\n"], ["B\n"], ["C\n"]]
+    # the host sleeps between the commands
+    assert time.monotonic() - start >= 1
+    if not dut.use_exec_channel:
+        # each future resolved when its command finished
+        assert done[1] - done[0] >= 0.4
+
+
+def test_execute_stream(dut):
+    cmd = "for i in 1 2 3; do echo LINE$i; sleep 0.5; done"
+    dut.log_str(cmd)
+    stream = dut.execute_stream(cmd, tail_lines=2)
+    start = time.monotonic()
+    arrivals = []
+    for line in stream:
+        arrivals.append((line, time.monotonic() - start))
+    assert [line for line, _ in arrivals] == ["LINE1\n", "LINE2\n", "LINE3\n"]
+    # the first line arrived before the command finished
+    assert arrivals[0][1] < 0.5
+    assert stream.exit_status == 0
+    assert list(stream.tail) == ["LINE2\n", "LINE3\n"]
+
+
+def test_execute_stream_cancel(dut):
+    stream = dut.execute_stream("seq 1 10000000", 30)
+    count = 0
+    for line in stream:
+        count += 1
+        if count == 10:
+            stream.cancel()
+    assert count == 10
+    assert stream.exit_status != 0
+    code, out, err = dut.execute("echo ALIVE")
+    assert code == 0, err
+    assert out[0].strip("\n") == "ALIVE", out
@@ -1,4 +1,5 @@
 import re
+from sriov.common.topology import TopologyCache
 from sriov.common.utils import (
     get_driver,
     bind_driver,
@@ -39,6 +40,21 @@ def test_get_pci_address(dut, settings):
     assert re.match(r'^\w{4}:\w{2}:\w{2}', vf_pci)
 
 
+def test_topology(dut, settings):
+    pf_name = settings.config["dut"]["interface"]["pf1"]["name"]
+    cache = TopologyCache(None)
+    pf = cache.get(dut, [pf_name]).interfaces[pf_name]
+    assert pf.pci == get_pci_address(dut, pf_name)
+    assert pf.total_vfs > 0
+
+    # the computed VF address is the address of the created VF, the offset
+    # and stride are read while the PF has VFs
+    assert create_vfs(dut, pf_name, 2)
+    pf = cache.refresh(dut, [pf_name]).interfaces[pf_name]
+    for vf in range(2):
+        assert pf.vf_pci(vf) == get_pci_address(dut, f"{pf_name}v{vf}")
+
+
 def test_get_driver(dut, settings):
     pf_name = settings.config["dut"]["interface"]["pf1"]["name"]
     assert get_driver(dut, pf_name) == "ice"
@@ -1,25 +1,37 @@
 from elasticsearch import Elasticsearch
+import functools
 import git
 import os
+from py.xml import raw
 import pytest
 from pytest_html import extras
+from sriov.common.cassette import CassettePlayer, CassetteRecorder, ReplayShellHandler
 from sriov.common.config import Config
 from sriov.common.configtestdata import ConfigTestData
-from sriov.common.exec import ShellHandler
+from sriov.common.containers import CONTAINERS
+from sriov.common.exec import ShellHandler, ShellHandlerPool
+from sriov.common.timing import TIMING
+from sriov.common.topology import DEFAULT_CACHE_PATH, TOPOLOGY, HostTopology
 from sriov.common.utils import (
     cleanup_after_ping,
     reset_mtu,
     set_pipefail,
-    stop_testpmd_in_tmux,
+    stop_testpmd_in_tmux_prefix,
     cleanup_after_ping_ipv6,
     get_pci_address,
     get_intf_mac,
     create_vfs,
     destroy_vfs,
-    bind_driver,
+    bind_drivers,
     execute_and_assert,
-    get_driver_pci,
+    run_in_parallel,
+    set_numvfs,
 )
+import time
+
+
+# ssh sessions are shared by all the tests of a session
+ssh_pool = ShellHandlerPool()
 
 
 class elastic:
@@ -45,7 +57,7 @@ def get_ssh_obj(name: str) -> ShellHandler:
         password = None
     retObj = None
     try:
-        retObj = ShellHandler(host, user, password, name)
+        retObj = ssh_pool.get(host, user, password, name)
     except Exception:
         # error caught and printed in ShellHandler
         pass
@@ -57,40 +69,58 @@ def get_testdata_obj(settings: Config) -> ConfigTestData:
     return ConfigTestData(settings)
 
 
+def set_topology(interface: dict, topology: HostTopology) -> None:
+    """Set the PCI address, driver, NUMA node and NIC model of a PF of the
+       settings from the topology of its host
+
+    Args:
+        interface (dict):        settings of the PF, with its "name"
+        topology (HostTopology): topology of the host
+    """
+    pf = topology.interfaces[interface["name"]]
+    interface["pci"] = pf.pci
+    interface["driver"] = pf.driver
+    interface["numa_node"] = pf.numa_node
+    interface["model"] = pf.model
+
+
 @pytest.fixture
 def settings(dut, trafficgen) -> Config:
     settings = get_settings_obj()
-    pf1_name = settings.config["dut"]["interface"]["pf1"]["name"]
-    settings.config["dut"]["interface"]["pf1"]["pci"] = get_pci_address(dut, pf1_name)
-    settings.config["dut"]["interface"]["pf1"]["driver"] = get_driver_pci(
-        dut, settings.config["dut"]["interface"]["pf1"]["pci"]
-    )
-    settings.config["dut"]["interface"]["pf2"]["pci"] = get_pci_address(
-        dut, settings.config["dut"]["interface"]["pf2"]["name"]
-    )
-    settings.config["dut"]["interface"]["pf2"]["driver"] = get_driver_pci(
-        dut, settings.config["dut"]["interface"]["pf2"]["pci"]
-    )
-    settings.config["trafficgen"]["interface"]["pf1"]["pci"] = get_pci_address(
-        trafficgen, settings.config["trafficgen"]["interface"]["pf1"]["name"]
-    )
-    settings.config["trafficgen"]["interface"]["pf1"]["driver"] = get_driver_pci(
-        trafficgen, settings.config["trafficgen"]["interface"]["pf1"]["pci"]
-    )
-    settings.config["trafficgen"]["interface"]["pf2"]["pci"] = get_pci_address(
-        trafficgen, settings.config["trafficgen"]["interface"]["pf2"]["name"]
-    )
-    settings.config["trafficgen"]["interface"]["pf2"]["driver"] = get_driver_pci(
-        trafficgen, settings.config["trafficgen"]["interface"]["pf2"]["pci"]
-    )
-    create_vfs(dut, pf1_name, 1)
-    vf1_name = settings.config["dut"]["interface"]["vf1"]["name"]
-    settings.config["dut"]["interface"]["vf1"]["pci"] = get_pci_address(dut, vf1_name)
-    trafficgen_pf = settings.config["trafficgen"]["interface"]["pf1"]["name"]
-    settings.config["trafficgen"]["interface"]["pf1"]["mac"] = get_intf_mac(
-        trafficgen, trafficgen_pf
-    )
-    destroy_vfs(dut, pf1_name)
+    dut_interfaces = settings.config["dut"]["interface"]
+    trafficgen_interfaces = settings.config["trafficgen"]["interface"]
+
+    # the discovery on the DUT and on the trafficgen are independent, and
+    # the topology of the PFs is read once per boot of the host
+    def discover_dut() -> None:
+        topology = TOPOLOGY.get(
+            dut, [dut_interfaces[pf]["name"] for pf in ("pf1", "pf2")]
+        )
+        for pf in ("pf1", "pf2"):
+            set_topology(dut_interfaces[pf], topology)
+        pf1 = topology.interfaces[dut_interfaces["pf1"]["name"]]
+        dut_interfaces["vf1"]["pci"] = pf1.vf_pci(0)
+        if dut_interfaces["vf1"]["pci"] is None:
+            # the VF offset and stride are only known while the PF has VFs: the
+            # VF is created to find its address, and to cache them for this boot
+            create_vfs(dut, pf1.name, 1)
+            dut_interfaces["vf1"]["pci"] = get_pci_address(
+                dut, dut_interfaces["vf1"]["name"]
+            )
+            TOPOLOGY.refresh(dut, [pf1.name])
+            destroy_vfs(dut, pf1.name)
+
+    def discover_trafficgen() -> None:
+        topology = TOPOLOGY.get(
+            trafficgen, [trafficgen_interfaces[pf]["name"] for pf in ("pf1", "pf2")]
+        )
+        for pf in ("pf1", "pf2"):
+            set_topology(trafficgen_interfaces[pf], topology)
+        trafficgen_interfaces["pf1"]["mac"] = get_intf_mac(
+            trafficgen, trafficgen_interfaces["pf1"]["name"]
+        )
+
+    run_in_parallel(discover_dut, discover_trafficgen)
     return settings
 
 
@@ -115,10 +145,8 @@ def reset_command(dut: ShellHandler, testdata) -> None:
     dut.log_str(cmd_ns1)
     dut.execute(cmd_ns1)
 
-    for pf in testdata.pf_net_paths:
-        clear_vfs = "echo 0 > " + testdata.pf_net_paths[pf] + "/sriov_numvfs"
-        dut.log_str(clear_vfs)
-        dut.execute(clear_vfs, 60)
+    # one command clears the VFs of every PF and waits for their removal
+    set_numvfs(dut, [(testdata.pfs[pf]["name"], 0) for pf in testdata.pfs])
 
 
 @pytest.fixture
@@ -161,39 +189,48 @@ def _cleanup(
         pass
 
     dut.stop_testpmd()
+    # the shells are probed once per test, not on every get_ssh_obj()
+    ssh_pool.check_health()
     assert cleanup_after_ping(trafficgen, dut, testdata)
     cleanup_after_ping_ipv6(trafficgen, dut, testdata)
     assert reset_mtu(trafficgen, dut, testdata)
 
     # DU commands need to run after the stop_testpmd and cleanup above
-    for i in range(settings.config["randomly_terminate_max_vfs"]):
-        stop_testpmd_in_tmux(dut, testdata.tmux_session_name + str(i))
-
-    # Clean up SR_IOV_Performance(delete containers and bind to kernel driver)
-    if testdata.testpmd_id:
-        kill_testpmd = [
-            f"{settings.config['container_manager']} kill {testdata.testpmd_id}"
-        ]
-        execute_and_assert(dut, kill_testpmd, 0)
-    if testdata.trafficgen_id:
-        kill_trafficgen = [
-            f"{settings.config['container_manager']} kill {testdata.trafficgen_id}"
-        ]
-        execute_and_assert(trafficgen, kill_trafficgen, 0)
-
-    trafficgen_pfs_pci = {}
-    if "pf1" in settings.config["trafficgen"]["interface"]:
-        trafficgen_pfs_pci[
-            settings.config["trafficgen"]["interface"]["pf1"]["pci"]
-        ] = settings.config["trafficgen"]["interface"]["pf1"]["driver"]
-    if "pf2" in settings.config["trafficgen"]["interface"]:
-        trafficgen_pfs_pci[
-            settings.config["trafficgen"]["interface"]["pf2"]["pci"]
-        ] = settings.config["trafficgen"]["interface"]["pf2"]["driver"]
-    for pf in trafficgen_pfs_pci:
-        assert bind_driver(trafficgen, pf, trafficgen_pfs_pci[pf])
-
-    reset_command(dut, testdata)
+    def cleanup_dut() -> None:
+        # the sessions of RandomlyTerminate left by a failed test, if any
+        stop_testpmd_in_tmux_prefix(dut, testdata.tmux_session_name)
+
+        # Clean up SR_IOV_Performance(delete containers)
+        if testdata.testpmd_id:
+            kill_testpmd = [
+                f"{settings.config['container_manager']} kill {testdata.testpmd_id}"
+            ]
+            execute_and_assert(dut, kill_testpmd, 0)
+
+        reset_command(dut, testdata)
+
+    def cleanup_trafficgen() -> None:
+        # Clean up SR_IOV_Performance(delete containers and bind to kernel driver)
+        if testdata.trafficgen_id:
+            kill_trafficgen = [
+                f"{settings.config['container_manager']} kill {testdata.trafficgen_id}"
+            ]
+            execute_and_assert(trafficgen, kill_trafficgen, 0)
+
+        trafficgen_pfs_pci = {}
+        if "pf1" in settings.config["trafficgen"]["interface"]:
+            trafficgen_pfs_pci[
+                settings.config["trafficgen"]["interface"]["pf1"]["pci"]
+            ] = settings.config["trafficgen"]["interface"]["pf1"]["driver"]
+        if "pf2" in settings.config["trafficgen"]["interface"]:
+            trafficgen_pfs_pci[
+                settings.config["trafficgen"]["interface"]["pf2"]["pci"]
+            ] = settings.config["trafficgen"]["interface"]["pf2"]["driver"]
+        if trafficgen_pfs_pci:
+            results = bind_drivers(trafficgen, list(trafficgen_pfs_pci.items()))
+            assert all(ok for ok, _ in results.values()), results
+
+    run_in_parallel(cleanup_dut, cleanup_trafficgen)
 
     if settings.config["log_performance_elastic"]:
         elastic_push(settings, testdata)
@@ -201,6 +238,23 @@ def _cleanup(
 
 def pytest_configure(config: Config) -> None:
     ShellHandler.debug_cmd_execute = config.getoption("--debug-execute")
+    ShellHandler.use_exec_channel = config.getoption("--exec-channel")
+    ShellHandler.use_agent = config.getoption("--agent")
+    if config.getoption("--replay-cassettes"):
+        ReplayShellHandler.player = CassettePlayer(
+            config.getoption("--replay-cassettes"),
+            float(config.getoption("--replay-speed")),
+        )
+        ssh_pool.factory = ReplayShellHandler
+    elif config.getoption("--record-cassettes"):
+        ShellHandler.cassette = CassetteRecorder(config.getoption("--record-cassettes"))
+    if config.getoption("--replay-cassettes") or not config.getoption(
+        "--topology-cache"
+    ):
+        # a replay answers the discovery from the cassettes only
+        TOPOLOGY.path = None
+    else:
+        TOPOLOGY.path = config.getoption("--topology-cache")
     dut = get_ssh_obj("dut")
     assert dut
     # Need to clear the terminal before the first command, there may be some
@@ -243,6 +297,86 @@ def pytest_configure(config: Config) -> None:
         iavf_driver = out[0].strip()
     config._metadata["IAVF Driver"] = iavf_driver
 
+    preflight_images(settings)
+
+
+def preflight_images(settings: Config) -> None:
+    """Check the container images once per session, pulling the missing ones
+       on the DUT and on the trafficgen at the same time
+
+    Args:
+        settings (Config): settings obj
+    """
+    host_images = {
+        "dut": [settings.config.get("dpdk_img"), settings.config.get("testpmd_img")],
+        "trafficgen": [settings.config.get("trafficgen_img")],
+    }
+
+    def preflight(name: str) -> None:
+        images = [image for image in host_images[name] if image]
+        ssh_obj = get_ssh_obj(name)
+        if not images or ssh_obj is None:
+            return
+        status = CONTAINERS.get(ssh_obj, settings).preflight(images)
+        for image, state in status.items():
+            ssh_obj.log_str(f"image {image}: {state}")
+
+    try:
+        run_in_parallel(*(functools.partial(preflight, name) for name in host_images))
+    except Exception as err:
+        # the images are pulled by the first container run otherwise
+        print(f"image preflight failed: {err}")
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_protocol(item, nextitem):
+    # tag the commands with the test, and time the test for the timing report
+    TIMING.current_test = item.nodeid
+    cassette = ShellHandler.cassette or ReplayShellHandler.player
+    if cassette is not None:
+        cassette.start_test(item.nodeid)
+    start = time.monotonic()
+    yield
+    TIMING.test_finished(item.nodeid, time.monotonic() - start)
+    TIMING.current_test = None
+    if cassette is not None:
+        cassette.finish_test()
+
+
+def pytest_html_results_summary(prefix, summary, postfix) -> None:
+    if TIMING.records:
+        prefix.append(raw(TIMING.html_summary()))
+
+
+def pytest_terminal_summary(terminalreporter, config) -> None:
+    timing_report = config.getoption("--timing-report")
+    if timing_report:
+        TIMING.write_json(timing_report)
+        for record in TIMING.report(10)["slowest"]:
+            terminalreporter.write_line(
+                f"{record['duration']:8.3f}s {record['name']}: {record['cmd']}"
+            )
+        terminalreporter.write_line(f"timing report written to {timing_report}")
+    for name, manager in CONTAINERS.managers.items():
+        if manager.saved_time():
+            terminalreporter.write_line(
+                f"{name}: helper containers saved about "
+                f"{manager.saved_time():.1f}s of container start time"
+            )
+    for handler in ssh_pool.handlers.values():
+        if handler.reconnect_count:
+            terminalreporter.write_line(
+                f"{handler.name}: {handler.reconnect_count} ssh reconnect(s), "
+                f"{handler.reconnect_time:.1f}s spent reconnecting"
+            )
+
+
+def pytest_unconfigure(config: Config) -> None:
+    CONTAINERS.close_all()
+    ssh_pool.close_all()
+    if ShellHandler.cassette is not None:
+        ShellHandler.cassette.close()
+
 
 def pytest_html_report_title(report) -> None:
     """modifying the title  of html report"""
@@ -348,6 +482,54 @@ def pytest_addoption(parser) -> None:
         default=False,
         help="Debug command execute",
     )
+    parser.addoption(
+        "--exec-channel",
+        action="store_true",
+        default=False,
+        help="Execute each command on its own ssh exec channel",
+    )
+    parser.addoption(
+        "--agent",
+        action="store_true",
+        default=False,
+        help="Run a helper agent on the DUT and trafficgen for the common helpers",
+    )
+    parser.addoption(
+        "--timing-report",
+        action="store",
+        default=None,
+        help="Write the timing of every command, per helper and per test to a "
+        "JSON file",
+    )
+    parser.addoption(
+        "--record-cassettes",
+        action="store",
+        default=None,
+        help="Record the commands and their responses to a cassette per test "
+        "in this directory",
+    )
+    parser.addoption(
+        "--replay-cassettes",
+        action="store",
+        default=None,
+        help="Answer the commands from the cassettes of this directory, without "
+        "connecting to the DUT and the trafficgen",
+    )
+    parser.addoption(
+        "--replay-speed",
+        action="store",
+        default="0",
+        help="Replay at the recorded timing divided by this factor, "
+        "0 to answer right away (default)",
+    )
+    parser.addoption(
+        "--topology-cache",
+        action="store",
+        default=DEFAULT_CACHE_PATH,
+        help="JSON file caching the PCI topology of the DUT and trafficgen PFs "
+        "until the next reboot of the host, empty to disable "
+        f"(default {DEFAULT_CACHE_PATH})",
+    )
 
 
 def pytest_generate_tests(metafunc) -> None: